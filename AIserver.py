@@ -1,16 +1,15 @@
 import os
-import joblib
 import math
+import time
+import threading
 import re                      # Keep re import
 from collections import Counter # Keep Counter import
-from flask import Flask, request, render_template, jsonify
-import numpy as np             # Keep numpy import
+from flask import Flask, request, render_template, jsonify, Response, stream_with_context
+import json
 from flask_cors import CORS
-import requests
-# DO NOT import json here if only used for Firebase env var method
-import firebase_admin
-from firebase_admin import credentials, firestore
 from datetime import datetime
+# Heavy dependencies are imported where they are first needed, so a cold start only pays for Flask:
+# joblib/numpy/sklearn by the model loader, requests by the expander, firebase_admin by the report writer
 
 # --- Import helper functions from utils.py ---
 # Ensure utils.py exists in your project root
@@ -26,135 +25,510 @@ except ImportError:
     entropy = lambda x: 0
     HIGH_RISK_TOKENS = []
 
+from admission import AdmissionController, Overloaded
+from cache import SingleFlight, VerdictCache
+from metrics import MetricsRegistry
+from report_store import BufferedReportWriter, FirestoreReportStore, SQLiteReportStore
+
 
 # --- 1. Initialize Flask App ---
 app = Flask(__name__, static_url_path='/static')
 
+# Per-stage timers, request/error counters and gauges, exposed at /metrics
+metrics = MetricsRegistry()
+metrics.describe('requests_total', "HTTP requests by route and status code.")
+metrics.describe('errors_total', "Handled errors by route and type.")
+metrics.describe('stage_duration_seconds', "Time spent in each stage of a request.")
+metrics.describe('request_duration_seconds', "Handler time per instrumented route.")
+metrics.describe('model_swaps_total', "Model versions hot-swapped in from MODEL_STORE_DIR.")
+metrics.describe('blocklist_hits_total', "Verdicts answered from the known-malicious Bloom filter, by match kind.")
+metrics.describe('allowlist_hits_total', "Verdicts answered from the trusted-domain allowlist without the model.")
+metrics.describe('requests_shed_total', "Requests turned away by admission control before any model work, by reason.")
+
+def record_error(route, kind):
+    metrics.inc('errors_total', (('route', route), ('type', kind)))
+
+@app.after_request
+def count_request(response):
+    metrics.inc('requests_total', (('route', request.endpoint or 'unknown'), ('status', str(response.status_code))))
+    return response
+
 # --- 2. Initialize Firebase Admin SDK (Render Secret File Method) ---
+# Done on first use (the first feedback report), not at import: firebase_admin + google.cloud.firestore
+# alone take longer to import than the rest of the app
 db = None # Initialize db globally
-try:
-    # Path to your service account key file (Render places it in the root)
-    # Check current working directory for debugging
-    print(f"Current working directory: {os.getcwd()}")
-    print(f"Looking for serviceAccountKey.json in {os.path.abspath('.')}")
-
-    cred_path = "serviceAccountKey.json"
-    if not os.path.exists(cred_path):
-         # Log a warning but don't crash, allow app to run without Firestore
-         print(f"Warning: serviceAccountKey.json not found at '{os.path.abspath(cred_path)}'. Ensure it was added as a Secret File on Render. Firestore features disabled.")
+_firebase_initialized = False
+_firebase_lock = threading.Lock()
+
+def init_firebase():
+    """ Initializes the Firebase Admin SDK once per process; returns the Firestore client, or None without credentials. """
+    global db, _firebase_initialized
+    with _firebase_lock:
+        if _firebase_initialized: return db
+        _firebase_initialized = True
+        try:
+            # Path to your service account key file (Render places it in the root)
+            # Check current working directory for debugging
+            print(f"Current working directory: {os.getcwd()}")
+            print(f"Looking for serviceAccountKey.json in {os.path.abspath('.')}")
+
+            cred_path = "serviceAccountKey.json"
+            if not os.path.exists(cred_path):
+                 # Log a warning but don't crash, allow app to run without Firestore
+                 print(f"Warning: serviceAccountKey.json not found at '{os.path.abspath(cred_path)}'. Ensure it was added as a Secret File on Render. Firestore features disabled.")
+            else:
+                print("serviceAccountKey.json found. Initializing Firebase...")
+                import firebase_admin
+                from firebase_admin import credentials, firestore
+                cred = credentials.Certificate(cred_path)
+                # Initialize only if not already done
+                if not firebase_admin._apps:
+                     firebase_admin.initialize_app(cred)
+                     print("Firebase Admin SDK initialized successfully via Secret File.")
+                else:
+                     firebase_admin.get_app()
+                     print("Firebase Admin SDK already initialized.")
+                db = firestore.client()
+
+        except Exception as e:
+            # Log the full error for better debugging
+            import traceback
+            print(f"Unexpected error initializing Firebase Admin SDK: {e}")
+            print(traceback.format_exc()) # Print stack trace
+            print("Firestore features disabled.")
+            db = None
+        return db
+
+# MODEL_PRELOAD=1 (set by gunicorn.conf.py): gunicorn imports this module once in the master and forks
+# the workers from it. The model is loaded synchronously so every worker shares the master's copy, and
+# the per-process background threads are left to start_worker_threads() (threads do not survive fork).
+MODEL_PRELOAD = os.environ.get('MODEL_PRELOAD') == '1'
+
+# Feedback reports are queued and written in batches by a background thread.
+# Without Firestore they go to a local SQLite file so /api/submit_report keeps working.
+REPORT_DB_PATH = os.environ.get('REPORT_DB_PATH', '/tmp/feedback_reports.sqlite3')
+report_store = None
+report_writer = None
+_report_writer_lock = threading.Lock()
+
+def start_report_writer():
+    """ Opens the report store and starts the writer thread for this process. """
+    global report_store, report_writer
+    if init_firebase(): report_store = FirestoreReportStore(db)
     else:
-        print("serviceAccountKey.json found. Initializing Firebase...")
-        cred = credentials.Certificate(cred_path)
-        # Initialize only if not already done
-        if not firebase_admin._apps:
-             firebase_admin.initialize_app(cred)
-             print("Firebase Admin SDK initialized successfully via Secret File.")
-        else:
-             firebase_admin.get_app()
-             print("Firebase Admin SDK already initialized.")
-        db = firestore.client()
-
-except Exception as e:
-    # Log the full error for better debugging
-    import traceback
-    print(f"Unexpected error initializing Firebase Admin SDK: {e}")
-    print(traceback.format_exc()) # Print stack trace
-    print("Firestore features disabled.")
-    db = None
+        print(f"Storing feedback reports locally in {REPORT_DB_PATH}.")
+        report_store = SQLiteReportStore(REPORT_DB_PATH) # one connection per process, never inherited
+    report_writer = BufferedReportWriter(
+        report_store,
+        max_queue=int(os.environ.get('REPORT_QUEUE_SIZE', 10000)),
+        batch_size=int(os.environ.get('REPORT_BATCH_SIZE', 100)),
+        flush_interval=float(os.environ.get('REPORT_FLUSH_INTERVAL', 2.0))
+    )
+
+def get_report_writer():
+    """ This process's report writer, started by the first feedback report (after fork under gunicorn). """
+    if report_writer is None:
+        with _report_writer_lock:
+            if report_writer is None: start_report_writer()
+    return report_writer
 
 # --- 3. Enable CORS ---
-CORS(app, resources={
-    r"/analyze": {"origins": "chrome-extension://*"},
+CORS_RESOURCES = { # asgi.py applies the same rules to the routes it serves natively
+    r"/analyze": {"origins": "chrome-extension://*", "expose_headers": ["Retry-After"]},
     r"/api/expand": {"origins": "*"},
+    r"/api/expand_batch": {"origins": "*"},
+    r"/api/expand_and_score": {"origins": "*"},
     r"/api/submit_report": {"origins": "*"}
-})
+}
+CORS(app, resources=CORS_RESOURCES)
+
 
+MODEL_URL = os.environ.get('MODEL_URL', "https://github.com/prajjwal14141/safelink-ai/releases/download/v1.0.0/model.pkl")
+VECTORIZER_URL = os.environ.get('VECTORIZER_URL', "https://github.com/prajjwal14141/safelink-ai/releases/download/v1.0.0/vectorizer.pkl")
 
-MODEL_URL = "https://github.com/prajjwal14141/safelink-ai/releases/download/v1.0.0/model.pkl" 
-VECTORIZER_URL = "https://github.com/prajjwal14141/safelink-ai/releases/download/v1.0.0/vectorizer.pkl" 
+MODEL_VERSION = os.environ.get('MODEL_VERSION', 'v1.0.0')
 
-MODEL_PATH = "/tmp/model.pkl"
-VECTORIZER_PATH = "/tmp/vectorizer.pkl"
+# Downloaded artifacts live in a content-addressed cache (artifact_store.py): verified against SHA-256 on
+# every start, downloaded by one process at a time, never re-downloaded while intact. Pin the expected
+# hashes with MODEL_SHA256 / VECTORIZER_SHA256; unpinned, the first complete download is recorded.
+ARTIFACT_CACHE_DIR = os.environ.get('ARTIFACT_CACHE_DIR', '/tmp/safelink-artifacts')
+MODEL_SHA256 = os.environ.get('MODEL_SHA256') or None
+VECTORIZER_SHA256 = os.environ.get('VECTORIZER_SHA256') or None
 
-vectorizer = None
-lgs = None
+# Optional pickle-free model exported by `python train.py --compact-dir DIR`; used instead of the pickles when set
+COMPACT_MODEL_DIR = os.environ.get('COMPACT_MODEL_DIR')
 
-def download_file(url, destination):
-    print(f"Downloading {os.path.basename(destination)} from {url}...")
+# Optional versioned model store written by retrain.py; when set, the live version is loaded from it
+# and the store is polled so new versions are swapped in without a restart
+MODEL_STORE_DIR = os.environ.get('MODEL_STORE_DIR')
+MODEL_POLL_INTERVAL = float(os.environ.get('MODEL_POLL_INTERVAL', 30)) # seconds
+
+class ServingModel:
+    """ One loaded model version. Never mutated: a swap replaces the active_model reference, so a
+    request that took a reference keeps scoring with the same vectorizer + model until it finishes.
+    scorer tokenizes each URL once for both the features and the threat report (None for hashing models). """
+
+    __slots__ = ('version', 'vectorizer', 'lgs', 'compact', 'scorer')
+
+    def __init__(self, version, vectorizer=None, lgs=None, compact=None):
+        self.version = version
+        self.vectorizer = vectorizer
+        self.lgs = lgs
+        self.compact = compact
+        from token_scoring import TokenScorer
+        self.scorer = TokenScorer.for_model(vectorizer, lgs, compact)
+
+active_model = None # the current ServingModel; read it once per request
+
+# Optional trusted-domain index built by `python allowlist.py trusted_domains.txt DIR`;
+# URLs on these domains get an allowlisted 'good' verdict without running the model
+ALLOWLIST_DIR = os.environ.get('ALLOWLIST_DIR')
+allowlist = None
+if ALLOWLIST_DIR:
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        if not url or not url.startswith(('http://', 'https://')): raise ValueError(f"Invalid download URL: {url}")
-        with requests.get(url, stream=True, timeout=90, headers=headers, allow_redirects=True) as r:
-            r.raise_for_status()
-            with open(destination, 'wb') as f:
-                downloaded_size = 0
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk: f.write(chunk); downloaded_size += len(chunk)
-        print(f"{os.path.basename(destination)} downloaded successfully ({downloaded_size / (1024*1024):.2f} MB).")
-        return True
-    except requests.exceptions.RequestException as e: print(f"Error downloading {os.path.basename(destination)}: {e}")
-    except ValueError as e: print(f"Error: {e}")
-    except Exception as e: print(f"Unexpected error during download of {os.path.basename(destination)}: {e}")
-    if os.path.exists(destination):
-        try: os.remove(destination);
-        except OSError: pass
-    return False
+        from allowlist import DomainAllowlist
+        allowlist = DomainAllowlist(ALLOWLIST_DIR)
+        print(f"Allowlist loaded from {ALLOWLIST_DIR}: {allowlist.meta['trusted']} trusted domains.")
+    except Exception as e:
+        print(f"Error loading allowlist from {ALLOWLIST_DIR}: {e}. Every URL will be scored by the model.")
+
+# Optional Bloom filter of the training corpus' bad URLs/hosts (`python train.py --blocklist-dir DIR`),
+# memory-mapped and checked after the allowlist; a hit is answered 'bad' without running the model
+BLOCKLIST_DIR = os.environ.get('BLOCKLIST_DIR')
+blocklist = None
+if BLOCKLIST_DIR:
+    try:
+        from bloom import Blocklist
+        blocklist = Blocklist(BLOCKLIST_DIR)
+        print(f"Blocklist loaded from {BLOCKLIST_DIR}: {blocklist.meta.get('urls', 0)} URLs, {blocklist.meta.get('hosts', 0)} hosts.")
+    except Exception as e:
+        print(f"Error loading blocklist from {BLOCKLIST_DIR}: {e}. Known-bad URLs will be scored by the model.")
+
+# Batch scoring limits (override via environment for gateway/proxy-log scanning)
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 1000))
+BATCH_CHUNK_SIZE = int(os.environ.get('BATCH_CHUNK_SIZE', 256))
+
+# Short-link expander: pooled session, per-host concurrency limit, TTL cache of resolved redirect chains.
+# Created (and requests imported) by the first expansion
+expander = None
+_expander_lock = threading.Lock()
+
+def get_expander():
+    """ The shared URLExpander, created on first use. """
+    global expander
+    if expander is None:
+        with _expander_lock:
+            if expander is None:
+                from expander import URLExpander
+                expander = URLExpander(
+                    timeout=float(os.environ.get('EXPAND_TIMEOUT', 7)),
+                    max_workers=int(os.environ.get('EXPAND_WORKERS', 16)),
+                    per_host_limit=int(os.environ.get('EXPAND_PER_HOST_LIMIT', 4)),
+                    cache_ttl=float(os.environ.get('EXPAND_CACHE_TTL', 3600))
+                )
+    return expander
+MAX_EXPAND_BATCH_SIZE = int(os.environ.get('MAX_EXPAND_BATCH_SIZE', 50))
+
+# Verdict cache keyed on (model version, clean_url(url)); cleared whenever the model is (re)loaded or swapped
+verdict_cache = VerdictCache(
+    max_size=int(os.environ.get('VERDICT_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('VERDICT_CACHE_TTL', 3600))
+)
+# Concurrent /analyze misses for the same (model version, clean_url(url)) share one model evaluation
+analyze_flight = SingleFlight()
+
+# Admission control for /analyze model work: ANALYZE_CONCURRENCY evaluations at once and ANALYZE_QUEUE_SIZE more
+# waiting; the rest, and requests that cannot be answered before their deadline, get 429/503 + Retry-After.
+# The deadline is the client's X-Deadline-Ms budget (else ANALYZE_DEFAULT_DEADLINE_MS; 0 = none), counted
+# from arrival. ANALYZE_CONCURRENCY=0 turns admission control off.
+ANALYZE_CONCURRENCY = int(os.environ.get('ANALYZE_CONCURRENCY', 4))
+ANALYZE_QUEUE_SIZE = int(os.environ.get('ANALYZE_QUEUE_SIZE', 64))
+ANALYZE_DEFAULT_DEADLINE_MS = float(os.environ.get('ANALYZE_DEFAULT_DEADLINE_MS', 0))
+DEADLINE_HEADER = 'X-Deadline-Ms'
+admission = AdmissionController(ANALYZE_CONCURRENCY, ANALYZE_QUEUE_SIZE) if ANALYZE_CONCURRENCY > 0 else None
 
 # --- Load or Download Logic ---
-try:
-    # Ensure /tmp exists (usually does on Render, but good check)
-    if not os.path.exists("/tmp"):
-        os.makedirs("/tmp")
-        print("Created /tmp directory.")
-
-    model_exists = os.path.exists(MODEL_PATH)
-    vectorizer_exists = os.path.exists(VECTORIZER_PATH)
-
-    # Download Vectorizer if missing
-    if not vectorizer_exists:
-        print(f"{VECTORIZER_PATH} not found.")
-        if not download_file(VECTORIZER_URL, VECTORIZER_PATH): raise RuntimeError(f"Failed to download vectorizer from {VECTORIZER_URL}")
-    print(f"Loading vectorizer from {VECTORIZER_PATH}...")
+# Background model loading state, reported by /readyz
+model_status = {'state': 'loading', 'version': MODEL_VERSION, 'timings': {}, 'error': None, 'loaded_at': None}
+MODEL_RETRY_AFTER = int(os.environ.get('MODEL_RETRY_AFTER', 5)) # seconds, sent as Retry-After while loading
+
+def _load_pickle(path, label):
+    """ joblib.load (arrays memory-mapped) with the start-up diagnostics. The artifact store has already
+    checked the file's SHA-256, so a failure here is an incompatible pickle, not a truncated download. """
+    from artifact_store import load_pickle
+    print(f"Loading {label} from {path}...")
     try:
-        # Explicitly load using joblib
-        vectorizer = joblib.load(VECTORIZER_PATH)
-        print("Vectorizer loaded via joblib.")
+        obj = load_pickle(path)
+        print(f"{label.capitalize()} loaded via joblib.")
+        return obj
     except Exception as load_err:
-        print(f"joblib.load failed for vectorizer: {load_err}")
-        # Add more debugging: check file size, try pickle directly?
-        if os.path.exists(VECTORIZER_PATH):
-             print(f"Vectorizer file size: {os.path.getsize(VECTORIZER_PATH)} bytes")
-        raise RuntimeError(f"Failed to load vectorizer from {VECTORIZER_PATH}: {load_err}")
-
-
-    # Download Model if missing
-    if not model_exists:
-        print(f"{MODEL_PATH} not found.")
-        if not download_file(MODEL_URL, MODEL_PATH): raise RuntimeError(f"Failed to download model from {MODEL_URL}")
-    print(f"Loading model from {MODEL_PATH}...")
+        print(f"joblib.load failed for {label}: {load_err}")
+        raise RuntimeError(f"Failed to load {label} from {path}: {load_err}")
+
+def install_models(new_vectorizer=None, new_lgs=None, new_compact=None, timings=None, version=None):
+    """ Makes a loaded model current (compact model, or sklearn vectorizer + model) and invalidates the verdict cache.
+
+    The swap is one reference assignment: requests already running finish on the model they started with.
+    """
+    global active_model
+    version = version or MODEL_VERSION
+    if new_compact is not None: active_model = ServingModel(version, compact=new_compact)
+    else: active_model = ServingModel(version, new_vectorizer, new_lgs)
+    verdict_cache.clear()
+    model_status.update(state='ready', version=version, timings=timings or {}, error=None, loaded_at=datetime.now().isoformat())
+
+def load_models():
+    """ Fetches verified artifacts (downloading only what is missing), loads them, then invalidates the verdict cache. """
+    model_status.update(state='loading', error=None)
+    timings = {}
+    new_vectorizer = new_lgs = new_compact = None
+    version = None
+    started = time.perf_counter()
     try:
-        lgs = joblib.load(MODEL_PATH)
-        print("Model loaded via joblib.")
-    except Exception as load_err:
-        print(f"joblib.load failed for model: {load_err}")
-        if os.path.exists(MODEL_PATH):
-             print(f"Model file size: {os.path.getsize(MODEL_PATH)} bytes")
-             if os.path.exists(MODEL_PATH): 
-                try: os.remove(MODEL_PATH); 
-                except OSError: pass # Clean up corrupted?
-        raise RuntimeError(f"Failed to load model from {MODEL_PATH}: {load_err}")
-
-    if vectorizer and lgs: print("Model and vectorizer ready.")
-    else: raise RuntimeError("Model or vectorizer failed to load.")
-
-except RuntimeError as e: print(f"FATAL ERROR during model setup: {e}"); vectorizer = None; lgs = None
-except Exception as e: print(f"FATAL ERROR during model setup (general exception): {e}"); vectorizer = None; lgs = None
-
+        import model_store
+        from compact import CompactModel
+        store_version = model_store.current_version(MODEL_STORE_DIR) if MODEL_STORE_DIR else None
+        if store_version:
+            print(f"Loading model version {store_version} from {MODEL_STORE_DIR}...")
+            new_vectorizer, new_lgs, _ = model_store.load_version(MODEL_STORE_DIR, store_version, mmap_mode='r')
+            version = store_version
+            timings['store_load_s'] = round(time.perf_counter() - started, 4)
+            print("Model and vectorizer ready.")
+        elif COMPACT_MODEL_DIR:
+            print(f"Loading compact model from {COMPACT_MODEL_DIR}...")
+            new_compact = CompactModel(COMPACT_MODEL_DIR)
+            timings['compact_load_s'] = round(time.perf_counter() - started, 4)
+            print(f"Compact model ready ({new_compact.n_features} features).")
+        else:
+            from artifact_store import ArtifactStore
+            step = time.perf_counter()
+            store = ArtifactStore(ARTIFACT_CACHE_DIR)
+            paths = store.fetch(MODEL_VERSION, {'vectorizer.pkl': (VECTORIZER_URL, VECTORIZER_SHA256),
+                                                'model.pkl': (MODEL_URL, MODEL_SHA256)})
+            timings['fetch_s'] = round(time.perf_counter() - step, 4)
+            timings['downloaded'] = store.stats['downloaded']
+
+            step = time.perf_counter()
+            new_vectorizer = _load_pickle(paths['vectorizer.pkl'], 'vectorizer')
+            timings['vectorizer_load_s'] = round(time.perf_counter() - step, 4)
+            step = time.perf_counter()
+            new_lgs = _load_pickle(paths['model.pkl'], 'model')
+            timings['model_load_s'] = round(time.perf_counter() - step, 4)
+            print("Model and vectorizer ready.")
+
+        timings['total_s'] = round(time.perf_counter() - started, 4)
+        install_models(new_vectorizer, new_lgs, new_compact, timings, version)
+        return True
+    except Exception as e:
+        print(f"FATAL ERROR during model setup: {e}")
+        model_status.update(state='failed', timings=timings, error=str(e))
+        return False
+
+def start_model_loading():
+    """ Loads the model in a daemon thread so static pages are served while it downloads. """
+    loader = threading.Thread(target=load_models, name='model-loader', daemon=True)
+    loader.start()
+    return loader
+
+def watch_model_store():
+    """ Polls MODEL_STORE_DIR and hot-swaps to a newly published version; a failed load keeps the current model. """
+    import model_store
+    while True:
+        time.sleep(MODEL_POLL_INTERVAL)
+        try:
+            version = model_store.current_version(MODEL_STORE_DIR)
+            current = active_model
+            if not version or (current is not None and current.version == version): continue
+            started = time.perf_counter()
+            new_vectorizer, new_lgs, manifest = model_store.load_version(MODEL_STORE_DIR, version, mmap_mode='r')
+            install_models(new_vectorizer, new_lgs, timings={'store_load_s': round(time.perf_counter() - started, 4)}, version=version)
+            metrics.inc('model_swaps_total')
+            print(f"Swapped to model version {version} (parent {manifest.get('parent')}, {manifest.get('reports_used')} reports).")
+        except Exception as e:
+            record_error('model_store', type(e).__name__)
+            print(f"Error loading a new model version from {MODEL_STORE_DIR}: {e}. Keeping the current model.")
+
+def model_ready():
+    """ True once either the compact model or the sklearn vectorizer + model are loaded. """
+    return active_model is not None
+
+def score_urls(urls_clean, timer=None, model=None):
+    """ Predicts a label per cleaned URL with one vectorize + predict call for the whole list. """
+    model = model or active_model
+    if model.compact is not None:
+        y_Predict = model.compact.predict(urls_clean)
+        if timer: timer.mark('predict')
+        return y_Predict
+    X_predict_vec = model.vectorizer.transform(urls_clean)
+    if timer: timer.mark('transform')
+    y_Predict = model.lgs.predict(X_predict_vec)
+    if timer: timer.mark('predict')
+    return y_Predict
+
+def score_tokenized(url_clean, model, timer=None):
+    """ (prediction, tokens, contributions) for one URL; falls back to score_urls when the model has no scorer. """
+    if model.scorer is None:
+        y_Predict = score_urls([url_clean], timer, model)
+        return (str(y_Predict[0]) if len(y_Predict) else 'error'), None, None
+    tokens = model.scorer.tokenize(url_clean)
+    if timer: timer.mark('tokenize')
+    prediction, contributions = model.scorer.score(tokens)
+    if timer: timer.mark('predict')
+    return prediction, tokens, contributions
+
+def model_unavailable():
+    """ 503 response for scoring routes: fast, with Retry-After while the model is still loading.
+    (body, status, headers) with a plain dict body, so the ASGI mode can serve it too. """
+    if model_status['state'] == 'loading':
+        return {'error': 'AI model is still loading. Please retry shortly.'}, 503, {'Retry-After': str(MODEL_RETRY_AFTER)}
+    return {'error': 'AI model is not ready. Please check server start-up logs.'}, 503, {} # Service Unavailable
+
+def request_deadline():
+    """ time.monotonic() deadline of the current request from its X-Deadline-Ms budget, or None without one.
+    The budget counts from arrival: the ASGI mode stamps 'safelink.received_at' before queueing for a thread. """
+    budget = request.headers.get(DEADLINE_HEADER)
+    try:
+        budget_ms = float(budget) if budget else ANALYZE_DEFAULT_DEADLINE_MS
+    except ValueError:
+        budget_ms = ANALYZE_DEFAULT_DEADLINE_MS
+    if not budget_ms > 0: return None
+    return request.environ.get('safelink.received_at', time.monotonic()) + budget_ms / 1000.0
+
+def shed_response(route, shed):
+    """ 429/503 response with Retry-After for a request turned away by admission control.
+    (body, status, headers) with a plain dict body, like model_unavailable(). """
+    metrics.inc('requests_shed_total', (('route', route), ('reason', shed.reason)))
+    return ({'error': 'Server is too busy to answer in time. Please retry later.', 'reason': shed.reason},
+            shed.status, {'Retry-After': str(shed.retry_after)})
+
+def start_worker_threads():
+    """ Starts the per-process background threads: with MODEL_STORE_DIR, the version watcher.
+    (The report writer starts with the first feedback report, see get_report_writer.)
+
+    Called at import, or from gunicorn's post_fork hook in every worker when MODEL_PRELOAD is set.
+    """
+    if MODEL_STORE_DIR and os.environ.get('MODEL_AUTOLOAD', '1') != '0':
+        threading.Thread(target=watch_model_store, name='model-store-watcher', daemon=True).start()
+
+# MODEL_LOAD_SYNC=1 (or MODEL_PRELOAD=1) blocks import until the model is loaded (scripts, preloading servers);
+# MODEL_AUTOLOAD=0 skips loading so a caller can install_models() itself (benchmarks, fixtures)
+if os.environ.get('MODEL_AUTOLOAD', '1') == '0': pass
+elif MODEL_PRELOAD or os.environ.get('MODEL_LOAD_SYNC') == '1': load_models()
+else: start_model_loading()
+if not MODEL_PRELOAD: start_worker_threads()
 
 # --- 7. Define App Routes ---
 # (Keep all your @app.route definitions for /, /analyze, /how-it-works, etc. below this)
 # Make sure they correctly use the imported functions like getTokens, clean_url
 
+TOP_TOKENS = 3 # model-contribution tokens cited per verdict
+
+def build_verdict(url_raw, url_clean, ai_prediction, timer=None, tokens=None, contributions=None):
+    """ Builds the /analyze response body (entropy + threat report) for one scored URL.
+
+    tokens / contributions come from TokenScorer when the URL was scored by it, so it is not tokenized again.
+    """
+    url_entropy = entropy(url_clean) # Use imported function
+    if timer: timer.mark('entropy')
+    is_malicious = (ai_prediction == 'bad')
+
+    threat_report = []
+    if is_malicious:
+        if tokens is None:
+            tokens = getTokens(url_clean.lower()) # same tokens the vectorizer sees
+            if timer: timer.mark('getTokens')
+        found_bad_tokens = [token for token in dict.fromkeys(tokens) if token in HIGH_RISK_TOKENS]
+        for token in found_bad_tokens: threat_report.append(f"Contains suspicious token: '{token}'")
+        cited = [(t, v) for t, v in (contributions or []) if v > 0 and t not in HIGH_RISK_TOKENS][:TOP_TOKENS]
+        for token, value in cited:
+            threat_report.append(f"Model signal: token '{token}' raises the risk score by {value:.2f}")
+        if url_entropy > 4.0: threat_report.append(f"High randomness score: {url_entropy:.2f}")
+        if not threat_report: threat_report.append("Matches a general malicious URL pattern.")
+        if timer: timer.mark('threat_report')
+
+    verdict = {
+        'url': url_raw, 'ai_prediction': ai_prediction,
+        'entropy': f"{url_entropy:.4f}", 'is_malicious': is_malicious,
+        'threat_report': threat_report
+    }
+    if contributions is not None:
+        # Strongest signals either way; positive values push toward 'bad'
+        strongest = sorted(contributions, key=lambda item: -abs(item[1]))[:TOP_TOKENS]
+        verdict['top_tokens'] = [{'token': token, 'contribution': round(value, 4)} for token, value in strongest]
+    return verdict
+
+def allowlisted_verdict(url_raw, url_clean):
+    """ /analyze response body for a URL on a trusted domain (no model call). """
+    metrics.inc('allowlist_hits_total')
+    return {
+        'url': url_raw, 'ai_prediction': 'good',
+        'entropy': f"{entropy(url_clean):.4f}", 'is_malicious': False,
+        'threat_report': [], 'allowlisted': True
+    }
+
+def blocklisted_verdict(url_raw, url_clean, listed):
+    """ /analyze response body for a URL whose URL or host is in the known-malicious filter (no model call). """
+    metrics.inc('blocklist_hits_total', (('kind', listed),))
+    verdict = build_verdict(url_raw, url_clean, 'bad')
+    verdict['threat_report'].insert(0, "Listed as a known malicious URL." if listed == 'url' else "Hosted on a known malicious domain.")
+    verdict['blocklisted'] = True
+    return verdict
+
+class ModelScoringError(RuntimeError):
+    """ vectorizer/model failed while scoring a batch. """
+
+def analyze_urls(urls_raw, model=None):
+    """ Verdicts for a list of raw URLs: verdict cache first, then the misses are scored (tokenized once per URL,
+    or one score_urls call per chunk for models without a TokenScorer). """
+    model = model or active_model
+    results = [None] * len(urls_raw)
+    urls_clean = [clean_url(u) if isinstance(u, str) and u else '' for u in urls_raw]
+    valid_idx = []
+    for i, url_clean in enumerate(urls_clean):
+        if not url_clean:
+            results[i] = {'url': urls_raw[i], 'error': 'Invalid URL provided (failed cleaning).'}
+            continue
+        if allowlist and allowlist.match(url_clean):
+            results[i] = allowlisted_verdict(urls_raw[i], url_clean)
+            continue
+        listed = blocklist.match(url_clean) if blocklist else None
+        if listed:
+            results[i] = blocklisted_verdict(urls_raw[i], url_clean, listed)
+            continue
+        cached = verdict_cache.get((model.version, url_clean))
+        if cached is not None: results[i] = dict(cached, url=urls_raw[i])
+        else: valid_idx.append(i)
+
+    if model.scorer is not None:
+        for i in valid_idx:
+            try:
+                prediction, tokens, contributions = score_tokenized(urls_clean[i], model)
+            except Exception as pred_err:
+                raise ModelScoringError(str(pred_err)) from pred_err
+            results[i] = build_verdict(urls_raw[i], urls_clean[i], prediction, tokens=tokens, contributions=contributions)
+            verdict_cache.put((model.version, urls_clean[i]), results[i])
+        return results
+
+    for start in range(0, len(valid_idx), BATCH_CHUNK_SIZE):
+        chunk_idx = valid_idx[start:start + BATCH_CHUNK_SIZE]
+        try:
+            y_Predict = score_urls([urls_clean[i] for i in chunk_idx], model=model)
+        except Exception as pred_err:
+            raise ModelScoringError(str(pred_err)) from pred_err
+        for i, prediction in zip(chunk_idx, y_Predict):
+            results[i] = build_verdict(urls_raw[i], urls_clean[i], str(prediction))
+            verdict_cache.put((model.version, urls_clean[i]), results[i])
+    return results
+
+def chain_summary(hops):
+    """ Overall verdict for a scored redirect chain: malicious if any hop is. """
+    malicious = [hop['index'] for hop in hops if hop.get('is_malicious')]
+    return {
+        'final_url': hops[-1]['url'] if hops else None, 'hop_count': len(hops),
+        'is_malicious': bool(malicious), 'ai_prediction': 'bad' if malicious else ('good' if hops else None),
+        'malicious_hops': malicious
+    }
+
 @app.route('/')
 def home():
     """ Serves the main AI Detector page. """
@@ -163,52 +537,134 @@ def home():
 @app.route('/analyze', methods=['POST'])
 def analyze():
     """ API endpoint to analyze a URL using the AI model. """
-    if not lgs or not vectorizer:
+    model = active_model # one snapshot for the whole request, even if a new version is swapped in meanwhile
+    if model is None:
         print("Error: /analyze called but model/vectorizer not loaded.")
-        return jsonify({'error': 'AI model is not ready. Please check server start-up logs.'}), 503 # Service Unavailable
+        record_error('analyze', 'model_not_ready')
+        return model_unavailable()
+    timer = metrics.stage_timer('analyze')
+    deadline = request_deadline()
     try:
-        data = request.get_json();
-        if not data: return jsonify({'error': 'Invalid JSON payload.'}), 400
+        data = request.get_json(); timer.mark('parse_json')
+        if not data: record_error('analyze', 'invalid_payload'); return jsonify({'error': 'Invalid JSON payload.'}), 400
         url_raw = data.get('url')
-        if not url_raw: return jsonify({'error': 'No URL provided.'}), 400
+        if not url_raw: record_error('analyze', 'missing_url'); return jsonify({'error': 'No URL provided.'}), 400
 
         url_clean = clean_url(url_raw) # Use imported function
-        if not url_clean: return jsonify({'error': 'Invalid URL provided (failed cleaning).'}), 400
-
-        url_entropy = entropy(url_clean) # Use imported function
-        url_tokens = getTokens(url_clean) # Use imported function
-
-        X_predict = [url_clean]
+        timer.mark('clean_url')
+        if not url_clean: record_error('analyze', 'invalid_url'); return jsonify({'error': 'Invalid URL provided (failed cleaning).'}), 400
+
+        if allowlist:
+            trusted = allowlist.match(url_clean)
+            timer.mark('allowlist')
+            if trusted: return jsonify(allowlisted_verdict(url_raw, url_clean))
+        if blocklist:
+            listed = blocklist.match(url_clean)
+            timer.mark('blocklist')
+            if listed: return jsonify(blocklisted_verdict(url_raw, url_clean, listed))
+
+        cache_key = (model.version, url_clean)
+        cached = verdict_cache.get(cache_key)
+        timer.mark('cache_lookup')
+        if cached is not None: return jsonify(dict(cached, url=url_raw))
+
+        def evaluate():
+            try:
+                ai_prediction, tokens, contributions = score_tokenized(url_clean, model, timer)
+            except Exception as pred_err:
+                raise ModelScoringError(str(pred_err)) from pred_err
+            verdict = build_verdict(url_raw, url_clean, ai_prediction, timer, tokens, contributions)
+            verdict_cache.put(cache_key, verdict)
+            return verdict
+        def compute():
+            if admission is None: return evaluate()
+            with admission.admit(deadline): # only the single-flight leader queues for a slot
+                timer.mark('admission')
+                return evaluate()
         try:
-            X_predict_vec = vectorizer.transform(X_predict)
-            y_Predict = lgs.predict(X_predict_vec)
-        except Exception as pred_err:
+            verdict, shared = analyze_flight.do(cache_key, compute)
+        except Overloaded as shed:
+            timer.mark('shed')
+            return shed_response('analyze', shed)
+        except ModelScoringError as pred_err:
              print(f"Error during model prediction/transform: {pred_err}")
+             record_error('analyze', type(pred_err.__cause__).__name__)
              return jsonify({'error': 'Error applying AI model.'}), 500
-
-        ai_prediction = str(y_Predict[0]) if y_Predict else 'error'
-        is_malicious = (ai_prediction == 'bad')
-
-        threat_report = []
-        if is_malicious:
-            # Use imported HIGH_RISK_TOKENS
-            found_bad_tokens = [token for token in url_tokens if token in HIGH_RISK_TOKENS]
-            for token in found_bad_tokens: threat_report.append(f"Contains suspicious token: '{token}'")
-            if url_entropy > 4.0: threat_report.append(f"High randomness score: {url_entropy:.2f}")
-            if not threat_report: threat_report.append("Matches a general malicious URL pattern.")
-
-        return jsonify({
-            'url': url_raw, 'ai_prediction': ai_prediction,
-            'entropy': f"{url_entropy:.4f}", 'is_malicious': is_malicious,
-            'threat_report': threat_report
-        })
+        if shared:
+            timer.mark('coalesced')
+            verdict = dict(verdict, url=url_raw)
+        response = jsonify(verdict)
+        timer.mark('serialize')
+        return response
     except Exception as e:
         print(f"Error during analysis: {e}")
+        record_error('analyze', type(e).__name__)
+        return jsonify({'error': 'An internal server error occurred during analysis.'}), 500
+    finally:
+        timer.finish()
+
+@app.route('/api/analyze_batch', methods=['POST'])
+def api_analyze_batch():
+    """ API endpoint to analyze many URLs with one transform/predict call per chunk. """
+    model = active_model
+    if model is None:
+        print("Error: /api/analyze_batch called but model/vectorizer not loaded.")
+        return model_unavailable()
+    try:
+        data = request.get_json()
+        if not data: return jsonify({'error': 'Invalid JSON payload.'}), 400
+        urls_raw = data.get('urls')
+        if not isinstance(urls_raw, list) or not urls_raw: return jsonify({'error': 'No URLs provided.'}), 400
+        if len(urls_raw) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'Too many URLs in one batch (max {MAX_BATCH_SIZE}).'}), 413
+
+        try:
+            results = analyze_urls(urls_raw, model)
+        except ModelScoringError as pred_err:
+            print(f"Error during batch model prediction/transform: {pred_err}")
+            return jsonify({'error': 'Error applying AI model.'}), 500
+        return jsonify({'results': results, 'count': len(results)})
+    except Exception as e:
+        print(f"Error during batch analysis: {e}")
         return jsonify({'error': 'An internal server error occurred during analysis.'}), 500
 
 # (Include all other routes: /how-it-works, /expander, /api/expand, /history, /report, /api/submit_report)
 # Make sure they are defined correctly below
 
+@app.route('/healthz')
+def healthz():
+    """ Liveness probe: the process is up and serving requests. """
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """ Readiness probe: 200 once the model is loaded, with its version and load timings. """
+    body = {
+        'ready': model_ready(), 'state': model_status['state'], 'version': model_status['version'],
+        'timings': model_status['timings'], 'loaded_at': model_status['loaded_at']
+    }
+    if model_status['error']: body['error'] = model_status['error']
+    return jsonify(body), (200 if body['ready'] else 503)
+
+metrics.gauge('model_info', lambda: {(('version', model_status['version']), ('state', model_status['state'])): 1})
+metrics.gauge('model_ready', lambda: {(): model_ready()})
+for _stat in ('hits', 'misses', 'evictions', 'expirations', 'size'):
+    metrics.gauge(f'verdict_cache_{_stat}', lambda stat=_stat: {(): verdict_cache.stats()[stat]})
+    metrics.gauge(f'expand_cache_{_stat}', lambda stat=_stat: {(): expander.cache.stats()[stat] if expander else 0})
+for _stat in ('queued', 'written', 'failed', 'dropped'):
+    metrics.gauge(f'reports_{_stat}', lambda stat=_stat: {(): report_writer.stats()[stat] if report_writer else 0})
+for _stat in ('computed', 'coalesced', 'inflight'):
+    metrics.gauge(f'analyze_singleflight_{_stat}', lambda stat=_stat: {(): analyze_flight.stats()[stat]})
+for _stat in ('queue_depth', 'inflight', 'service_seconds', 'admitted'):
+    metrics.gauge(f'analyze_admission_{_stat}', lambda stat=_stat: {(): admission.stats()[stat] if admission else 0})
+metrics.gauge('allowlist_domains', lambda: {(): allowlist.size if allowlist else 0})
+metrics.gauge('blocklist_items', lambda: {(): blocklist.meta.get('items', 0) if blocklist else 0})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """ Prometheus scrape endpoint: stage histograms, request/error counts, model + cache state. """
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/how-it-works')
 def how_it_works():
     return render_template('how-it-works.html')
@@ -220,30 +676,129 @@ def expander_page():
 @app.route('/api/expand', methods=['POST'])
 def api_expand():
     # Keep the implementation using requests from previous correct version
+    import requests
+    expander = get_expander()
+    timer = metrics.stage_timer('api_expand')
     try:
-        data = request.get_json()
+        data = request.get_json(); timer.mark('parse_json')
         short_url = data.get('url')
-        if not short_url: return jsonify({'error': 'No URL provided.'}), 400
+        if not short_url: record_error('api_expand', 'missing_url'); return jsonify({'error': 'No URL provided.'}), 400
         if not re.match(r'^(?:http|ftp)s?://', short_url): short_url = 'http://' + short_url
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
         print(f"[Expander Debug] Attempting to expand URL: {short_url}")
-        response = requests.head(short_url, allow_redirects=True, timeout=7, headers=headers)
-        print(f"[Expander Debug] Status: {response.status_code}, Final URL: {response.url}, History: {len(response.history)}")
-        if not response.ok and response.status_code != 405:
-             print(f"[Expander Error] Request failed with status: {response.status_code}")
-             return jsonify({'error': f'Request failed with status: {response.status_code}'}), response.status_code
-        final_url = response.url
+        result = expander.expand(short_url)
+        timer.mark('expand')
+        status_code, final_url, history = result['status'], result['final_url'], result['chain'][:-1]
+        print(f"[Expander Debug] Status: {status_code}, Final URL: {final_url}, History: {len(history)}, Cached: {result['cached']}")
+        if status_code >= 400 and status_code != 405:
+             print(f"[Expander Error] Request failed with status: {status_code}")
+             record_error('api_expand', 'upstream_status')
+             return jsonify({'error': f'Request failed with status: {status_code}'}), status_code
         cleaned_input = re.sub(r'^(?:http|ftp)s?://', '', short_url).strip('/')
         cleaned_final = re.sub(r'^(?:http|ftp)s?://', '', final_url).strip('/')
-        if cleaned_input == cleaned_final and len(response.history) <= 1:
+        if cleaned_input == cleaned_final and len(history) <= 1:
              print("[Expander Warning] Final URL same as input/protocol change only.")
+             record_error('api_expand', 'not_expandable')
              return jsonify({'error': 'Could not expand URL. May not be short link or blocked.'}), 400
         return jsonify({'final_url': final_url})
-    except requests.exceptions.Timeout: print("[Expander Error] Timed out."); return jsonify({'error': 'Request timed out.'}), 504
-    except requests.exceptions.ConnectionError as e: print(f"[Expander Error] Connection error: {e}"); return jsonify({'error': 'Could not connect.'}), 500
-    except requests.exceptions.TooManyRedirects: print("[Expander Error] Too many redirects."); return jsonify({'error': 'Too many redirects.'}), 500
-    except requests.exceptions.RequestException as e: print(f"[Expander Error] Request exception: {e}"); return jsonify({'error': f'Request error: {e}'}), 500
-    except Exception as e: print(f"[Expander Error] Unknown exception: {e}"); return jsonify({'error': 'Unknown error expanding URL.'}), 500
+    except requests.exceptions.Timeout: print("[Expander Error] Timed out."); record_error('api_expand', 'Timeout'); return jsonify({'error': 'Request timed out.'}), 504
+    except requests.exceptions.ConnectionError as e: print(f"[Expander Error] Connection error: {e}"); record_error('api_expand', 'ConnectionError'); return jsonify({'error': 'Could not connect.'}), 500
+    except requests.exceptions.TooManyRedirects: print("[Expander Error] Too many redirects."); record_error('api_expand', 'TooManyRedirects'); return jsonify({'error': 'Too many redirects.'}), 500
+    except requests.exceptions.RequestException as e: print(f"[Expander Error] Request exception: {e}"); record_error('api_expand', type(e).__name__); return jsonify({'error': f'Request error: {e}'}), 500
+    except Exception as e: print(f"[Expander Error] Unknown exception: {e}"); record_error('api_expand', type(e).__name__); return jsonify({'error': 'Unknown error expanding URL.'}), 500
+    finally: timer.finish()
+
+@app.route('/api/expand_batch', methods=['POST'])
+def api_expand_batch():
+    """ API endpoint to expand many short URLs concurrently over the pooled, cached expander. """
+    expander = get_expander()
+    timer = metrics.stage_timer('api_expand_batch')
+    try:
+        data = request.get_json(); timer.mark('parse_json')
+        urls = data.get('urls') if data else None
+        if not isinstance(urls, list) or not urls: record_error('api_expand_batch', 'missing_urls'); return jsonify({'error': 'No URLs provided.'}), 400
+        if len(urls) > MAX_EXPAND_BATCH_SIZE:
+            record_error('api_expand_batch', 'batch_too_large')
+            return jsonify({'error': f'Too many URLs in one batch (max {MAX_EXPAND_BATCH_SIZE}).'}), 413
+        valid = [(i, u if re.match(r'^(?:http|ftp)s?://', u) else 'http://' + u)
+                 for i, u in enumerate(urls) if isinstance(u, str) and u]
+        results = [{'url': u, 'error': 'Invalid URL.'} for u in urls]
+        for (i, _), result in zip(valid, expander.expand_many([u for _, u in valid])): results[i] = result
+        timer.mark('expand')
+        return jsonify({'results': results, 'count': len(results)})
+    except Exception as e:
+        print(f"[Expander Error] Batch expansion failed: {e}")
+        record_error('api_expand_batch', type(e).__name__)
+        return jsonify({'error': 'Unknown error expanding URLs.'}), 500
+    finally:
+        timer.finish()
+
+@app.route('/api/expand_and_score', methods=['POST'])
+def api_expand_and_score():
+    """ Follows a short link's redirect chain and scores every hop with the AI model.
+
+    Default: streams NDJSON, one {'type': 'hop'} line per hop as it resolves, then a {'type': 'summary'} line.
+    With {"stream": false}: one JSON body, every hop scored in a single batched model call.
+    """
+    model = active_model # every hop of the chain is scored by the same model version
+    if model is None:
+        record_error('api_expand_and_score', 'model_not_ready')
+        return model_unavailable()
+    data = request.get_json(silent=True) or {}
+    short_url = data.get('url')
+    if not isinstance(short_url, str) or not short_url:
+        record_error('api_expand_and_score', 'missing_url')
+        return jsonify({'error': 'No URL provided.'}), 400
+    if not re.match(r'^(?:http|ftp)s?://', short_url): short_url = 'http://' + short_url
+    import requests
+    expander = get_expander()
+
+    def scored(hop_dicts, start_index=0):
+        verdicts = analyze_urls([hop['url'] for hop in hop_dicts], model)
+        return [dict(verdict, index=start_index + i, status=hop['status']) for i, (hop, verdict) in enumerate(zip(hop_dicts, verdicts))]
+
+    if data.get('stream') is False:
+        try:
+            result = expander.expand(short_url)
+            hops = scored(result['chain'])
+            return jsonify({'url': short_url, 'hops': hops, 'summary': chain_summary(hops)})
+        except ValueError as e: # malformed URL (requests' InvalidURL is a ValueError too)
+            record_error('api_expand_and_score', 'InvalidURL')
+            return jsonify({'error': f'Could not expand URL: {e}'}), 400
+        except requests.exceptions.RequestException as e:
+            record_error('api_expand_and_score', type(e).__name__)
+            return jsonify({'error': f'Could not expand URL: {e}'}), 502
+        except ModelScoringError:
+            record_error('api_expand_and_score', 'ModelScoringError')
+            return jsonify({'error': 'Error applying AI model.'}), 500
+
+    def generate():
+        hops = []
+        try:
+            cached = expander.cache.get(short_url)
+            if cached is not None:
+                # Whole chain already known: one batched model call, then stream the lines
+                hops = scored(cached['chain'])
+                for hop in hops: yield json.dumps(dict(hop, type='hop')) + '\n'
+            else:
+                chain = []
+                for hop in expander.follow(short_url):
+                    chain.append(hop)
+                    scored_hop = scored([hop], start_index=len(hops))[0]
+                    hops.append(scored_hop)
+                    yield json.dumps(dict(scored_hop, type='hop')) + '\n'
+                expander.remember(short_url, chain) # cached only if expand() would cache it
+            yield json.dumps(dict(chain_summary(hops), type='summary')) + '\n'
+        except ValueError as e:
+            record_error('api_expand_and_score', 'InvalidURL')
+            yield json.dumps({'type': 'error', 'error': f'Could not expand URL: {e}', 'summary': chain_summary(hops)}) + '\n'
+        except requests.exceptions.RequestException as e:
+            record_error('api_expand_and_score', type(e).__name__)
+            yield json.dumps({'type': 'error', 'error': f'Could not expand URL: {e}', 'summary': chain_summary(hops)}) + '\n'
+        except ModelScoringError:
+            record_error('api_expand_and_score', 'ModelScoringError')
+            yield json.dumps({'type': 'error', 'error': 'Error applying AI model.'}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/history')
 def history_page():
@@ -255,23 +810,28 @@ def report_page():
 
 @app.route('/api/submit_report', methods=['POST'])
 def api_submit_report():
-    if not db:
-         print("[Firestore Error] 'db' object is None during submit_report.")
-         return jsonify({'error': 'Database connection is not configured.'}), 500
+    """ Queues a feedback report for the background writer and returns immediately. """
+    timer = metrics.stage_timer('api_submit_report')
     try:
-        data = request.get_json()
+        data = request.get_json(); timer.mark('parse_json')
         report_url = data.get('url')
         feedback = data.get('feedback')
         comments = data.get('comments', '')
-        if not report_url or not feedback: return jsonify({'error': 'URL and feedback are required.'}), 400
+        if not report_url or not feedback: record_error('api_submit_report', 'missing_fields'); return jsonify({'error': 'URL and feedback are required.'}), 400
         report_data = {'url': report_url, 'feedback': feedback, 'comments': comments, 'timestamp': datetime.now()}
-        reports_ref = db.collection('feedback_reports')
-        reports_ref.add(report_data)
-        print(f"Feedback report saved to Firestore: {report_url} ({feedback})")
+        queued = get_report_writer().submit(report_data)
+        timer.mark('enqueue')
+        if not queued:
+            record_error('api_submit_report', 'queue_full')
+            return jsonify({'error': 'Too many reports right now. Please try again shortly.'}), 503, {'Retry-After': '5'}
+        print(f"Feedback report queued: {report_url} ({feedback})")
         return jsonify({'message': 'Thank you! Your feedback helps improve SafeLink AI.'}) # Updated message
     except Exception as e:
         print(f"Error processing report or saving to Firestore: {e}")
+        record_error('api_submit_report', type(e).__name__)
         return jsonify({'error': 'An error occurred while submitting your report.'}), 500
+    finally:
+        timer.finish()
 
 # --- 8. Run the App (for local testing, ignored by Render) ---
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+"""
+Deadline-aware admission control for the scoring routes.
+
+    admission = AdmissionController(max_concurrent=4, max_queue=64)
+    with admission.admit(deadline=time.monotonic() + 0.5):
+        ... model work ...
+
+At most max_concurrent callers run at once, and up to max_queue more wait for a slot.
+The others are turned away before any work is done (Overloaded):
+
+- queue_full: max_queue callers are already waiting;
+- deadline:   the predicted wait plus one service time (both from an EWMA of recent service times)
+              would end past the caller's deadline;
+- expired:    while the caller was queued, its deadline came too close to fit one service time.
+
+Each Overloaded carries the HTTP status and a Retry-After estimate (seconds until the backlog drains),
+so a client that was shed knows when capacity is expected back.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    """ Raised by AdmissionController.admit when a request is shed """
+
+    STATUS = {'queue_full': 429, 'deadline': 503, 'expired': 503}
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Request shed ({reason}); retry after {retry_after}s.")
+        self.reason = reason
+        self.status = self.STATUS[reason]
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """ Bounded concurrency + bounded wait queue, shedding callers that cannot finish before their deadline """
+
+    def __init__(self, max_concurrent=4, max_queue=64, alpha=0.2):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.alpha = float(alpha)
+        self._cond = threading.Condition()
+        self.running = 0
+        self.waiting = 0
+        self.service_time = 0.0 # EWMA of seconds spent inside admit(), 0 until the first sample
+        self.admitted = 0
+        self.shed = {reason: 0 for reason in Overloaded.STATUS}
+
+    def _predicted_wait(self, ahead):
+        """ Seconds until a caller with `ahead` others queued in front of it gets a slot (lock held) """
+        if self.running < self.max_concurrent and not ahead: return 0.0
+        return (ahead // self.max_concurrent + 1) * self.service_time
+
+    def _retry_after(self, backlog=None):
+        """ Whole seconds (>= 1) until backlog callers (default: everyone queued or running) are expected to drain (lock held) """
+        if backlog is None: backlog = self.waiting + self.running
+        return max(1, math.ceil(backlog / self.max_concurrent * self.service_time))
+
+    def _shed(self, reason, backlog=None):
+        self.shed[reason] += 1
+        return Overloaded(reason, self._retry_after(backlog))
+
+    def reject(self, reason, backlog=None):
+        """ Counts and returns the Overloaded for a caller shed outside admit(), e.g. by a full queue in front of it """
+        with self._cond:
+            return self._shed(reason, backlog)
+
+    @contextmanager
+    def admit(self, deadline=None):
+        """ Holds one slot for the with-block; deadline is a time.monotonic() value or None (no deadline).
+
+        Raises Overloaded instead of waiting when the caller would be (or already is) too late.
+        """
+        with self._cond:
+            now = time.monotonic()
+            if self.running >= self.max_concurrent or self.waiting:
+                if self.waiting >= self.max_queue: raise self._shed('queue_full')
+                if deadline is not None and now + self._predicted_wait(self.waiting) + self.service_time > deadline:
+                    raise self._shed('deadline')
+                self.waiting += 1
+                try:
+                    while True:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining < self.service_time:
+                            if self.running < self.max_concurrent: self._cond.notify() # pass the free slot on
+                            raise self._shed('expired')
+                        if self.running < self.max_concurrent: break
+                        self._cond.wait(None if remaining is None else remaining - self.service_time)
+                finally:
+                    self.waiting -= 1
+            elif deadline is not None and now + self.service_time > deadline:
+                raise self._shed('deadline')
+            self.running += 1
+            self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self.running -= 1
+                self.service_time = elapsed if not self.service_time else self.service_time + self.alpha * (elapsed - self.service_time)
+                self._cond.notify()
+
+    def stats(self):
+        """ Returns queue depth, in-flight count, service-time estimate and admitted/shed counters as a plain dict. """
+        with self._cond:
+            stats = {'queue_depth': self.waiting, 'inflight': self.running, 'service_seconds': self.service_time,
+                     'admitted': self.admitted, 'max_concurrent': self.max_concurrent, 'max_queue': self.max_queue}
+            stats.update((f'shed_{reason}', count) for reason, count in self.shed.items())
+            return stats
@@ -0,0 +1,121 @@
+"""
+Trusted-domain index: allowlisted verdicts for popular domains without running the model.
+
+Built offline from a plain-text domain list:
+    python allowlist.py trusted_domains.txt allowlist/
+
+List format: one registrable domain per line ('google.com' trusts google.com and every subdomain),
+'#' comments, and '!'-prefixed exclusions for subdomains that host user content
+('!sites.google.com'). The most specific matching entry wins.
+
+Layout of an index directory (flat .npy files that can be memory-mapped, like the compact model):
+    meta.json         format version, entry counts
+    keys_bytes.npy    uint8 - reversed-label keys ('com.google', 'com.google.sites') concatenated in sorted order
+    keys_offsets.npy  int64 - key i is keys_bytes[offsets[i]:offsets[i+1]]
+    trusted.npy       uint8 - 1 for a trusted entry, 0 for an exclusion
+
+A lookup probes the host's label suffixes from the most specific down ('com.google.mail', 'com.google',
+'com') with one binary search each, so it costs O(label count) probes.
+"""
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+from utils import url_host
+
+ALLOWLIST_FORMAT_VERSION = 1
+META_FILE = 'meta.json'
+
+DOMAIN_RE = re.compile(r'^[a-z0-9-]+(\.[a-z0-9-]+)+$')
+
+
+def _reverse_labels(domain):
+    return '.'.join(reversed(domain.split('.')))
+
+def parse_domain_list(lines):
+    """ Returns {domain: trusted} from allowlist lines; raises ValueError on a malformed entry """
+    entries = {}
+    for number, line in enumerate(lines, 1):
+        line = line.split('#', 1)[0].strip().lower()
+        if not line: continue
+        trusted = not line.startswith('!')
+        domain = line.lstrip('!').removeprefix('*.').rstrip('.')
+        try:
+            domain = domain.encode('idna').decode('ascii') # IDN entries are matched in punycode form
+        except UnicodeError:
+            raise ValueError(f"Line {number}: invalid domain {line!r}")
+        if not DOMAIN_RE.match(domain): raise ValueError(f"Line {number}: invalid domain {line!r}")
+        entries[domain] = trusted
+    return entries
+
+
+def build_index(entries, out_dir):
+    """ Writes {domain: trusted} to out_dir in the index format; returns the meta dict """
+    os.makedirs(out_dir, exist_ok=True)
+    keyed = sorted((_reverse_labels(d).encode('ascii'), trusted) for d, trusted in entries.items())
+    offsets = np.zeros(len(keyed) + 1, dtype=np.int64)
+    np.cumsum([len(key) for key, _ in keyed], out=offsets[1:])
+
+    np.save(os.path.join(out_dir, 'keys_bytes.npy'), np.frombuffer(b''.join(key for key, _ in keyed), dtype=np.uint8))
+    np.save(os.path.join(out_dir, 'keys_offsets.npy'), offsets)
+    np.save(os.path.join(out_dir, 'trusted.npy'), np.fromiter((t for _, t in keyed), dtype=np.uint8, count=len(keyed)))
+
+    meta = {
+        'format_version': ALLOWLIST_FORMAT_VERSION,
+        'entries': len(keyed),
+        'trusted': sum(1 for _, t in keyed if t),
+        'excluded': sum(1 for _, t in keyed if not t)
+    }
+    with open(os.path.join(out_dir, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class DomainAllowlist:
+    """ Answers 'is this URL on a trusted domain?' from an index directory (see module docstring) """
+
+    def __init__(self, directory, mmap=True):
+        mmap_mode = 'r' if mmap else None
+        with open(os.path.join(directory, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta.get('format_version') != ALLOWLIST_FORMAT_VERSION:
+            raise ValueError(f"Unsupported allowlist format: {self.meta.get('format_version')}")
+        keys_bytes = np.load(os.path.join(directory, 'keys_bytes.npy'), mmap_mode=mmap_mode)
+        self._keys = bytes(keys_bytes) # small (a few MB for 100k domains); bytes slicing beats memoryview here
+        self._offsets = np.load(os.path.join(directory, 'keys_offsets.npy'), mmap_mode=mmap_mode).tolist()
+        self._trusted = np.load(os.path.join(directory, 'trusted.npy'), mmap_mode=mmap_mode)
+        self.size = len(self._offsets) - 1
+
+    def _find(self, key):
+        """ Index of key in the sorted keys, or -1 (binary search) """
+        keys, offsets = self._keys, self._offsets
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            candidate = keys[offsets[mid]:offsets[mid + 1]]
+            if candidate == key: return mid
+            if candidate < key: lo = mid + 1
+            else: hi = mid
+        return -1
+
+    def match_host(self, host):
+        """ True when the most specific entry covering host is a trusted one """
+        if not host or not host.isascii(): return False # unicode hosts fall through to the model
+        labels = host.split('.')
+        for i in range(len(labels)):
+            idx = self._find('.'.join(reversed(labels[i:])).encode('ascii'))
+            if idx >= 0: return bool(self._trusted[idx])
+        return False
+
+    def match(self, url_clean):
+        return self.match_host(url_host(url_clean))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3: raise SystemExit("Usage: python allowlist.py DOMAIN_LIST OUT_DIR")
+    with open(sys.argv[1], encoding='utf-8') as f:
+        meta = build_index(parse_domain_list(f), sys.argv[2])
+    print(f"Allowlist index written to {sys.argv[2]}: {meta['trusted']} trusted domains, {meta['excluded']} exclusions.")
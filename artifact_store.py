@@ -0,0 +1,177 @@
+"""
+Content-addressed local cache for the downloaded model artifacts.
+
+Layout of a cache directory (ARTIFACT_CACHE_DIR):
+    objects/<sha256>         artifact bytes, named by their SHA-256 (read-only once in place)
+    versions/<version>.json  {'version', 'artifacts': {name: {'url', 'sha256', 'size'}}}
+    .lock                    fcntl lock held while downloading
+
+fetch() returns verified local paths for one model version:
+
+- warm start: the version manifest exists and every object it lists re-hashes to its name, so nothing
+  is downloaded and no lock is taken;
+- cold start: the first process takes the lock and downloads; the others block on the lock, then find
+  the verified objects and skip the download. Downloads stream into a temp file in objects/ (hashed as
+  they arrive, checked against Content-Length and a pinned hash when one is given), are fsynced and only
+  then renamed to objects/<sha256>, so a crash or a truncated transfer never leaves a file under a
+  valid name. The manifest is replaced atomically after all of its objects are in place.
+
+An object that no longer matches its hash (disk corruption, manual edits) is deleted and downloaded
+again instead of being unpickled. Without a pinned hash the first complete download of a version is
+trusted and recorded in its manifest.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError: # Windows: no cross-process lock, concurrent starts may both download
+    fcntl = None
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+CHUNK_SIZE = 1 << 20
+
+
+class ArtifactError(RuntimeError):
+    """ A download failed or an artifact did not match its expected hash or size """
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_pickle(path):
+    """ joblib.load with numpy arrays memory-mapped read-only where the file allows it (uncompressed joblib
+    dumps), so workers share the array pages through the page cache; other pickles load normally """
+    import joblib
+    with warnings.catch_warnings():
+        # compressed dumps cannot be mmapped; joblib warns and reads them normally. Only that warning is
+        # silenced (matched by text: joblib emits it via contextlib, so module= cannot target it), so e.g.
+        # sklearn's InconsistentVersionWarning still surfaces
+        warnings.filterwarnings('ignore', message=r'mmap_mode ".*" is not compatible with compressed file', category=UserWarning)
+        return joblib.load(path, mmap_mode='r')
+
+
+class ArtifactStore:
+    """ Verified, content-addressed artifact cache shared by every process on the machine """
+
+    def __init__(self, root, timeout=90):
+        self.root = root
+        self.timeout = timeout
+        self.objects_dir = os.path.join(root, 'objects')
+        self.versions_dir = os.path.join(root, 'versions')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.versions_dir, exist_ok=True)
+        self.stats = {'downloaded': 0, 'downloaded_bytes': 0, 'verified': 0, 'corrupt': 0}
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256)
+
+    def _manifest_path(self, version):
+        return os.path.join(self.versions_dir, f"{version.replace('/', '_')}.json")
+
+    def read_manifest(self, version):
+        try:
+            with open(self._manifest_path(version)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_manifest(self, version, artifacts):
+        fd, tmp_path = tempfile.mkstemp(dir=self.versions_dir, prefix='.manifest-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'version': version, 'artifacts': artifacts}, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, self._manifest_path(version))
+
+    def _verified(self, entry, url, pinned):
+        """ Path of the manifest entry's object if it is for url, matches the pinned hash and re-hashes intact """
+        if entry is None or entry.get('url') != url or (pinned and entry.get('sha256') != pinned): return None
+        path = self.object_path(entry['sha256'])
+        if not os.path.exists(path): return None
+        if os.path.getsize(path) != entry.get('size') or file_sha256(path) != entry['sha256']:
+            self.stats['corrupt'] += 1
+            print(f"Cached artifact {path} does not match its SHA-256; removing it.")
+            try: os.remove(path)
+            except OSError: pass
+            return None
+        self.stats['verified'] += 1
+        return path
+
+    def _lock(self):
+        """ Exclusive cross-process lock (a no-op without fcntl); close the returned file to release it """
+        lock_file = open(os.path.join(self.root, '.lock'), 'a')
+        if fcntl is not None: fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        return lock_file
+
+    def download(self, url, expected_sha256=None):
+        """ Streams url into the object store; returns its manifest entry {'url', 'sha256', 'size'} """
+        import requests
+        if not url or not url.startswith(('http://', 'https://')): raise ArtifactError(f"Invalid download URL: {url}")
+        print(f"Downloading {url}...")
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, prefix='.download-')
+        try:
+            digest, size = hashlib.sha256(), 0
+            with os.fdopen(fd, 'wb') as f:
+                try:
+                    with requests.get(url, stream=True, timeout=self.timeout, headers={'User-Agent': USER_AGENT}, allow_redirects=True) as r:
+                        r.raise_for_status()
+                        expected_size = r.headers.get('Content-Length')
+                        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                            f.write(chunk)
+                            digest.update(chunk)
+                            size += len(chunk)
+                except requests.exceptions.RequestException as e:
+                    raise ArtifactError(f"Error downloading {url}: {e}") from e
+                f.flush()
+                os.fsync(f.fileno())
+            sha256 = digest.hexdigest()
+            if expected_size is not None and r.headers.get('Content-Encoding') in (None, 'identity') and int(expected_size) != size:
+                raise ArtifactError(f"Truncated download of {url}: {size} of {expected_size} bytes")
+            if expected_sha256 and sha256 != expected_sha256:
+                raise ArtifactError(f"SHA-256 mismatch for {url}: got {sha256}, expected {expected_sha256}")
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, self.object_path(sha256))
+        except BaseException:
+            try: os.remove(tmp_path)
+            except OSError: pass
+            raise
+        print(f"{url} downloaded ({size / (1024 * 1024):.2f} MB, sha256 {sha256[:12]}).")
+        return {'url': url, 'sha256': sha256, 'size': size}
+
+    def fetch(self, version, artifacts):
+        """ {name: verified local path} for artifacts = {name: (url, pinned sha256 or None)} of one model version,
+        downloading only what is missing or corrupt (in parallel) """
+        manifest = self.read_manifest(version) or {}
+        entries = manifest.get('artifacts', {})
+        paths = {name: self._verified(entries.get(name), url, pinned) for name, (url, pinned) in artifacts.items()}
+        if all(paths.values()): return paths
+
+        lock_file = self._lock()
+        try:
+            # Another process may have completed the download while this one waited for the lock
+            entries = dict(entries, **(self.read_manifest(version) or {}).get('artifacts', {}))
+            for name, (url, pinned) in artifacts.items():
+                if paths[name] is None: paths[name] = self._verified(entries.get(name), url, pinned)
+            missing = [name for name, path in paths.items() if path is None]
+            if missing:
+                with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+                    downloaded = list(pool.map(lambda name: self.download(*artifacts[name]), missing))
+                for name, entry in zip(missing, downloaded):
+                    entries[name] = entry
+                    paths[name] = self.object_path(entry['sha256'])
+                    self.stats['downloaded'] += 1
+                    self.stats['downloaded_bytes'] += entry['size']
+            self._write_manifest(version, {name: entries[name] for name in artifacts})
+        finally:
+            lock_file.close()
+        return paths
@@ -0,0 +1,300 @@
+"""
+ASGI serving mode: the routes of AIserver.py without outbound I/O pinning a worker.
+
+    gunicorn -c gunicorn.conf.py -k asgi asgi:app
+
+Under the sync worker a slow shortener holds a whole gunicorn worker in requests.head for up to
+EXPAND_TIMEOUT seconds, so a burst of /api/expand calls starves /analyze. In this mode:
+
+- /api/expand, /api/expand_batch and /api/expand_and_score follow redirects with AsyncURLExpander on
+  the event loop (httpx), so a slow hop costs a coroutine, not a worker;
+- /analyze and /api/analyze_batch run the Flask views in a bounded scoring thread pool
+  (ASGI_SCORING_THREADS), so model calls never block the loop; requests beyond the threads plus
+  ANALYZE_QUEUE_SIZE are shed with 429 before they queue, and time spent queued counts against the
+  client's X-Deadline-Ms;
+- every other route (pages, /metrics, /api/submit_report, ...) runs the Flask app in a second bounded
+  pool (ASGI_WSGI_THREADS). Feedback reports are queued for the BufferedReportWriter thread, so the
+  Firestore writes stay off the request path in both modes.
+
+Model loading, caches, metrics and the report writer are AIserver's, and the native routes send the CORS
+headers of AIserver.CORS_RESOURCES, so both modes answer the same.
+"""
+import asyncio
+import io
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import AIserver
+from AIserver import ModelScoringError, chain_summary, metrics, record_error
+from expander import AsyncURLExpander
+
+SCORING_THREADS = int(os.environ.get('ASGI_SCORING_THREADS', 4))
+WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 8))
+MAX_BODY_BYTES = int(os.environ.get('ASGI_MAX_BODY_BYTES', 1 << 20))
+SCORING_ROUTES = ('/analyze', '/api/analyze_batch')
+
+scoring_pool = ThreadPoolExecutor(max_workers=SCORING_THREADS, thread_name_prefix='asgi-scoring')
+wsgi_pool = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='asgi-wsgi')
+_expander = None # created on the event loop on first use; shares AIserver's redirect cache
+_scoring_backlog = 0 # scoring-route requests submitted to scoring_pool and not yet answered (event loop only)
+
+
+def get_expander():
+    global _expander
+    if _expander is None:
+        sync = AIserver.get_expander()
+        _expander = AsyncURLExpander(timeout=sync.timeout, max_redirects=sync.max_redirects,
+                                     per_host_limit=sync.per_host_limit, cache=sync.cache)
+    return _expander
+
+# --- Plumbing ---
+
+async def read_body(receive):
+    """ Whole request body; None when it exceeds MAX_BODY_BYTES """
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect': break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES: return None
+        chunks.append(chunk)
+        if not message.get('more_body'): break
+    return b''.join(chunks)
+
+async def send_response(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def respond(send, route, body, status=200, headers=None):
+    """ JSON response (serialized like Flask's jsonify) counted in requests_total like AIserver.count_request """
+    metrics.inc('requests_total', (('route', route), ('status', str(status))))
+    payload = (json.dumps(body, separators=(',', ':'), sort_keys=True) + '\n').encode()
+    extra = [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in (headers or {}).items()]
+    await send_response(send, status, [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())] + extra, payload)
+
+def wsgi_environ(scope, body):
+    """ PEP 3333 environ for one ASGI HTTP request with an already-read body """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'], 'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'), 'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]), 'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}", 'REMOTE_ADDR': (scope.get('client') or ('',))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': scope.get('scheme', 'http'), 'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': True, 'wsgi.run_once': False
+    }
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-length': continue
+        key = 'CONTENT_TYPE' if name == 'content-type' else 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def run_wsgi(environ):
+    """ Calls the Flask app (in a pool thread); returns (status, headers, body) """
+    started = {}
+    def start_response(status, headers, exc_info=None):
+        started['status'], started['headers'] = int(status.split(' ', 1)[0]), headers
+    result = AIserver.app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'): result.close()
+    headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in started['headers']]
+    return started['status'], headers, body
+
+def cors_headers(scope):
+    """ The CORS headers Flask-CORS adds for AIserver.CORS_RESOURCES on a native route (actual requests only;
+    OPTIONS preflights are not native routes, so Flask-CORS answers them). Native routes allow any origin. """
+    options = AIserver.CORS_RESOURCES[scope['path']]
+    if options['origins'] != '*': raise ValueError(f"{scope['path']}: only 'origins': '*' is mirrored for native routes")
+    origin = next((value for name, value in scope.get('headers', []) if name == b'origin'), None)
+    # Like Flask-CORS: echo the caller's Origin (and vary on it) when there is one, '*' otherwise
+    headers = [(b'access-control-allow-origin', origin), (b'vary', b'Origin')] if origin else [(b'access-control-allow-origin', b'*')]
+    if options.get('expose_headers'): headers.append((b'access-control-expose-headers', ', '.join(options['expose_headers']).encode()))
+    return headers
+
+def with_scheme(url):
+    return url if re.match(r'^(?:http|ftp)s?://', url) else 'http://' + url
+
+# --- Native async routes (same responses as the Flask views in AIserver) ---
+
+async def api_expand(data, send):
+    route = 'api_expand'
+    timer = metrics.stage_timer(route)
+    try:
+        short_url = data.get('url') if isinstance(data, dict) else None
+        if not short_url: record_error(route, 'missing_url'); return await respond(send, route, {'error': 'No URL provided.'}, 400)
+        short_url = with_scheme(short_url)
+        result = await get_expander().expand(short_url)
+        timer.mark('expand')
+        status_code, final_url, history = result['status'], result['final_url'], result['chain'][:-1]
+        if status_code >= 400 and status_code != 405:
+            record_error(route, 'upstream_status')
+            return await respond(send, route, {'error': f'Request failed with status: {status_code}'}, status_code)
+        cleaned_input = re.sub(r'^(?:http|ftp)s?://', '', short_url).strip('/')
+        cleaned_final = re.sub(r'^(?:http|ftp)s?://', '', final_url).strip('/')
+        if cleaned_input == cleaned_final and len(history) <= 1:
+            record_error(route, 'not_expandable')
+            return await respond(send, route, {'error': 'Could not expand URL. May not be short link or blocked.'}, 400)
+        return await respond(send, route, {'final_url': final_url})
+    except requests.exceptions.Timeout: record_error(route, 'Timeout'); return await respond(send, route, {'error': 'Request timed out.'}, 504)
+    except requests.exceptions.ConnectionError: record_error(route, 'ConnectionError'); return await respond(send, route, {'error': 'Could not connect.'}, 500)
+    except requests.exceptions.TooManyRedirects: record_error(route, 'TooManyRedirects'); return await respond(send, route, {'error': 'Too many redirects.'}, 500)
+    except requests.exceptions.RequestException as e: record_error(route, type(e).__name__); return await respond(send, route, {'error': f'Request error: {e}'}, 500)
+    except Exception as e:
+        print(f"[Expander Error] Unknown exception: {e}")
+        record_error(route, type(e).__name__)
+        return await respond(send, route, {'error': 'Unknown error expanding URL.'}, 500)
+    finally:
+        timer.finish()
+
+async def api_expand_batch(data, send):
+    route = 'api_expand_batch'
+    timer = metrics.stage_timer(route)
+    try:
+        urls = data.get('urls') if isinstance(data, dict) else None
+        if not isinstance(urls, list) or not urls: record_error(route, 'missing_urls'); return await respond(send, route, {'error': 'No URLs provided.'}, 400)
+        if len(urls) > AIserver.MAX_EXPAND_BATCH_SIZE:
+            record_error(route, 'batch_too_large')
+            return await respond(send, route, {'error': f'Too many URLs in one batch (max {AIserver.MAX_EXPAND_BATCH_SIZE}).'}, 413)
+        valid = [(i, with_scheme(u)) for i, u in enumerate(urls) if isinstance(u, str) and u]
+        results = [{'url': u, 'error': 'Invalid URL.'} for u in urls]
+        for (i, _), result in zip(valid, await get_expander().expand_many([u for _, u in valid])): results[i] = result
+        timer.mark('expand')
+        return await respond(send, route, {'results': results, 'count': len(results)})
+    except Exception as e:
+        print(f"[Expander Error] Batch expansion failed: {e}")
+        record_error(route, type(e).__name__)
+        return await respond(send, route, {'error': 'Unknown error expanding URLs.'}, 500)
+    finally:
+        timer.finish()
+
+async def api_expand_and_score(data, send):
+    route = 'api_expand_and_score'
+    model = AIserver.active_model # every hop of the chain is scored by the same model version
+    if model is None:
+        record_error(route, 'model_not_ready')
+        return await respond(send, route, *AIserver.model_unavailable())
+    short_url = data.get('url') if isinstance(data, dict) else None
+    if not isinstance(short_url, str) or not short_url:
+        record_error(route, 'missing_url')
+        return await respond(send, route, {'error': 'No URL provided.'}, 400)
+    short_url = with_scheme(short_url)
+    expander, loop = get_expander(), asyncio.get_running_loop()
+
+    async def scored(hop_dicts, start_index=0):
+        verdicts = await loop.run_in_executor(scoring_pool, AIserver.analyze_urls, [hop['url'] for hop in hop_dicts], model)
+        return [dict(verdict, index=start_index + i, status=hop['status']) for i, (hop, verdict) in enumerate(zip(hop_dicts, verdicts))]
+
+    if data.get('stream') is False:
+        try:
+            result = await expander.expand(short_url)
+            hops = await scored(result['chain'])
+            return await respond(send, route, {'url': short_url, 'hops': hops, 'summary': chain_summary(hops)})
+        except ValueError as e: # malformed URL (requests' InvalidURL is a ValueError too)
+            record_error(route, 'InvalidURL')
+            return await respond(send, route, {'error': f'Could not expand URL: {e}'}, 400)
+        except requests.exceptions.RequestException as e:
+            record_error(route, type(e).__name__)
+            return await respond(send, route, {'error': f'Could not expand URL: {e}'}, 502)
+        except ModelScoringError:
+            record_error(route, 'ModelScoringError')
+            return await respond(send, route, {'error': 'Error applying AI model.'}, 500)
+
+    # NDJSON stream: one line per hop as it resolves, then the summary
+    metrics.inc('requests_total', (('route', route), ('status', '200')))
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'application/x-ndjson')]})
+    async def line(obj):
+        await send({'type': 'http.response.body', 'body': (json.dumps(obj) + '\n').encode(), 'more_body': True})
+    hops = []
+    try:
+        cached = expander.cache.get(short_url)
+        if cached is not None:
+            hops = await scored(cached['chain'])
+            for hop in hops: await line(dict(hop, type='hop'))
+        else:
+            chain = []
+            async for hop in expander.follow(short_url):
+                chain.append(hop)
+                scored_hop = (await scored([hop], start_index=len(hops)))[0]
+                hops.append(scored_hop)
+                await line(dict(scored_hop, type='hop'))
+            expander.remember(short_url, chain) # cached only if expand() would cache it
+        await line(dict(chain_summary(hops), type='summary'))
+    except ValueError as e:
+        record_error(route, 'InvalidURL')
+        await line({'type': 'error', 'error': f'Could not expand URL: {e}', 'summary': chain_summary(hops)})
+    except requests.exceptions.RequestException as e:
+        record_error(route, type(e).__name__)
+        await line({'type': 'error', 'error': f'Could not expand URL: {e}', 'summary': chain_summary(hops)})
+    except ModelScoringError:
+        record_error(route, 'ModelScoringError')
+        await line({'type': 'error', 'error': 'Error applying AI model.'})
+    await send({'type': 'http.response.body', 'body': b''})
+
+NATIVE_ROUTES = {
+    ('POST', '/api/expand'): api_expand,
+    ('POST', '/api/expand_batch'): api_expand_batch,
+    ('POST', '/api/expand_and_score'): api_expand_and_score
+}
+
+# --- Application ---
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _expander is not None: await _expander.close()
+            scoring_pool.shutdown(wait=False)
+            wsgi_pool.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    """ ASGI entry point """
+    if scope['type'] == 'lifespan': return await lifespan(receive, send)
+    if scope['type'] != 'http': return # no websocket routes
+    body = await read_body(receive)
+    if body is None:
+        return await send_response(send, 413, [(b'content-type', b'application/json')], b'{"error":"Request body too large."}\n')
+    handler = NATIVE_ROUTES.get((scope['method'], scope['path']))
+    if handler is not None:
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+        cors = cors_headers(scope)
+        async def send_with_cors(message):
+            if message['type'] == 'http.response.start': message = dict(message, headers=list(message['headers']) + cors)
+            await send(message)
+        return await handler(data, send_with_cors)
+    environ = wsgi_environ(scope, body)
+    if scope['path'] not in SCORING_ROUTES:
+        status, headers, payload = await asyncio.get_running_loop().run_in_executor(wsgi_pool, run_wsgi, environ)
+        return await send_response(send, status, headers, payload)
+
+    # The wait for a scoring thread counts against the request's deadline, and the pool's own queue is
+    # bounded like AIserver.admission's, so overload is shed here instead of piling up in the executor
+    global _scoring_backlog
+    admission = AIserver.admission
+    if admission is not None and _scoring_backlog >= SCORING_THREADS + admission.max_queue:
+        route = scope['path'].strip('/').replace('/', '_')
+        return await respond(send, route, *AIserver.shed_response(route, admission.reject('queue_full', _scoring_backlog)))
+    environ['safelink.received_at'] = time.monotonic()
+    _scoring_backlog += 1
+    try:
+        status, headers, payload = await asyncio.get_running_loop().run_in_executor(scoring_pool, run_wsgi, environ)
+    finally:
+        _scoring_backlog -= 1
+    await send_response(send, status, headers, payload)
@@ -0,0 +1,986 @@
+"""
+SafeLink AI benchmarks.
+
+Usage:
+    python benchmark.py tokenizer [--urls N] [--depth D]
+    python benchmark.py load [--vectorizer PATH] [--model PATH] [--compact-dir DIR]
+    python benchmark.py featurize [--urls N] [--jobs N [N ...]]
+    python benchmark.py suite [--urls N] [--model fixture|pickle|compact] [--json OUT] [--compare BASELINE]
+    python benchmark.py expand [--links N] [--hops H] [--delay-ms D]
+    python benchmark.py allowlist [--urls N] [--domains FILE] [--tail-hosts N]
+    python benchmark.py workers [--workers N [N ...]] [--compact-dir DIR] [--requests N]
+    python benchmark.py scoring [--urls N] [--vectorizer PATH --model PATH] [--compact-dir DIR]
+    python benchmark.py lexical [--urls N] [--nested]
+    python benchmark.py coalesce [--clients N] [--delay-ms D]
+    python benchmark.py admission [--rate R] [--duration S] [--deadline-ms D] [--service-ms M] [--cores N] [--queue-size N]
+    python benchmark.py imports [--module NAME] [--top N]
+    python benchmark.py coldstart [--runs N] [--budget-ms MS] [--path PATH]
+    python benchmark.py artifacts [--processes N]
+    python benchmark.py asgi [--workers N] [--expand-clients N] [--analyze-clients N] [--hops H] [--delay-ms D] [--duration S]
+
+`suite` is the hot-path regression benchmark: clean_url, getTokens, entropy and end-to-end /analyze
+(Flask test client) over a reproducible corpus, reporting ops/sec and p50/p95/p99 latency as JSON.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from collections import Counter
+
+import numpy as np
+
+from load_probe import load_profile
+from utils import clean_url, entropy, getTokens
+
+WORDS = ['login', 'secure', 'account', 'update', 'verify', 'paypal', 'bank', 'free', 'gift',
+         'docs', 'blog', 'news', 'static', 'cdn', 'img', 'user', 'profile', 'search', 'help',
+         'download', 'install', 'admin', 'cart', 'checkout', 'index', 'Home', 'WWW', 'COM']
+TLDS = ['com', 'net', 'org', 'io', 'co.uk', 'ru', 'cn', 'info', 'xyz', 'de']
+EXTS = ['', '.php', '.html', '.htm', '.exe', '.js', '.aspx']
+
+
+def legacy_getTokens(input):
+    """ The original quadratic getTokens, kept as the reference for the equivalence check """
+    try:
+        tokensBySlash = str(input).split('/')
+        allTokens = []
+        for i in tokensBySlash:
+            tokens = str(i).split('-')
+            tokensByDot = []
+            for j in range(0, len(tokens)):
+                tempTokens = str(tokens[j]).split('.')
+                tokensByDot = tokensByDot + tempTokens
+            allTokens = allTokens + tokens + tokensByDot
+        allTokens = list(set(allTokens))
+        common_tokens = ['com', 'www', 'http', 'https', 'org', 'net', 'io', 'co', 'uk', 'html', 'htm']
+        allTokens = [t.lower() for t in allTokens if t.lower() not in common_tokens and len(t) > 1]
+        return allTokens
+    except Exception as e:
+        print(f"Error tokenizing input {input}: {e}")
+        return []
+
+
+# --- Synthetic corpus ---
+
+def _rand_str(rng, n, alphabet=string.ascii_lowercase + string.digits):
+    return ''.join(rng.choice(alphabet) for _ in range(n))
+
+def _segment(rng):
+    parts = [rng.choice(WORDS + [_rand_str(rng, rng.randint(1, 10))]) for _ in range(rng.randint(1, 4))]
+    return rng.choice(['-', '.', '--', '-.']).join(parts) + rng.choice(EXTS)
+
+def synthetic_url(rng, kind, depth=None):
+    """ Builds one URL of the given kind: short, long, ip, punycode or nested """
+    scheme = rng.choice(['http://', 'https://', 'ftp://', ''])
+    www = rng.choice(['www.', ''])
+    if kind == 'ip':
+        host = '.'.join(str(rng.randint(0, 255)) for _ in range(4)) + rng.choice(['', ':8080'])
+    elif kind == 'punycode':
+        host = 'xn--' + _rand_str(rng, rng.randint(4, 12)) + '-' + _rand_str(rng, 3) + '.' + rng.choice(TLDS)
+    else:
+        host = '-'.join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))) + '.' + rng.choice(TLDS)
+    if kind == 'short':
+        n_segments = rng.randint(0, 1)
+    elif kind == 'long':
+        n_segments = rng.randint(6, 12)
+    elif kind == 'nested':
+        n_segments = depth if depth is not None else rng.randint(30, 120)
+    else:
+        n_segments = rng.randint(0, 5)
+    path = '/'.join(_segment(rng) for _ in range(n_segments))
+    query = ('?' + '&'.join(f"{rng.choice(WORDS)}={_rand_str(rng, 6)}" for _ in range(rng.randint(1, 4)))
+             if kind == 'long' else '')
+    return scheme + www + host + ('/' + path if path else '') + query + rng.choice(['', '/'])
+
+def synthetic_corpus(n, seed=42, kinds=('short', 'long', 'ip', 'punycode', 'nested')):
+    """ Reproducible mix of URL kinds (same seed -> same corpus) """
+    rng = random.Random(seed)
+    return [synthetic_url(rng, kinds[i % len(kinds)]) for i in range(n)]
+
+
+# --- Helpers ---
+
+def time_calls(fn, inputs, repeat=3):
+    """ Best-of-repeat wall time for calling fn over every input; returns (seconds, ops/sec) """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs: fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best, (len(inputs) / best if best else float('inf'))
+
+
+# --- Benchmarks ---
+
+def bench_tokenizer(n_urls, depth):
+    """ Checks getTokens against the legacy tokenizer, then times both on normal and deeply nested URLs """
+    edge_cases = ['', '/', '-', '.', '--..//', 'a-b.c/d', 'İSTANBUL.com/İ-x', 'ﬃ.example/ß-ẞ', 'COM.Www-HTTPS/net']
+    corpus = edge_cases + synthetic_corpus(n_urls)
+    mismatches = [u for u in corpus if Counter(getTokens(u)) != Counter(legacy_getTokens(u))]
+    print(f"Equivalence: {len(corpus) - len(mismatches)}/{len(corpus)} URLs produce identical tokens")
+    if mismatches:
+        print(f"First mismatch: {mismatches[0]!r}")
+        raise SystemExit(1)
+
+    rng = random.Random(7)
+    nested = [synthetic_url(rng, 'nested', depth=depth) for _ in range(200)]
+    for label, inputs in [('mixed corpus', corpus[:20000]), (f'nested (depth {depth})', nested)]:
+        _, legacy_ops = time_calls(legacy_getTokens, inputs)
+        _, new_ops = time_calls(getTokens, inputs)
+        print(f"{label:>22}: legacy {legacy_ops:>10.0f} ops/s | getTokens {new_ops:>10.0f} ops/s | "
+              f"speedup {new_ops / legacy_ops:.2f}x")
+
+def bench_load(vectorizer_path, model_path, compact_dir):
+    """ Compares cold load time and peak RSS of the pickled sklearn model vs the compact model """
+    runs = [('pickle (joblib)', ['pickle', vectorizer_path, model_path])]
+    if compact_dir: runs.append(('compact (mmap)', ['compact', compact_dir]))
+    for label, argv in runs:
+        result = load_profile(argv[0], [os.path.abspath(p) for p in argv[1:]])
+        print(f"{label:>16}: load {result['load_s'] * 1000:8.1f} ms | first score {result['first_score_s'] * 1000:7.2f} ms | "
+              f"peak RSS {result['max_rss_mb']:7.1f} MB")
+
+def bench_featurize(n_urls, jobs_list):
+    """ Serial TfidfVectorizer.fit_transform vs featurize.parallel_fit_transform.
+
+    Checks that every worker count gives a bit-identical result, that it matches the serial vectorizer
+    (same vocabulary, idf and sparsity, values within a few ulps: see featurize) and that the vectorizer
+    pickles to the same size (within 1%: only sklearn's private fit bookkeeping differs).
+    """
+    import pickle
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from featurize import parallel_fit_transform
+    from utils import clean_url
+
+    corpus = synthetic_corpus(n_urls)
+    start = time.perf_counter()
+    serial_vec = TfidfVectorizer(tokenizer=getTokens, token_pattern=None)
+    X_serial = serial_vec.fit_transform([clean_url(u) for u in corpus])
+    serial_s = time.perf_counter() - start
+    X_serial.sort_indices()
+    serial_bytes = len(pickle.dumps(serial_vec))
+    print(f"{'serial':>12}: {serial_s:7.2f}s ({n_urls / serial_s:,.0f} URLs/s), {len(serial_vec.vocabulary_)} features, "
+          f"{os.cpu_count()} CPUs, vectorizer pickle {serial_bytes:,} bytes")
+
+    first_X = None
+    for n_jobs in jobs_list:
+        start = time.perf_counter()
+        vec, X = parallel_fit_transform(corpus, n_jobs=n_jobs)
+        elapsed = time.perf_counter() - start
+        if first_X is None: first_X = X
+        deterministic = (X != first_X).nnz == 0
+        matches = (vec.vocabulary_ == serial_vec.vocabulary_ and np.array_equal(vec.idf_, serial_vec.idf_)
+                   and np.array_equal(X.indptr, X_serial.indptr) and np.array_equal(X.indices, X_serial.indices)
+                   and np.allclose(X.data, X_serial.data, rtol=1e-14, atol=0))
+        pickle_bytes = len(pickle.dumps(vec))
+        print(f"{f'{n_jobs} workers':>12}: {elapsed:7.2f}s ({n_urls / elapsed:,.0f} URLs/s), speedup {serial_s / elapsed:.2f}x, "
+              f"matches serial: {matches}, same as first run: {deterministic}, pickle {pickle_bytes:,} bytes")
+        if not (matches and deterministic and abs(pickle_bytes - serial_bytes) <= serial_bytes // 100): raise SystemExit(1)
+
+# --- Hot-path suite ---
+
+def latency_stats(samples_ns, wall_s):
+    """ ops/sec over wall time plus p50/p95/p99 of the per-call latencies (microseconds) """
+    ordered = sorted(samples_ns)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] / 1000.0
+    return {'n': len(ordered), 'ops_per_sec': len(ordered) / wall_s if wall_s else float('inf'),
+            'p50_us': pick(0.50), 'p95_us': pick(0.95), 'p99_us': pick(0.99)}
+
+def measure(fn, inputs, warmup=100):
+    """ Calls fn once per input, timing each call individually """
+    for item in inputs[:warmup]: fn(item)
+    samples = []
+    clock = time.perf_counter_ns
+    start = clock()
+    for item in inputs:
+        t0 = clock()
+        fn(item)
+        samples.append(clock() - t0)
+    return latency_stats(samples, (clock() - start) / 1e9)
+
+def fixture_model(n_urls=5000, seed=1):
+    """ Tiny TF-IDF + LogisticRegression trained on synthetic URLs labelled by a keyword rule """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    risky = {'login', 'secure', 'verify', 'paypal', 'free', 'gift', 'install', 'download'}
+    corpus = [clean_url(u) for u in synthetic_corpus(n_urls, seed=seed)]
+    labels = ['bad' if risky & set(getTokens(u.lower())) else 'good' for u in corpus]
+    vectorizer = TfidfVectorizer(tokenizer=getTokens, token_pattern=None)
+    lgs = LogisticRegression(max_iter=1000).fit(vectorizer.fit_transform(corpus), labels)
+    return vectorizer, lgs
+
+def load_server(model, vectorizer_path, model_path, compact_dir):
+    """ Imports AIserver without its background loader and installs the requested model """
+    os.environ['MODEL_AUTOLOAD'] = '0'
+    import AIserver
+    if model == 'fixture':
+        AIserver.install_models(*fixture_model())
+    elif model == 'pickle':
+        import joblib
+        AIserver.install_models(joblib.load(vectorizer_path), joblib.load(model_path))
+    else:
+        from compact import CompactModel
+        AIserver.install_models(new_compact=CompactModel(compact_dir))
+    return AIserver
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+def run_suite(n_urls, seed, model, vectorizer_path, model_path, compact_dir):
+    """ Runs every hot-path benchmark per URL kind and overall; returns the JSON-ready report """
+    kinds = ('short', 'long', 'ip', 'punycode', 'nested')
+    corpus = synthetic_corpus(n_urls, seed=seed, kinds=kinds)
+    by_kind = {kind: corpus[i::len(kinds)] for i, kind in enumerate(kinds)}
+    cleaned = {kind: [clean_url(u) for u in urls] for kind, urls in by_kind.items()}
+
+    server = load_server(model, vectorizer_path, model_path, compact_dir)
+    client = server.app.test_client()
+    def analyze(url):
+        response = client.post('/analyze', json={'url': url})
+        if response.status_code != 200: raise RuntimeError(f"/analyze returned {response.status_code} for {url!r}")
+
+    results = {}
+    for kind in kinds + ('all',):
+        raw = corpus if kind == 'all' else by_kind[kind]
+        clean = [c for k in kinds for c in cleaned[k]] if kind == 'all' else cleaned[kind]
+        results[f'clean_url[{kind}]'] = measure(clean_url, raw)
+        results[f'getTokens[{kind}]'] = measure(getTokens, clean)
+        results[f'entropy[{kind}]'] = measure(entropy, clean)
+        server.verdict_cache.clear()
+        results[f'analyze[{kind}]'] = measure(analyze, raw, warmup=0)
+    # Second pass over the same URLs: every /analyze is a verdict-cache hit
+    results['analyze_cached[all]'] = measure(analyze, corpus, warmup=0)
+
+    # Cost of the /metrics stage instrumentation for one uncached /analyze (~9 marks + finish)
+    from metrics import MetricsRegistry
+    registry = MetricsRegistry()
+    def instrumented(_):
+        timer = registry.stage_timer('bench')
+        for stage in ('parse_json', 'clean_url', 'cache_lookup', 'tokenize', 'predict',
+                      'entropy', 'getTokens', 'threat_report', 'serialize'):
+            timer.mark(stage)
+        timer.finish()
+    results['stage_timer[9 marks]'] = measure(instrumented, corpus)
+
+    return {
+        'meta': {'commit': _git_commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+                 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'n_urls': n_urls, 'seed': seed, 'model': model},
+        'results': results
+    }
+
+def print_report(report, baseline=None):
+    base = (baseline or {}).get('results', {})
+    print(f"{'benchmark':<26}{'ops/sec':>12}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}" + ('   vs baseline' if base else ''))
+    for name, r in report['results'].items():
+        line = f"{name:<26}{r['ops_per_sec']:>12,.0f}{r['p50_us']:>10.1f}{r['p95_us']:>10.1f}{r['p99_us']:>10.1f}"
+        if name in base and base[name]['ops_per_sec']:
+            line += f"   {(r['ops_per_sec'] / base[name]['ops_per_sec'] - 1) * 100:+6.1f}% ops/sec"
+        print(line)
+
+# --- Local redirect stub (expander benchmarks) ---
+
+class _RedirectHandler(BaseHTTPRequestHandler):
+    """ /hop/<n>?delay=<ms> redirects to /hop/<n-1> (same query) until /hop/0, which answers 200 """
+    protocol_version = 'HTTP/1.1' # keep-alive, so pooled clients can reuse connections
+
+    def do_HEAD(self):
+        parts = urlsplit(self.path)
+        delay_ms = float(parse_qs(parts.query).get('delay', ['0'])[0])
+        if delay_ms: time.sleep(delay_ms / 1000.0)
+        try: remaining = int(parts.path.rsplit('/', 1)[-1])
+        except ValueError: remaining = 0
+        self.server.connections.add(self.client_address)
+        if remaining > 0:
+            self.send_response(301)
+            self.send_header('Location', f"/hop/{remaining - 1}" + (f"?{parts.query}" if parts.query else ''))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_GET = do_HEAD
+
+    def log_message(self, *args):
+        pass
+
+def stub_redirect_server():
+    """ Starts the redirect stub on a free localhost port; returns (server, base_url) """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _RedirectHandler)
+    server.daemon_threads = True
+    server.connections = set() # distinct client (host, port) pairs = TCP connections opened
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def bench_expand(n_links, hops, delay_ms):
+    """ One fresh requests.head per link (old /api/expand) vs URLExpander.expand_many, cold and cached """
+    import requests
+    from expander import URLExpander
+
+    server, base = stub_redirect_server()
+    links = [f"{base}/hop/{hops}?id={i}&delay={delay_ms}" for i in range(n_links)]
+    try:
+        server.connections.clear()
+        start = time.perf_counter()
+        for link in links: requests.head(link, allow_redirects=True, timeout=7)
+        sequential_s, sequential_conns = time.perf_counter() - start, len(server.connections)
+
+        expander = URLExpander()
+        server.connections.clear()
+        start = time.perf_counter()
+        results = expander.expand_many(links)
+        cold_s, cold_conns = time.perf_counter() - start, len(server.connections)
+        errors = [r for r in results if 'error' in r or r['final_url'] != f"{base}/hop/0?id={r['url'].split('id=')[1]}"]
+        if errors: raise SystemExit(f"Expansion mismatch: {errors[0]}")
+        start = time.perf_counter()
+        expander.expand_many(links)
+        warm_s = time.perf_counter() - start
+        expander.close()
+    finally:
+        server.shutdown()
+
+    print(f"{n_links} links x {hops} redirects, {delay_ms} ms per hop:")
+    print(f"{'sequential requests.head':>26}: {sequential_s:7.3f}s ({n_links / sequential_s:8.1f} links/s), {sequential_conns} TCP connections")
+    print(f"{'expand_many (cold)':>26}: {cold_s:7.3f}s ({n_links / cold_s:8.1f} links/s), {cold_conns} TCP connections")
+    print(f"{'expand_many (cached)':>26}: {warm_s:7.3f}s ({n_links / warm_s:8.1f} links/s)")
+
+def traffic_mix(n_urls, trusted_domains, tail_hosts, seed=7):
+    """ Zipf(1) traffic over a ranked site population: the trusted domains (list order) are the most
+    popular sites, followed by tail_hosts long-tail sites built with synthetic_url """
+    rng = random.Random(seed)
+    population = len(trusted_domains) + tail_hosts
+    cum_weights = np.cumsum(1.0 / np.arange(1, population + 1)).tolist()
+    urls = []
+    for rank in rng.choices(range(population), cum_weights=cum_weights, k=n_urls):
+        if rank < len(trusted_domains):
+            host = rng.choice(['', 'www.', 'mail.', 'docs.', 'm.']) + trusted_domains[rank]
+            path = '/'.join(_segment(rng) for _ in range(rng.randint(0, 3)))
+            urls.append(rng.choice(['https://', 'http://', '']) + host + ('/' + path if path else ''))
+        else:
+            urls.append(synthetic_url(random.Random(rank), rng.choice(['short', 'long', 'ip', 'punycode'])))
+    return urls
+
+def bench_allowlist(n_urls, domains_path, tail_hosts):
+    """ /analyze on a popular + long-tail traffic mix, with and without the trusted-domain index """
+    import tempfile
+    from allowlist import DomainAllowlist, build_index, parse_domain_list
+    with open(domains_path, encoding='utf-8') as f:
+        entries = parse_domain_list(f)
+    trusted_domains = [d for d, trusted in entries.items() if trusted]
+    urls = traffic_mix(n_urls, trusted_domains, tail_hosts)
+
+    server = load_server('fixture', None, None, None)
+    client = server.app.test_client()
+    def analyze(url):
+        response = client.post('/analyze', json={'url': url})
+        if response.status_code != 200: raise RuntimeError(f"/analyze returned {response.status_code} for {url!r}")
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        build_index(entries, index_dir)
+        index_bytes = sum(os.path.getsize(os.path.join(index_dir, name)) for name in os.listdir(index_dir))
+        index = DomainAllowlist(index_dir)
+        hits = sum(index.match(clean_url(u)) for u in urls)
+        lookup = measure(index.match, [clean_url(u) for u in urls])
+        rows = {}
+        for label, active in (('model only', None), ('allowlist first', index)):
+            server.allowlist = active
+            server.verdict_cache.clear()
+            rows[label] = measure(analyze, urls, warmup=0)
+        server.allowlist = None
+
+    print(f"{n_urls} URLs, Zipf traffic over {len(trusted_domains)} trusted + {tail_hosts} long-tail sites")
+    print(f"index: {index.size} entries, {index_bytes / 1024:.1f} KiB on disk; hit rate {hits / n_urls:.1%}")
+    print(f"{'allowlist.match':>18}: p50 {lookup['p50_us']:7.1f}us  p99 {lookup['p99_us']:7.1f}us")
+    for label, stats in rows.items():
+        print(f"{label:>18}: {stats['ops_per_sec']:8.0f} req/s  p50 {stats['p50_us']:7.1f}us  p99 {stats['p99_us']:7.1f}us")
+
+def bench_scoring(n_urls, vectorizer_path, model_path, compact_dir):
+    """ TokenScorer parity with sklearn, then tokenize-twice (transform + threat report) vs tokenize-once scoring """
+    from compact import CompactModel
+    from token_scoring import TokenScorer, check_parity
+    from utils import HIGH_RISK_TOKENS
+    urls = [clean_url(u) for u in synthetic_corpus(n_urls, seed=3)]
+    models = {'fixture': fixture_model()}
+    if vectorizer_path and os.path.exists(vectorizer_path) and os.path.exists(model_path):
+        import joblib
+        models['pickle'] = (joblib.load(vectorizer_path), joblib.load(model_path))
+    for label, (vectorizer, lgs) in models.items():
+        print(f"{label:>8}: max |decision diff| vs sklearn {check_parity(TokenScorer.for_model(vectorizer, lgs), vectorizer, lgs, urls):.2e}")
+    if compact_dir:
+        compact = CompactModel(compact_dir)
+        scorer = TokenScorer.for_model(compact=compact)
+        diffs = [label != expected for label, expected in
+                 zip((scorer.score(scorer.tokenize(u))[0] for u in urls), compact.predict(urls))]
+        print(f"{'compact':>8}: {sum(diffs)} label mismatches vs CompactModel.predict over {len(urls)} URLs")
+
+    vectorizer, lgs = models.get('pickle', models['fixture'])
+    def twice(url):
+        label = lgs.predict(vectorizer.transform([url]))[0]
+        return label, [t for t in getTokens(url) if t in HIGH_RISK_TOKENS]
+    scorer = TokenScorer.for_model(vectorizer, lgs)
+    def once(url):
+        tokens = scorer.tokenize(url)
+        label, contributions = scorer.score(tokens)
+        return label, [t for t in tokens if t in HIGH_RISK_TOKENS], contributions[:3]
+    for label, fn in (('transform + getTokens', twice), ('TokenScorer', once)):
+        stats = measure(fn, urls)
+        print(f"{label:>22}: {stats['ops_per_sec']:9.0f} URLs/s  p50 {stats['p50_us']:7.1f}us  p99 {stats['p99_us']:7.1f}us")
+
+def bench_lexical(n_urls, nested):
+    """ Batch entropy / lexical features vs the per-URL Python loop; the entropies must be identical """
+    from lexical import FEATURE_NAMES, batch_entropy, lexical_features
+    kinds = ('short', 'long', 'ip', 'punycode') + (('nested',) if nested else ())
+    edge_cases = ['', 'a', 'İSTANBUL.com/İ-x', 'ﬃ.example/ß-ẞ', 'xn--80ak6aa92e.com/😀😀']
+    urls = edge_cases + [clean_url(u) for u in synthetic_corpus(n_urls, kinds=kinds)]
+    print(f"{len(urls)} URLs, mean length {np.mean([len(u) for u in urls]):.1f} chars")
+
+    start = time.perf_counter()
+    expected = np.array([entropy(u) for u in urls])
+    loop_s = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = batch_entropy(urls)
+    batch_s = time.perf_counter() - start
+    mismatches = int(np.sum(expected.view(np.int64) != actual.view(np.int64))) # bitwise, including -0.0
+    print(f"Equivalence: {len(urls) - mismatches}/{len(urls)} entropies bit-identical to utils.entropy")
+    if mismatches: raise SystemExit(1)
+
+    start = time.perf_counter()
+    lexical_features(urls)
+    features_s = time.perf_counter() - start
+    for label, seconds in (('utils.entropy loop', loop_s), ('batch_entropy', batch_s),
+                           (f'lexical_features ({len(FEATURE_NAMES)})', features_s)):
+        print(f"{label:>22}: {len(urls) / seconds:>12,.0f} URLs/s  ({seconds:.2f}s)")
+
+def bench_coalesce(n_clients, delay_ms):
+    """ Fires n_clients identical /analyze requests at once; exactly one model evaluation may run """
+    server = load_server('fixture', None, None, None)
+    evaluations = []
+    score_tokenized = server.score_tokenized
+    def slow_score(*args, **kwargs):
+        evaluations.append(threading.get_ident())
+        time.sleep(delay_ms / 1000.0) # keep the first evaluation in flight while the others arrive
+        return score_tokenized(*args, **kwargs)
+    server.score_tokenized = slow_score
+    server.verdict_cache.clear()
+    before = server.analyze_flight.stats()
+
+    barrier = threading.Barrier(n_clients)
+    responses = [None] * n_clients
+    def client(i):
+        test_client = server.app.test_client()
+        barrier.wait()
+        # Variants that clean to the same URL share the flight too
+        url = ['http://login-verify.example.ru/account.php', 'https://www.login-verify.example.ru/account.php/'][i % 2]
+        responses[i] = test_client.post('/analyze', json={'url': url})
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(n_clients)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - started
+    server.score_tokenized = score_tokenized
+
+    after = server.analyze_flight.stats()
+    computed, coalesced = after['computed'] - before['computed'], after['coalesced'] - before['coalesced']
+    statuses = Counter(r.status_code for r in responses)
+    verdicts = {json.dumps(dict(r.get_json(), url=None), sort_keys=True) for r in responses}
+    print(f"{n_clients} concurrent requests in {elapsed * 1000:.0f} ms: statuses {dict(statuses)}, "
+          f"model evaluations {len(evaluations)}, computed {computed}, coalesced {coalesced}, distinct verdicts {len(verdicts)}")
+    if len(evaluations) != 1 or computed != 1 or coalesced != n_clients - 1 or statuses != {200: n_clients} or len(verdicts) != 1:
+        print("FAIL: identical concurrent requests were not coalesced into one evaluation")
+        raise SystemExit(1)
+    print("OK: one evaluation, every request got its verdict")
+
+def bench_admission(rate, duration, deadline_ms, service_ms, cores, queue_size):
+    """ Open-loop overload of /analyze: requests arrive at rate/s, each with an X-Deadline-Ms budget, while the model
+    is a simulated CPU (cores slots of service_ms each). Without admission control every request is queued and
+    scored, however late; with it, requests that cannot be answered in time are shed before any model work """
+    from admission import AdmissionController
+    server = load_server('fixture', None, None, None)
+    score_tokenized = server.score_tokenized
+    cpu = threading.Semaphore(cores)
+    evaluations = []
+    def slow_score(*args, **kwargs):
+        with cpu:
+            time.sleep(service_ms / 1000.0)
+            result = score_tokenized(*args, **kwargs)
+        evaluations.append(time.perf_counter())
+        return result
+    server.score_tokenized = slow_score
+    corpus = synthetic_corpus(int(rate * duration) + 1, seed=11)
+    print(f"{rate:.0f} req/s offered for {duration:.0f}s against {cores / service_ms * 1000:.0f} req/s of capacity "
+          f"({cores} x {service_ms:.0f} ms), deadline {deadline_ms:.0f} ms")
+    print(f"{'admission':>9} | {'in time':>7} {'late':>5} {'shed':>5} {'other':>5} | {'goodput/s':>9} {'p50 ms':>7} {'p99 ms':>7} | "
+          f"{'evaluations':>11} {'wasted':>6} | Retry-After")
+    for label, admission in (('off', None), ('on', AdmissionController(cores, queue_size))):
+        server.admission = admission
+        server.verdict_cache.clear()
+        evaluations.clear()
+        results = []
+        def client(url):
+            sent = time.perf_counter()
+            response = server.app.test_client().post('/analyze', json={'url': url}, headers={'X-Deadline-Ms': str(deadline_ms)})
+            results.append((response.status_code, time.perf_counter() - sent, response.headers.get('Retry-After'), sent))
+        threads = []
+        started = time.perf_counter()
+        for i, url in enumerate(corpus[:int(rate * duration)]):
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0: time.sleep(delay)
+            threads.append(threading.Thread(target=client, args=(url + f'?n={i}',)))
+            threads[-1].start()
+        for t in threads: t.join()
+        in_time = sorted(elapsed for status, elapsed, _, _ in results if status == 200 and elapsed <= deadline_ms / 1000.0)
+        late = [sent + elapsed for status, elapsed, _, sent in results if status == 200 and elapsed > deadline_ms / 1000.0]
+        shed = Counter(status for status, *_ in results if status in (429, 503))
+        other = sum(1 for status, *_ in results if status not in (200, 429, 503))
+        retry_after = Counter(value for status, _, value, _ in results if status in (429, 503))
+        pct = lambda q: in_time[min(len(in_time) - 1, int(q * len(in_time)))] * 1000 if in_time else float('nan')
+        print(f"{label:>9} | {len(in_time):>7} {len(late):>5} {sum(shed.values()):>5} {other:>5} | {len(in_time) / duration:>9.1f} "
+              f"{pct(0.5):>7.1f} {pct(0.99):>7.1f} | {len(evaluations):>11} {len(late):>6} | "
+              f"{dict(shed)} {dict(sorted(retry_after.items()))}")
+    server.score_tokenized = score_tokenized
+
+def import_profile(module='AIserver', env_extra=None):
+    """ -X importtime of `import module` in a fresh interpreter: [(cumulative us, self us, depth, name)] in import order """
+    env = dict(os.environ, MODEL_AUTOLOAD='0', **(env_extra or {}))
+    repo = os.path.dirname(os.path.abspath(__file__))
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=repo, env=env,
+                         capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line: continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), (len(name) - len(name.lstrip())) // 2, name.strip()))
+    return rows
+
+def bench_imports(module, top):
+    """ Where `import module` spends its time: the heaviest direct imports and the heaviest top-level packages """
+    rows = import_profile(module)
+    total = next((cumulative for cumulative, _, depth, name in rows if name == module and depth == 0), sum(r[1] for r in rows))
+    by_package = Counter()
+    for _, self_us, _, name in rows: by_package[name.split('.')[0]] += self_us
+    print(f"import {module}: {total / 1000:.1f} ms ({len(rows)} modules)")
+    print(f"\n{'direct import':>34} {'cumulative ms':>14}")
+    direct = sorted(((c, n) for c, _, depth, n in rows if depth == 1), reverse=True)
+    for cumulative, name in direct[:top]: print(f"{name:>34} {cumulative / 1000:>14.1f}")
+    print(f"\n{'package (all its modules)':>34} {'self ms':>14}")
+    for name, self_us in by_package.most_common(top): print(f"{name:>34} {self_us / 1000:>14.1f}")
+
+COLDSTART_PROBE = """
+import os, sys, time
+started = time.perf_counter()
+import AIserver
+imported = time.perf_counter()
+response = AIserver.app.test_client().get(sys.argv[1])
+done = time.perf_counter()
+print(response.status_code, imported - started, done - imported, len(sys.modules), flush=True)
+os._exit(0)
+"""
+
+def bench_coldstart(runs, budget_ms, path, env_extra=None):
+    """ Time to first response for `path` in fresh interpreters (interpreter start + import AIserver + first
+    request); fails when the median exceeds budget_ms """
+    env = {k: v for k, v in os.environ.items() if k not in ('MODEL_PRELOAD', 'MODEL_LOAD_SYNC')}
+    env.update(env_extra or {})
+    repo = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', COLDSTART_PROBE, path], cwd=repo, env=env, capture_output=True, text=True)
+        wall = time.perf_counter() - t0
+        fields = out.stdout.strip().splitlines()[-1].split() if out.stdout.strip() else []
+        if len(fields) != 4 or fields[0] != '200': raise RuntimeError(f"cold-start probe failed: {out.stdout[-500:]} {out.stderr[-2000:]}")
+        samples.append((wall, float(fields[1]), float(fields[2]), int(fields[3])))
+    wall, imported, first, modules = (sorted(column)[len(column) // 2] for column in zip(*samples))
+    print(f"GET {path} cold start, median of {runs}: {wall * 1000:.0f} ms to first response "
+          f"(import AIserver {imported * 1000:.0f} ms, first request {first * 1000:.0f} ms, {modules} modules loaded)")
+    if budget_ms and wall * 1000 > budget_ms:
+        print(f"FAIL: time to first response {wall * 1000:.0f} ms exceeds the {budget_ms:.0f} ms budget")
+        raise SystemExit(1)
+    if budget_ms: print(f"OK: within the {budget_ms:.0f} ms budget")
+    return wall
+
+class _ArtifactHandler(BaseHTTPRequestHandler):
+    """ Serves files from server.root, counting GETs; with server.truncate set, bodies stop halfway """
+
+    def do_GET(self):
+        path = os.path.join(self.server.root, os.path.basename(urlsplit(self.path).path))
+        if not os.path.exists(path): return self.send_error(404)
+        with open(path, 'rb') as f: body = f.read()
+        with self.server.lock: self.server.gets += 1
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[:len(body) // 2] if self.server.truncate else body)
+        if self.server.truncate: self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+def serve_artifacts(root, vectorizer_path=None, model_path=None):
+    """ Serves vectorizer.pkl + model.pkl (the given pickles, else the fixture model) from a local HTTP server;
+    returns (server, env) where env points AIserver's downloads at it with an empty cache under root """
+    import joblib
+    import shutil
+    served = os.path.join(root, 'served')
+    os.makedirs(served, exist_ok=True)
+    if vectorizer_path and model_path:
+        shutil.copyfile(vectorizer_path, os.path.join(served, 'vectorizer.pkl'))
+        shutil.copyfile(model_path, os.path.join(served, 'model.pkl'))
+    else:
+        vectorizer, lgs = fixture_model()
+        joblib.dump(vectorizer, os.path.join(served, 'vectorizer.pkl'))
+        joblib.dump(lgs, os.path.join(served, 'model.pkl'))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _ArtifactHandler)
+    server.daemon_threads, server.root, server.gets, server.truncate, server.lock = True, served, 0, False, threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    return server, {'ARTIFACT_CACHE_DIR': os.path.join(root, 'cache'), 'MODEL_URL': f'{base}/model.pkl',
+                    'VECTORIZER_URL': f'{base}/vectorizer.pkl'}
+
+ARTIFACT_PROBE = """
+import json, os
+os.environ['MODEL_AUTOLOAD'] = '0'
+import AIserver
+ok = AIserver.load_models()
+model = AIserver.active_model
+print(json.dumps({'ok': ok, 'timings': AIserver.model_status['timings'], 'error': AIserver.model_status['error'],
+                  'mmap': ok and type(model.lgs.coef_).__name__ == 'memmap'}), flush=True)
+os._exit(0)
+"""
+
+def bench_artifacts(n_processes):
+    """ Content-addressed artifact cache: simultaneous cold starts download once, warm starts never download,
+    corrupt objects are replaced and truncated downloads are rejected """
+    import tempfile
+    repo = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as root:
+        server, artifact_env = serve_artifacts(root)
+        cache = artifact_env['ARTIFACT_CACHE_DIR']
+        env = {k: v for k, v in os.environ.items() if k not in ('MODEL_PRELOAD', 'MODEL_LOAD_SYNC', 'MODEL_STORE_DIR', 'COMPACT_MODEL_DIR')}
+        env.update(artifact_env)
+
+        def start(n, label):
+            """ n processes loading the model at the same moment; returns (their results, downloads served) """
+            before = server.gets
+            procs = [subprocess.Popen([sys.executable, '-c', ARTIFACT_PROBE], cwd=repo, env=env, stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL, text=True) for _ in range(n)]
+            results = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in procs]
+            fetch_ms = np.median([r['timings'].get('fetch_s', float('nan')) for r in results]) * 1000
+            print(f"{label:>26}: {n} processes, {sum(r['ok'] for r in results)} ready, {server.gets - before} downloads, "
+                  f"median fetch+verify {fetch_ms:.1f} ms, arrays mmapped: {all(r['mmap'] for r in results if r['ok'])}")
+            return results, server.gets - before
+
+        _, cold = start(n_processes, 'cold start (empty cache)')
+        _, warm = start(n_processes, 'warm start')
+        objects = os.path.join(cache, 'objects')
+        victim = os.path.join(objects, max(os.listdir(objects), key=lambda name: os.path.getsize(os.path.join(objects, name))))
+        os.chmod(victim, 0o644)
+        with open(victim, 'r+b') as f:
+            f.seek(100)
+            f.write(b'corrupt')
+        corrupt_results, corrupt = start(1, 'corrupted object on disk')
+        server.truncate = True
+        env['ARTIFACT_CACHE_DIR'] = truncated_cache = os.path.join(root, 'cache-truncated')
+        truncated_results, _ = start(1, 'truncated download')
+        stored = [name for name in os.listdir(os.path.join(truncated_cache, 'objects')) if not name.startswith('.')]
+        print(f"{'':>26}  {truncated_results[0]['error']}; objects stored: {len(stored)}")
+        server.shutdown()
+    if cold != 2 or warm != 0 or corrupt != 1 or not corrupt_results[0]['ok'] or truncated_results[0]['ok'] or stored:
+        print("FAIL: the artifact cache downloaded more than once, re-downloaded on a warm start or kept a bad file")
+        raise SystemExit(1)
+    print("OK: one download per artifact, none on warm starts, corrupt and truncated files never loaded")
+
+def _memory_kb(pid):
+    """ Rss / Pss / private (USS) of one process in kB, from /proc/<pid>/smaps_rollup """
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, rest = line.partition(':')
+            if rest.strip().endswith('kB'): fields[key] = int(rest.split()[0])
+    return {'rss': fields['Rss'], 'pss': fields['Pss'], 'uss': fields['Private_Clean'] + fields['Private_Dirty']}
+
+def _child_pids(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit(): continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                if int(f.read().rsplit(')', 1)[1].split()[1]) == pid: children.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            pass
+    return children
+
+def _post_json(port, path, payload, timeout=60):
+    """ (status, decoded JSON body) of one POST to the local server """
+    import urllib.error
+    import urllib.request
+    req = urllib.request.Request(f'http://127.0.0.1:{port}{path}', data=json.dumps(payload).encode(),
+                                 headers={'Content-Type': 'application/json'})
+    def decode(raw):
+        try: return json.loads(raw)
+        except ValueError: return None
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response: return response.status, decode(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, decode(e.read())
+
+def cors_probe(port, base):
+    """ {request: CORS response headers} for the natively served ASGI routes, incl. preflight and the NDJSON stream """
+    import http.client
+    origin = {'Origin': 'chrome-extension://abcdefghijklmnop'}
+    probes = [('POST /api/expand', 'POST', '/api/expand', {}, origin),
+              ('POST /api/expand (no Origin)', 'POST', '/api/expand', {}, {}),
+              ('POST /api/expand_batch', 'POST', '/api/expand_batch', {'urls': [f'{base}/hop/1']}, origin),
+              ('POST /api/expand_and_score (stream)', 'POST', '/api/expand_and_score', {'url': f'{base}/hop/1'}, origin),
+              ('OPTIONS /api/expand (preflight)', 'OPTIONS', '/api/expand', None,
+               dict(origin, **{'Access-Control-Request-Method': 'POST', 'Access-Control-Request-Headers': 'content-type'}))]
+    seen = {}
+    for label, method, path, payload, headers in probes:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        body = None if payload is None else json.dumps(payload)
+        conn.request(method, path, body=body, headers=dict(headers, **({'Content-Type': 'application/json'} if body else {})))
+        response = conn.getresponse()
+        response.read()
+        seen[label] = sorted((k.lower(), v) for k, v in response.getheaders() if k.lower().startswith('access-control-') or k.lower() == 'vary')
+        conn.close()
+    return seen
+
+def start_gunicorn(n_workers, env_extra, app='AIserver:app', extra_args=()):
+    """ Starts gunicorn -c gunicorn.conf.py on a free port and waits until every worker answers /analyze;
+    returns (process, port) """
+    import socket
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    env = {k: v for k, v in os.environ.items() if k not in ('MODEL_PRELOAD', 'MODEL_AUTOLOAD')}
+    env.update(env_extra, WEB_CONCURRENCY=str(n_workers), MODEL_LOAD_SYNC='1')
+    repo = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{port}', *extra_args, app],
+                            cwd=repo, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 300
+    while True:
+        if proc.poll() is not None: raise RuntimeError("gunicorn exited during start-up")
+        if time.time() > deadline:
+            proc.terminate()
+            raise RuntimeError("gunicorn did not become ready")
+        try:
+            if len(_child_pids(proc.pid)) == n_workers and _post_json(port, '/analyze', {'url': 'example.com'})[0] == 200:
+                return proc, port
+        except OSError:
+            pass
+        time.sleep(0.5)
+
+def gunicorn_memory(n_workers, preload, env_extra, n_requests):
+    """ Starts gunicorn -c gunicorn.conf.py, sends n_requests /analyze calls, returns per-process memory """
+    from concurrent.futures import ThreadPoolExecutor
+    proc, port = start_gunicorn(n_workers, dict(env_extra, GUNICORN_PRELOAD='1' if preload else '0'))
+    analyze = lambda url: _post_json(port, '/analyze', {'url': url})[0]
+    try:
+        with ThreadPoolExecutor(max_workers=n_workers * 2) as pool:
+            statuses = list(pool.map(analyze, synthetic_corpus(n_requests, seed=3)))
+        if any(status != 200 for status in statuses): raise RuntimeError("/analyze failed under gunicorn")
+        return _memory_kb(proc.pid), [_memory_kb(pid) for pid in _child_pids(proc.pid)]
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+def bench_asgi(n_workers, expand_clients, analyze_clients, hops, delay_ms, duration):
+    """ Mixed load against gunicorn's sync worker vs the ASGI mode: expand_clients keep calling /api/expand on
+    slow redirect chains from the local stub while analyze_clients call /analyze; reports both routes and
+    checks that the natively served routes send the same CORS headers as the Flask app """
+    import tempfile
+    from compact import export_compact
+    stub, base = stub_redirect_server()
+    corpus = synthetic_corpus(5000, seed=5)
+    modes = [('sync', 'AIserver:app', ()), ('asgi', 'asgi:app', ('-k', 'asgi'))]
+    print(f"{n_workers} workers; {expand_clients} clients on /api/expand ({hops} hops x {delay_ms:.0f} ms), "
+          f"{analyze_clients} clients on /analyze, {duration:.0f}s per mode")
+    print(f"{'mode':>6} | {'/analyze req/s':>14} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6} | {'/api/expand req/s':>17} {'p99 ms':>8} {'errors':>6}")
+    cors = {}
+    with tempfile.TemporaryDirectory() as compact_dir:
+        export_compact(*fixture_model(), compact_dir)
+        for label, app, args in modes:
+            proc, port = start_gunicorn(n_workers, {'COMPACT_MODEL_DIR': compact_dir}, app, args)
+            cors[label] = cors_probe(port, base)
+            samples = {'analyze': [], 'expand': []}
+            errors = Counter()
+            stop_at = time.perf_counter() + duration
+            def client(route, n):
+                i = 0
+                while time.perf_counter() < stop_at:
+                    if route == 'analyze': path, payload = '/analyze', {'url': corpus[(n * 7919 + i) % len(corpus)]}
+                    else: path, payload = '/api/expand', {'url': f"{base}/hop/{hops}?id={label}-{n}-{i}&delay={delay_ms}"}
+                    t0 = time.perf_counter()
+                    try:
+                        status, _ = _post_json(port, path, payload, timeout=30)
+                    except OSError:
+                        status = 'timeout'
+                    if status == 200: samples[route].append(time.perf_counter() - t0)
+                    else: errors[route] += 1
+                    i += 1
+            threads = [threading.Thread(target=client, args=('expand', n)) for n in range(expand_clients)]
+            threads += [threading.Thread(target=client, args=('analyze', n)) for n in range(analyze_clients)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+            proc.terminate()
+            proc.wait(timeout=30)
+            stats = {}
+            for route, values in samples.items():
+                ordered = sorted(values) or [float('nan')]
+                stats[route] = (len(values) / duration, ordered[len(ordered) // 2] * 1000, ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))] * 1000)
+            print(f"{label:>6} | {stats['analyze'][0]:>14.1f} {stats['analyze'][1]:>8.1f} {stats['analyze'][2]:>8.1f} {errors['analyze']:>6} | "
+                  f"{stats['expand'][0]:>17.1f} {stats['expand'][2]:>8.1f} {errors['expand']:>6}")
+    stub.shutdown()
+    mismatched = [probe for probe in cors['sync'] if cors['sync'][probe] != cors['asgi'][probe] or not cors['sync'][probe]]
+    for probe in mismatched: print(f"CORS mismatch on {probe}: sync {cors['sync'][probe]} vs asgi {cors['asgi'][probe]}")
+    if mismatched: raise SystemExit(1)
+    print(f"OK: same CORS headers in both modes ({len(cors['sync'])} requests, incl. preflight and NDJSON stream)")
+
+def bench_workers(worker_counts, compact_dir, n_requests, vectorizer_path, model_path):
+    """ Memory of N gunicorn workers with and without preload: how much each extra worker costs """
+    import shutil
+    import tempfile
+    artifacts_root = tempfile.mkdtemp()
+    have_pickles = os.path.exists(vectorizer_path) and os.path.exists(model_path)
+    server, pickle_env = serve_artifacts(artifacts_root, *((vectorizer_path, model_path) if have_pickles else ()))
+    configs = [('pickle, no preload', False, pickle_env), ('pickle, preload', True, pickle_env)]
+    if compact_dir:
+        configs += [('compact, no preload', False, {'COMPACT_MODEL_DIR': os.path.abspath(compact_dir)}),
+                    ('compact, preload', True, {'COMPACT_MODEL_DIR': os.path.abspath(compact_dir)})]
+    print(f"{'config':>20} {'workers':>7} | {'worker RSS':>10} {'worker USS':>10} | {'total PSS':>10} | per extra worker (PSS)")
+    for label, preload, env_extra in configs:
+        totals = {}
+        for n_workers in worker_counts:
+            master, workers = gunicorn_memory(n_workers, preload, env_extra, n_requests)
+            totals[n_workers] = (master['pss'] + sum(w['pss'] for w in workers)) / 1024
+            extra = ''
+            if len(totals) > 1:
+                first = min(totals)
+                extra = f"{(totals[n_workers] - totals[first]) / (n_workers - first):8.1f} MB"
+            print(f"{label:>20} {n_workers:>7} | {np.mean([w['rss'] for w in workers]) / 1024:7.1f} MB "
+                  f"{np.mean([w['uss'] for w in workers]) / 1024:7.1f} MB | {totals[n_workers]:7.1f} MB | {extra}")
+    server.shutdown()
+    shutil.rmtree(artifacts_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SafeLink AI benchmarks")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_tok = sub.add_parser('tokenizer', help="getTokens equivalence check + microbenchmark")
+    p_tok.add_argument('--urls', type=int, default=100000, help="synthetic URLs for the equivalence check")
+    p_tok.add_argument('--depth', type=int, default=500, help="path segments in the nested-URL benchmark")
+    p_load = sub.add_parser('load', help="cold load time + RSS: pickles vs compact model")
+    p_load.add_argument('--vectorizer', default='vectorizer.pkl')
+    p_load.add_argument('--model', default='model.pkl')
+    p_load.add_argument('--compact-dir', default=None)
+    p_feat = sub.add_parser('featurize', help="serial vs parallel tf-idf feature extraction")
+    p_feat.add_argument('--urls', type=int, default=200000)
+    p_feat.add_argument('--jobs', type=int, nargs='+', default=[2, 4, 8])
+    p_suite = sub.add_parser('suite', help="hot-path suite: clean_url, getTokens, entropy, /analyze")
+    p_suite.add_argument('--urls', type=int, default=5000)
+    p_suite.add_argument('--seed', type=int, default=42)
+    p_suite.add_argument('--model', choices=['fixture', 'pickle', 'compact'], default='fixture')
+    p_suite.add_argument('--vectorizer', default='vectorizer.pkl')
+    p_suite.add_argument('--model-path', default='model.pkl')
+    p_suite.add_argument('--compact-dir', default=None)
+    p_suite.add_argument('--json', default=None, help="write the machine-readable report here")
+    p_suite.add_argument('--compare', default=None, help="baseline JSON from an earlier run")
+    p_exp = sub.add_parser('expand', help="short-link expansion against a local redirect stub")
+    p_exp.add_argument('--links', type=int, default=200)
+    p_exp.add_argument('--hops', type=int, default=3)
+    p_exp.add_argument('--delay-ms', type=float, default=10)
+    p_allow = sub.add_parser('allowlist', help="trusted-domain index hit rate + /analyze latency")
+    p_allow.add_argument('--urls', type=int, default=20000)
+    p_allow.add_argument('--domains', default='trusted_domains.txt')
+    p_allow.add_argument('--tail-hosts', type=int, default=50000, help="long-tail sites ranked after the trusted ones")
+    p_workers = sub.add_parser('workers', help="gunicorn memory per worker, with and without preload")
+    p_workers.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    p_workers.add_argument('--compact-dir', default=None, help="also measure the mmap compact model")
+    p_workers.add_argument('--requests', type=int, default=400, help="/analyze calls spread over the workers first")
+    p_workers.add_argument('--vectorizer', default='vectorizer.pkl', help="pickles served to the workers (default: fixture model)")
+    p_workers.add_argument('--model', default='model.pkl')
+    p_score = sub.add_parser('scoring', help="single-pass TokenScorer: sklearn parity + per-URL scoring cost")
+    p_score.add_argument('--urls', type=int, default=20000)
+    p_score.add_argument('--vectorizer', default='vectorizer.pkl')
+    p_score.add_argument('--model', default='model.pkl')
+    p_score.add_argument('--compact-dir', default=None)
+    p_lex = sub.add_parser('lexical', help="vectorized entropy + lexical features vs the per-URL loop")
+    p_lex.add_argument('--urls', type=int, default=1000000)
+    p_lex.add_argument('--nested', action='store_true', help="include the deeply nested URL kind (much longer URLs)")
+    p_coal = sub.add_parser('coalesce', help="concurrency check: identical /analyze requests share one evaluation")
+    p_coal.add_argument('--clients', type=int, default=64)
+    p_coal.add_argument('--delay-ms', type=float, default=200, help="artificial model latency")
+    p_adm = sub.add_parser('admission', help="/analyze overload with client deadlines, with and without admission control")
+    p_adm.add_argument('--rate', type=float, default=200, help="offered requests per second")
+    p_adm.add_argument('--duration', type=float, default=5)
+    p_adm.add_argument('--deadline-ms', type=float, default=500, help="X-Deadline-Ms sent with every request")
+    p_adm.add_argument('--service-ms', type=float, default=20, help="simulated model time per request")
+    p_adm.add_argument('--cores', type=int, default=2, help="simulated model concurrency")
+    p_adm.add_argument('--queue-size', type=int, default=64)
+    p_imp = sub.add_parser('imports', help="-X importtime profile of a module: heaviest imports and packages")
+    p_imp.add_argument('--module', default='AIserver')
+    p_imp.add_argument('--top', type=int, default=15)
+    p_cold = sub.add_parser('coldstart', help="time to first response in a fresh process, checked against a budget")
+    p_cold.add_argument('--runs', type=int, default=5)
+    p_cold.add_argument('--budget-ms', type=float, default=300, help="fail when the median exceeds this (0 = report only)")
+    p_cold.add_argument('--path', default='/')
+    p_cold.add_argument('--no-model', action='store_true', help="MODEL_AUTOLOAD=0: no background model load during the probe")
+    p_art = sub.add_parser('artifacts', help="artifact cache: concurrent cold starts, warm starts, corrupt/truncated files")
+    p_art.add_argument('--processes', type=int, default=4, help="processes starting at the same time")
+    p_asgi = sub.add_parser('asgi', help="sync vs ASGI gunicorn under slow /api/expand + /analyze load")
+    p_asgi.add_argument('--workers', type=int, default=2)
+    p_asgi.add_argument('--expand-clients', type=int, default=16)
+    p_asgi.add_argument('--analyze-clients', type=int, default=4)
+    p_asgi.add_argument('--hops', type=int, default=2)
+    p_asgi.add_argument('--delay-ms', type=float, default=500, help="stub latency per redirect hop")
+    p_asgi.add_argument('--duration', type=float, default=20)
+    args = parser.parse_args()
+
+    if args.command == 'tokenizer':
+        bench_tokenizer(args.urls, args.depth)
+    elif args.command == 'load':
+        bench_load(args.vectorizer, args.model, args.compact_dir)
+    elif args.command == 'featurize':
+        bench_featurize(args.urls, args.jobs)
+    elif args.command == 'expand':
+        bench_expand(args.links, args.hops, args.delay_ms)
+    elif args.command == 'allowlist':
+        bench_allowlist(args.urls, args.domains, args.tail_hosts)
+    elif args.command == 'workers':
+        bench_workers(args.workers, args.compact_dir, args.requests, args.vectorizer, args.model)
+    elif args.command == 'scoring':
+        bench_scoring(args.urls, args.vectorizer, args.model, args.compact_dir)
+    elif args.command == 'lexical':
+        bench_lexical(args.urls, args.nested)
+    elif args.command == 'coalesce':
+        bench_coalesce(args.clients, args.delay_ms)
+    elif args.command == 'admission':
+        bench_admission(args.rate, args.duration, args.deadline_ms, args.service_ms, args.cores, args.queue_size)
+    elif args.command == 'imports':
+        bench_imports(args.module, args.top)
+    elif args.command == 'coldstart':
+        bench_coldstart(args.runs, args.budget_ms, args.path, {'MODEL_AUTOLOAD': '0'} if args.no_model else None)
+    elif args.command == 'artifacts':
+        bench_artifacts(args.processes)
+    elif args.command == 'asgi':
+        bench_asgi(args.workers, args.expand_clients, args.analyze_clients, args.hops, args.delay_ms, args.duration)
+    elif args.command == 'suite':
+        report = run_suite(args.urls, args.seed, args.model, args.vectorizer, args.model_path, args.compact_dir)
+        baseline = None
+        if args.compare:
+            with open(args.compare) as f: baseline = json.load(f)
+        print_report(report, baseline)
+        if args.json:
+            with open(args.json, 'w') as f: json.dump(report, f, indent=2)
+            print(f"Report written to {args.json}")
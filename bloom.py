@@ -0,0 +1,107 @@
+"""
+Bloom filter of known-malicious URLs and hosts from the training corpus.
+
+Written by `python train.py --blocklist-dir DIR` and memory-mapped by the server, which checks it in
+O(1) (k bit probes) before running the model. Keys are 'u:' + clean_url(url) for exact URLs and
+'h:' + host for hosts that only ever appear with bad labels.
+
+Layout of a filter directory:
+    meta.json   format version, n_bits, n_hashes, items, target false-positive rate
+    bits.npy    uint8 - the bit array, bit i is bits[i >> 3] >> (i & 7) & 1
+
+Positions use double hashing over one 128-bit BLAKE2b digest (h1 + i*h2 mod n_bits), so they are the
+same in every process regardless of PYTHONHASHSEED.
+"""
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+
+from utils import url_host
+
+BLOOM_FORMAT_VERSION = 1
+META_FILE = 'meta.json'
+
+
+def optimal_size(n_items, fp_rate):
+    """ (n_bits, n_hashes) for n_items at the target false-positive rate """
+    n_items = max(1, n_items)
+    n_bits = max(8, math.ceil(-n_items * math.log(fp_rate) / (math.log(2) ** 2)))
+    n_hashes = max(1, round(n_bits / n_items * math.log(2)))
+    return n_bits, n_hashes
+
+def _hashes(key):
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+def url_key(url_clean):
+    return 'u:' + url_clean
+
+def host_key(host):
+    return 'h:' + host
+
+
+class BloomFilter:
+    """ Fixed-size Bloom filter; build with BloomFilter.create + add, then save / BloomFilter.load """
+
+    def __init__(self, bits, n_bits, n_hashes, meta=None):
+        self.bits = bits
+        self.n_bits = n_bits
+        self.n_hashes = n_hashes
+        self.meta = meta or {}
+        self._view = memoryview(bits).cast('B') if len(bits) else memoryview(b'')
+
+    @classmethod
+    def create(cls, n_items, fp_rate=0.001):
+        n_bits, n_hashes = optimal_size(n_items, fp_rate)
+        meta = {'format_version': BLOOM_FORMAT_VERSION, 'n_bits': n_bits, 'n_hashes': n_hashes,
+                'items': 0, 'fp_rate': fp_rate}
+        return cls(np.zeros((n_bits + 7) // 8, dtype=np.uint8), n_bits, n_hashes, meta)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        if meta.get('format_version') != BLOOM_FORMAT_VERSION:
+            raise ValueError(f"Unsupported Bloom filter format: {meta.get('format_version')}")
+        bits = np.load(os.path.join(directory, 'bits.npy'), mmap_mode='r' if mmap else None)
+        return cls(bits, meta['n_bits'], meta['n_hashes'], meta)
+
+    def _positions(self, key):
+        h1, h2 = _hashes(key)
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def add_many(self, keys):
+        positions = np.fromiter((p for key in keys for p in self._positions(key)), dtype=np.int64)
+        np.bitwise_or.at(self.bits, positions >> 3, (1 << (positions & 7)).astype(np.uint8))
+        self.meta['items'] = self.meta.get('items', 0) + len(positions) // self.n_hashes
+
+    def __contains__(self, key):
+        view = self._view
+        return all(view[p >> 3] >> (p & 7) & 1 for p in self._positions(key))
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'bits.npy'), np.asarray(self.bits))
+        with open(os.path.join(directory, META_FILE), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+    def size_bytes(self):
+        return len(self.bits)
+
+
+class Blocklist:
+    """ Known-bad lookups for cleaned URLs: exact URL first, then the URL's host """
+
+    def __init__(self, directory, mmap=True):
+        self.filter = BloomFilter.load(directory, mmap=mmap)
+        self.meta = self.filter.meta
+
+    def match(self, url_clean):
+        """ 'url', 'host' or None """
+        if url_key(url_clean) in self.filter: return 'url'
+        host = url_host(url_clean)
+        if host and host_key(host) in self.filter: return 'host'
+        return None
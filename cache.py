@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class VerdictCache:
+    """ Thread-safe LRU + TTL cache for /analyze verdicts, keyed on (model version, cleaned URL). """
+
+    def __init__(self, max_size=10000, ttl=3600.0):
+        self.max_size = max(0, int(max_size))
+        self.ttl = float(ttl)
+        self._data = OrderedDict() # key -> (expires_at, verdict)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """ Returns the cached verdict for key, or None on a miss / expired entry. """
+        if not self.max_size: return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, verdict = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return verdict
+
+    def put(self, key, verdict):
+        """ Stores a verdict, evicting the least recently used entries past max_size. """
+        if not self.max_size: return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, verdict)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """ Drops every entry (called whenever the model is reloaded). """
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """ Returns size and hit/miss counters as a plain dict. """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data), 'max_size': self.max_size, 'ttl': self.ttl,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'expirations': self.expirations,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0
+            }
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """ Coalesces concurrent calls with the same key: the first caller computes, callers arriving while it
+    runs wait for it and share its result (or its exception). Nothing is remembered once a call finishes. """
+
+    def __init__(self):
+        self._calls = {} # key -> _Call in flight
+        self._lock = threading.Lock()
+        self.computed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """ Returns (fn() or the in-flight result for key, shared) where shared is True for a coalesced caller. """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.computed += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None: raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        """ Returns computed/coalesced counters and the number of keys in flight as a plain dict. """
+        with self._lock:
+            return {'computed': self.computed, 'coalesced': self.coalesced, 'inflight': len(self._calls)}
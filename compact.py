@@ -0,0 +1,131 @@
+"""
+Pickle-free compact inference format for the TF-IDF + LogisticRegression model.
+
+Layout of a compact model directory (every array is a flat .npy that can be memory-mapped):
+    meta.json          format version, classes, intercept, vocabulary size
+    vocab_bytes.npy    uint8  - UTF-8 tokens concatenated in sorted order
+    vocab_offsets.npy  int64  - token i is vocab_bytes[offsets[i]:offsets[i+1]]
+    idf.npy            float64 - idf weight per sorted token
+    coef.npy           float64 - LogisticRegression coefficient per sorted token
+
+Scoring reproduces sklearn's decision function without sklearn:
+    lowercase -> getTokens -> term counts -> * idf -> l2 normalise -> dot coef + intercept
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+from utils import getTokens
+
+COMPACT_FORMAT_VERSION = 1
+META_FILE = 'meta.json'
+
+
+def export_compact(vectorizer, lgs, out_dir, model_version=None):
+    """ Writes a fitted TfidfVectorizer + binary LogisticRegression to out_dir in the compact format """
+    if len(lgs.classes_) != 2:
+        raise ValueError(f"Compact export supports binary models only (got {len(lgs.classes_)} classes).")
+    if getattr(vectorizer, 'norm', 'l2') != 'l2' or getattr(vectorizer, 'sublinear_tf', False) or not getattr(vectorizer, 'use_idf', True):
+        raise ValueError("Compact export expects TfidfVectorizer(norm='l2', use_idf=True, sublinear_tf=False).")
+    os.makedirs(out_dir, exist_ok=True)
+
+    vocab = vectorizer.vocabulary_
+    tokens = sorted(vocab) # code point order == UTF-8 byte order, so bytes compare the same way
+    columns = np.fromiter((vocab[t] for t in tokens), dtype=np.int64, count=len(tokens))
+    encoded = [t.encode('utf-8') for t in tokens]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+
+    np.save(os.path.join(out_dir, 'vocab_bytes.npy'), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    np.save(os.path.join(out_dir, 'vocab_offsets.npy'), offsets)
+    np.save(os.path.join(out_dir, 'idf.npy'), np.asarray(vectorizer.idf_, dtype=np.float64)[columns])
+    np.save(os.path.join(out_dir, 'coef.npy'), np.asarray(lgs.coef_[0], dtype=np.float64)[columns])
+
+    meta = {
+        'format_version': COMPACT_FORMAT_VERSION,
+        'model_version': model_version,
+        'classes': [str(c) for c in lgs.classes_],
+        'intercept': float(lgs.intercept_[0]),
+        'lowercase': bool(getattr(vectorizer, 'lowercase', True)),
+        'n_features': len(tokens)
+    }
+    with open(os.path.join(out_dir, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class CompactModel:
+    """ Scores cleaned URLs from a compact model directory (see module docstring) """
+
+    def __init__(self, directory, mmap=True):
+        mmap_mode = 'r' if mmap else None
+        with open(os.path.join(directory, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta.get('format_version') != COMPACT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported compact model format: {self.meta.get('format_version')}")
+        self.classes = self.meta['classes']
+        self.intercept = self.meta['intercept']
+        self.lowercase = self.meta.get('lowercase', True)
+        self.version = self.meta.get('model_version')
+        vocab_bytes = np.load(os.path.join(directory, 'vocab_bytes.npy'), mmap_mode=mmap_mode)
+        self._vocab = memoryview(vocab_bytes).cast('B') if len(vocab_bytes) else memoryview(b'')
+        self._offsets = np.load(os.path.join(directory, 'vocab_offsets.npy'), mmap_mode=mmap_mode)
+        self.idf = np.load(os.path.join(directory, 'idf.npy'), mmap_mode=mmap_mode)
+        self.coef = np.load(os.path.join(directory, 'coef.npy'), mmap_mode=mmap_mode)
+        self.n_features = len(self._offsets) - 1
+
+    def lookup(self, token):
+        """ Returns the feature index of token, or -1 if it is not in the vocabulary (binary search) """
+        key = token.encode('utf-8')
+        vocab, offsets = self._vocab, self._offsets
+        lo, hi = 0, self.n_features
+        while lo < hi:
+            mid = (lo + hi) // 2
+            candidate = vocab[int(offsets[mid]):int(offsets[mid + 1])].tobytes()
+            if candidate == key: return mid
+            if candidate < key: lo = mid + 1
+            else: hi = mid
+        return -1
+
+    def features(self, url_clean):
+        """ Returns {feature index: term count} for one cleaned URL, tokenized the way TfidfVectorizer does """
+        doc = url_clean.lower() if self.lowercase else url_clean
+        counts = {}
+        for token in getTokens(doc):
+            idx = self.lookup(token)
+            if idx >= 0: counts[idx] = counts.get(idx, 0) + 1
+        return counts
+
+    def decision_function(self, urls_clean):
+        """ Same value as lgs.decision_function(vectorizer.transform(urls_clean)) """
+        scores = []
+        for url_clean in urls_clean:
+            dot, sq_norm = 0.0, 0.0
+            for idx, count in self.features(url_clean).items():
+                value = count * float(self.idf[idx])
+                dot += value * float(self.coef[idx])
+                sq_norm += value * value
+            scores.append(self.intercept + (dot / math.sqrt(sq_norm) if sq_norm else 0.0))
+        return scores
+
+    def predict_proba(self, urls_clean):
+        """ Probability of the positive class (classes[1]) per URL """
+        return [1.0 / (1.0 + math.exp(-s)) if s >= 0 else math.exp(s) / (1.0 + math.exp(s))
+                for s in self.decision_function(urls_clean)]
+
+    def predict(self, urls_clean):
+        """ Class label per URL, matching lgs.predict """
+        negative, positive = self.classes
+        return [positive if s > 0 else negative for s in self.decision_function(urls_clean)]
+
+
+def check_parity(compact_model, vectorizer, lgs, urls_clean, tolerance=1e-9):
+    """ Max |compact - sklearn| decision-function difference over urls_clean; raises if above tolerance """
+    expected = lgs.decision_function(vectorizer.transform(urls_clean))
+    actual = np.asarray(compact_model.decision_function(urls_clean))
+    max_diff = float(np.max(np.abs(actual - expected))) if len(urls_clean) else 0.0
+    if max_diff > tolerance:
+        raise ValueError(f"Compact model diverges from sklearn: max |diff| = {max_diff:.3e} > {tolerance:.0e}")
+    return max_diff
@@ -0,0 +1,205 @@
+"""
+Connection-pooled, concurrent short-link expander.
+
+URLExpander follows redirect chains hop by hop over one pooled requests.Session, so repeat traffic to
+popular shorteners (bit.ly, t.co, ...) reuses keep-alive connections. Resolved chains are kept in a TTL
+cache keyed by the short URL, and every hop takes a per-host slot so one slow host cannot occupy the
+whole pool.
+
+AsyncURLExpander is the same for the ASGI serving mode (asgi.py): hops are awaited on the event loop
+over one pooled httpx.AsyncClient instead of holding a thread each. It raises the same requests
+exception types, so callers handle both expanders alike.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import VerdictCache
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+def hostname(url):
+    """ Lower-cased host of url; malformed URLs (e.g. 'http://[::1') raise requests' InvalidURL, not a bare ValueError """
+    try:
+        return (urlsplit(url).hostname or '').lower()
+    except ValueError as e:
+        raise requests.exceptions.InvalidURL(f"Invalid URL {url!r}: {e}") from e
+
+def remember_chain(cache, url, chain):
+    """ {'url', 'final_url', 'status', 'chain'} for a resolved chain, cached unless it ended in an error status
+    (405 is a HEAD-only refusal, so the chain still resolved) """
+    result = {'url': url, 'final_url': chain[-1]['url'], 'status': chain[-1]['status'], 'chain': chain}
+    if result['status'] < 400 or result['status'] == 405: cache.put(url, result)
+    return result
+
+def join_location(url, location):
+    """ Absolute URL of a redirect's Location header, raising InvalidURL for a malformed one """
+    try:
+        return urljoin(url, location)
+    except ValueError as e:
+        raise requests.exceptions.InvalidURL(f"Invalid redirect location {location!r}: {e}") from e
+
+
+class URLExpander:
+    """ Resolves short links concurrently with pooled connections, per-host limits and a redirect cache """
+
+    def __init__(self, timeout=7, max_redirects=10, max_workers=16, per_host_limit=4,
+                 pool_size=32, cache_size=10000, cache_ttl=3600):
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.per_host_limit = per_host_limit
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.cache = VerdictCache(max_size=cache_size, ttl=cache_ttl) # same LRU+TTL cache as verdicts
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='expander')
+        self._host_slots = {} # host -> [semaphore, holders + waiters], only while in use, so it stays bounded
+        self._host_lock = threading.Lock()
+
+    @contextmanager
+    def _host_slot(self, url):
+        """ Caps concurrent requests to one host at per_host_limit; a host's entry is dropped once nothing holds or waits on it """
+        host = hostname(url)
+        with self._host_lock:
+            entry = self._host_slots.get(host)
+            if entry is None: entry = self._host_slots[host] = [threading.BoundedSemaphore(self.per_host_limit), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._host_lock:
+                entry[1] -= 1
+                if not entry[1]: del self._host_slots[host]
+
+    def follow(self, url):
+        """ Yields {'url', 'status'} for every hop of the redirect chain as it resolves (first hop = url).
+
+        Raises the usual requests exceptions (Timeout, ConnectionError, TooManyRedirects, InvalidURL, ...).
+        """
+        for _ in range(self.max_redirects + 1):
+            with self._host_slot(url):
+                response = self.session.head(url, allow_redirects=False, timeout=self.timeout)
+                response.close()
+            yield {'url': url, 'status': response.status_code}
+            location = response.headers.get('Location')
+            if response.status_code not in REDIRECT_CODES or not location: return
+            url = join_location(url, location)
+        raise requests.exceptions.TooManyRedirects(f"Exceeded {self.max_redirects} redirects.")
+
+    def expand(self, url):
+        """ Returns {'url', 'final_url', 'status', 'chain'} for one short URL, from the cache when possible """
+        cached = self.cache.get(url)
+        if cached is not None: return dict(cached, cached=True)
+        chain = list(self.follow(url))
+        return dict(self.remember(url, chain), cached=False)
+
+    def remember(self, url, chain):
+        """ Result dict for a chain resolved via follow(), cached like expand() caches it """
+        return remember_chain(self.cache, url, chain)
+
+    def _expand_or_error(self, url):
+        try:
+            return self.expand(url)
+        except requests.exceptions.Timeout: return {'url': url, 'error': 'Request timed out.'}
+        except requests.exceptions.ConnectionError: return {'url': url, 'error': 'Could not connect.'}
+        except requests.exceptions.TooManyRedirects: return {'url': url, 'error': 'Too many redirects.'}
+        except requests.exceptions.InvalidURL: return {'url': url, 'error': 'Invalid URL.'}
+        except requests.exceptions.RequestException as e: return {'url': url, 'error': f'Request error: {e}'}
+
+    def expand_many(self, urls):
+        """ Expands urls concurrently; results are in input order, failures carry an 'error' key """
+        return list(self._pool.map(self._expand_or_error, urls))
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        self.session.close()
+
+
+class AsyncURLExpander:
+    """ asyncio counterpart of URLExpander (same hops, per-host limits, cache and exceptions) over httpx """
+
+    def __init__(self, timeout=7, max_redirects=10, per_host_limit=4, pool_size=32, cache=None,
+                 cache_size=10000, cache_ttl=3600):
+        import httpx # only the ASGI serving mode needs it
+        self._httpx = httpx
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.per_host_limit = per_host_limit
+        self.client = httpx.AsyncClient(headers={'User-Agent': USER_AGENT}, timeout=timeout, follow_redirects=False,
+                                        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+        self.cache = cache if cache is not None else VerdictCache(max_size=cache_size, ttl=cache_ttl)
+        self._host_slots = {} # as in URLExpander; only touched from the event loop, so no lock
+
+    @asynccontextmanager
+    async def _host_slot(self, url):
+        """ Caps concurrent requests to one host at per_host_limit; a host's entry is dropped once nothing holds or waits on it """
+        host = hostname(url)
+        entry = self._host_slots.get(host)
+        if entry is None: entry = self._host_slots[host] = [asyncio.Semaphore(self.per_host_limit), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]: del self._host_slots[host]
+
+    def _as_requests_error(self, e):
+        """ The requests exception URLExpander would have raised for an httpx error """
+        httpx = self._httpx
+        if isinstance(e, httpx.TimeoutException): return requests.exceptions.Timeout(str(e) or 'Request timed out.')
+        if isinstance(e, (httpx.ConnectError, httpx.NetworkError)): return requests.exceptions.ConnectionError(str(e))
+        return requests.exceptions.RequestException(str(e))
+
+    async def follow(self, url):
+        """ Async generator of {'url', 'status'} per hop, like URLExpander.follow """
+        for _ in range(self.max_redirects + 1):
+            async with self._host_slot(url):
+                try:
+                    response = await self.client.head(url)
+                except self._httpx.HTTPError as e:
+                    raise self._as_requests_error(e) from e
+                except self._httpx.InvalidURL as e:
+                    raise requests.exceptions.InvalidURL(str(e)) from e
+            yield {'url': url, 'status': response.status_code}
+            location = response.headers.get('Location')
+            if response.status_code not in REDIRECT_CODES or not location: return
+            url = join_location(url, location)
+        raise requests.exceptions.TooManyRedirects(f"Exceeded {self.max_redirects} redirects.")
+
+    async def expand(self, url):
+        """ Returns {'url', 'final_url', 'status', 'chain'} for one short URL, from the cache when possible """
+        cached = self.cache.get(url)
+        if cached is not None: return dict(cached, cached=True)
+        chain = [hop async for hop in self.follow(url)]
+        return dict(self.remember(url, chain), cached=False)
+
+    def remember(self, url, chain):
+        """ Result dict for a chain resolved via follow(), cached like expand() caches it """
+        return remember_chain(self.cache, url, chain)
+
+    async def _expand_or_error(self, url):
+        try:
+            return await self.expand(url)
+        except requests.exceptions.Timeout: return {'url': url, 'error': 'Request timed out.'}
+        except requests.exceptions.ConnectionError: return {'url': url, 'error': 'Could not connect.'}
+        except requests.exceptions.TooManyRedirects: return {'url': url, 'error': 'Too many redirects.'}
+        except requests.exceptions.InvalidURL: return {'url': url, 'error': 'Invalid URL.'}
+        except requests.exceptions.RequestException as e: return {'url': url, 'error': f'Request error: {e}'}
+
+    async def expand_many(self, urls):
+        """ Expands urls concurrently; results are in input order, failures carry an 'error' key """
+        return list(await asyncio.gather(*(self._expand_or_error(u) for u in urls)))
+
+    async def close(self):
+        await self.client.aclose()
@@ -1,4 +1,8 @@
 const API_ENDPOINT = "https://safelink-ai.onrender.com/analyze";
+// A verdict arriving after this is too late to protect the page; the server sheds requests it can't answer in time
+const DEADLINE_MS = 3000;
+// On 429/503 the server sends Retry-After; retry once if that is soon enough to still matter
+const MAX_RETRY_AFTER_S = 5;
 
 chrome.tabs.onUpdated.addListener((tabId, changeInfo, tab) => {
   
@@ -15,16 +19,27 @@ chrome.tabs.onUpdated.addListener((tabId, changeInfo, tab) => {
   }
 });
 
-async function checkUrlWithAI(url, tabId) {
+async function checkUrlWithAI(url, tabId, retried = false) {
   try {
     const response = await fetch(API_ENDPOINT, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        'X-Deadline-Ms': String(DEADLINE_MS),
       },
       body: JSON.stringify({ url: url }),
+      signal: AbortSignal.timeout(DEADLINE_MS),
     });
 
+    if ((response.status === 429 || response.status === 503) && !retried) {
+      const retryAfter = parseInt(response.headers.get('Retry-After'), 10);
+      if (retryAfter > 0 && retryAfter <= MAX_RETRY_AFTER_S) {
+        console.warn(`SafeLink AI server busy (${response.status}), retrying in ${retryAfter}s`);
+        setTimeout(() => checkUrlWithAI(url, tabId, true), retryAfter * 1000);
+        return;
+      }
+    }
+
     if (!response.ok) {
       console.error("Error from AI server:", response.status, response.statusText);
       
@@ -45,25 +60,30 @@ async function checkUrlWithAI(url, tabId) {
     if (data.is_malicious) {
       console.warn(`MALICIOUS URL DETECTED: ${url}`);
       
-      // Save the analysis data so the warning page can read it
-      // save the original URL the user was trying to go to.
-      const analysisData = {
-        blockedUrl: url,
-        analysis: data 
-      };
-      //  chrome.storage.local which is preferred for extensions
-      await chrome.storage.local.set({ 'lastBlockedAnalysis': analysisData });
-
-      // Redirect to  warning page
-      const warningPageUrl = chrome.runtime.getURL('warning.html');
-      
-      // Ensure the tab still exists before trying to update it
-      chrome.tabs.get(tabId, (existingTab) => {
+      // Ensure the tab still exists and still shows this URL: a late (e.g. retried) verdict must not
+      // redirect a tab the user has since navigated elsewhere
+      chrome.tabs.get(tabId, async (existingTab) => {
         if (chrome.runtime.lastError) {
           console.error("Tab does not exist:", chrome.runtime.lastError.message);
-        } else if (existingTab) {
-          chrome.tabs.update(tabId, { url: warningPageUrl });
+          return;
+        }
+        if (!existingTab || existingTab.url !== url) {
+          console.log(`Tab ${tabId} moved on from ${url}; not redirecting.`);
+          return;
         }
+
+        // Save the analysis data so the warning page can read it
+        // save the original URL the user was trying to go to.
+        const analysisData = {
+          blockedUrl: url,
+          analysis: data 
+        };
+        //  chrome.storage.local which is preferred for extensions
+        await chrome.storage.local.set({ 'lastBlockedAnalysis': analysisData });
+
+        // Redirect to  warning page
+        const warningPageUrl = chrome.runtime.getURL('warning.html');
+        chrome.tabs.update(tabId, { url: warningPageUrl });
       });
     }
 
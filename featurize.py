@@ -0,0 +1,83 @@
+"""
+Parallel feature extraction for training.
+
+The corpus is split into contiguous shards; each worker process runs clean_url + getTokens over its shard
+and returns a term-count matrix over its own local vocabulary. The parent merges the shard vocabularies
+into one sorted vocabulary (the order TfidfVectorizer uses), remaps the columns and fits the idf weights,
+so the vocabulary, idf and sparsity pattern equal TfidfVectorizer(tokenizer=getTokens).fit_transform(corpus_clean).
+
+Every row is stored in ascending column order before the l2 normalisation, so the output is bit-for-bit the
+same for any worker count, start method and PYTHONHASHSEED. (The serial vectorizer sums each row in
+getTokens' set order, which follows the string hash seed, so it can differ from this in the last bit.)
+The pool is capped at os.cpu_count() workers; with one CPU the shards are counted in-process.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfTransformer, TfidfVectorizer
+
+from utils import clean_url, getTokens
+
+
+def _count_shard(urls_raw):
+    """ Worker: clean + tokenize one shard into (local tokens, data, indices, indptr) CSR counts """
+    vocab = {}
+    data, indices, indptr = [], [], [0]
+    for url in urls_raw:
+        counts = {}
+        # TfidfVectorizer lowercases the document before calling the tokenizer
+        for token in getTokens(clean_url(url).lower()):
+            idx = vocab.setdefault(token, len(vocab))
+            counts[idx] = counts.get(idx, 0) + 1
+        indices.extend(counts)
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    return (list(vocab), np.asarray(data, dtype=np.int64),
+            np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64))
+
+
+def _shards(items, n_shards):
+    size = -(-len(items) // n_shards) if items else 1
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def parallel_fit_transform(corpus_raw, n_jobs=None, shards_per_job=4):
+    """ Cleans, tokenizes and tf-idf encodes corpus_raw across n_jobs processes.
+
+    Returns (vectorizer, X) where vectorizer is a fitted TfidfVectorizer(tokenizer=getTokens) that can be
+    pickled and served as usual, and X matches the serial vectorizer.fit_transform(corpus_clean) (see module docstring).
+    """
+    n_jobs = min(n_jobs or os.cpu_count() or 1, os.cpu_count() or 1) # more processes than CPUs only adds overhead
+    corpus_raw = list(corpus_raw)
+    if not corpus_raw: raise ValueError("Cannot vectorize an empty corpus.")
+    shards = _shards(corpus_raw, max(1, n_jobs * shards_per_job))
+    if n_jobs == 1:
+        results = [_count_shard(shard) for shard in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(_count_shard, shards)) # map keeps shard order -> deterministic rows
+
+    # Canonical merge: sorted vocabulary, each shard's local ids relabelled to it, rows in ascending column order
+    tokens = sorted(set().union(*(shard_tokens for shard_tokens, _, _, _ in results)))
+    vocabulary = {token: i for i, token in enumerate(tokens)}
+    data, indices, indptr, offset = [], [], [np.zeros(1, dtype=np.int64)], 0
+    for shard_tokens, shard_data, shard_indices, shard_indptr in results:
+        remap = np.fromiter((vocabulary[t] for t in shard_tokens), dtype=np.int64, count=len(shard_tokens))
+        data.append(shard_data)
+        indices.append(remap[shard_indices])
+        indptr.append(shard_indptr[1:] + offset)
+        offset += len(shard_data)
+    counts = sp.csr_matrix((np.concatenate(data), np.concatenate(indices), np.concatenate(indptr)),
+                           shape=(len(corpus_raw), len(vocabulary)), dtype=np.float64) # TfidfVectorizer counts in its float dtype
+    counts.sort_indices()
+
+    tfidf = TfidfTransformer()
+    X = tfidf.fit_transform(counts)
+    vectorizer = TfidfVectorizer(tokenizer=getTokens, vocabulary=vocabulary)
+    vectorizer.idf_ = tfidf.idf_ # also builds vocabulary_ from the parameter
+    # Pickle like a vectorizer fitted on the corpus: fitted vocabulary_ only, not the dict twice
+    vectorizer.vocabulary = None
+    vectorizer.fixed_vocabulary_ = False
+    return vectorizer, X
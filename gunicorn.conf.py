@@ -0,0 +1,34 @@
+"""
+Gunicorn settings for SafeLink AI:
+
+    gunicorn -c gunicorn.conf.py AIserver:app
+    gunicorn -c gunicorn.conf.py -k asgi asgi:app     # async mode, see asgi.py
+
+With preload (the default; GUNICORN_PRELOAD=0 turns it off) AIserver is imported once in the master,
+which loads the model before forking, so every worker shares those pages copy-on-write instead of
+downloading and unpickling its own copy. gc.freeze() right before the workers fork keeps the garbage
+collector from writing to (and so un-sharing) the preloaded objects.
+
+Pickled sklearn objects still get un-shared gradually as workers touch their refcounts; the compact
+model (COMPACT_MODEL_DIR) is a read-only mmap shared through the page cache, preload or not.
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+if preload_app:
+    # Read by AIserver at import: load the model synchronously, leave per-process threads to post_fork
+    os.environ.setdefault('MODEL_PRELOAD', '1')
+
+
+def when_ready(server):
+    if preload_app: gc.freeze()
+
+def post_fork(server, worker):
+    if preload_app:
+        import AIserver
+        AIserver.start_worker_threads()
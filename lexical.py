@@ -0,0 +1,132 @@
+"""
+Vectorized lexical features for batches of cleaned URLs (bulk scoring, training data analysis).
+
+A batch is encoded once as a single code-point buffer plus row offsets (encode_batch), and every
+statistic is computed for the whole batch with np.unique / np.bincount instead of a Python loop per URL:
+
+    length, digits, letters, uppercase, non_ascii, special, count('.'), count('-'), ..., digit_ratio, entropy
+
+batch_entropy reproduces utils.entropy bit for bit: it works on code points (not UTF-8 bytes), computes
+every -p*log2(p) term with math.log for the distinct (count, length) pairs only, and adds a row's terms
+in first-occurrence order with a sequential cumsum - the same order Counter + sum() use.
+"""
+import math
+
+import numpy as np
+
+SPECIAL_CHARS = '.-/@?=_%&~'
+FEATURE_NAMES = (['length', 'digits', 'letters', 'uppercase', 'non_ascii', 'special'] +
+                 [f'count[{c}]' for c in SPECIAL_CHARS] + ['digit_ratio', 'entropy'])
+BLOCK_ROWS = 16384 # URLs encoded and processed together; bounds the temporary arrays
+
+
+def encode_batch(urls_clean):
+    """ (codes, offsets): uint32 code points of every URL concatenated, and row i = codes[offsets[i]:offsets[i+1]] """
+    urls = [u if isinstance(u, str) else '' for u in urls_clean]
+    offsets = np.zeros(len(urls) + 1, dtype=np.int64)
+    np.cumsum([len(u) for u in urls], out=offsets[1:])
+    codes = np.frombuffer(''.join(urls).encode('utf-32-le'), dtype=np.uint32)
+    return codes, offsets
+
+def _row_ids(offsets):
+    """ Row index of every code in the buffer """
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+def _first_occurrences(keys, n_keys):
+    """ Positions where a key appears for the first time, ascending. A stable argsort groups equal keys with
+    their earliest position first; 16-bit keys use numpy's O(n) radix sort. """
+    order = np.argsort(keys.astype(np.uint16) if n_keys <= 1 << 16 else keys, kind='stable')
+    sorted_keys = keys[order]
+    is_first = np.zeros(len(keys), dtype=bool)
+    is_first[order[np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])]] = True
+    return np.flatnonzero(is_first)
+
+def _encoded_entropy(codes, offsets):
+    """ Entropy per row of one encoded block """
+    n_rows = len(offsets) - 1
+    lengths = np.diff(offsets)
+    if not len(codes): return np.zeros(n_rows, dtype=np.float64)
+    # Latin-1 code points index themselves; the (rare) others get dense ids after them
+    dense = codes.astype(np.int64)
+    wide = dense >= 256
+    other = np.unique(dense[wide])
+    dense[wide] = 256 + np.searchsorted(other, dense[wide])
+    symbols = 256 + len(other)
+    rows = _row_ids(offsets)
+
+    # Distinct characters of every row in first-occurrence order (Counter order), with their counts;
+    # rows are keyed chunk by chunk so (row, character) keys stay within 16 bits
+    step = max(1, (1 << 16) // symbols)
+    entry_rows, entry_counts = [], []
+    for start in range(0, n_rows, step):
+        lo, hi = offsets[start], offsets[min(start + step, n_rows)]
+        if lo == hi: continue
+        keys = (rows[lo:hi] - start) * symbols + dense[lo:hi]
+        first = _first_occurrences(keys, step * symbols)
+        entry_rows.append(rows[lo:hi][first])
+        entry_counts.append(np.bincount(keys, minlength=step * symbols)[keys[first]])
+    entry_rows, entry_counts = np.concatenate(entry_rows), np.concatenate(entry_counts)
+
+    # count/len * log2(count/len) with the float operations of utils.entropy, once per distinct (count, length)
+    width = int(lengths.max()) + 1
+    pairs, pair_idx = np.unique(entry_counts * width + lengths[entry_rows], return_inverse=True)
+    table = np.array([c / n * math.log(c / n, 2) for c, n in zip((pairs // width).tolist(), (pairs % width).tolist())])
+    terms = table[pair_idx.reshape(-1)]
+
+    # Sequential per-row sum, like sum(): pad rows to a matrix and cumsum along each row (x + 0.0 == x)
+    distinct = np.bincount(entry_rows, minlength=n_rows)
+    starts = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(distinct, out=starts[1:])
+    matrix = np.zeros((n_rows, int(distinct.max())), dtype=np.float64)
+    matrix[entry_rows, np.arange(len(entry_rows)) - starts[entry_rows]] = terms
+    out = -np.cumsum(matrix, axis=1)[:, -1]
+    out[lengths == 0] = 0.0
+    return out
+
+# Character class per ASCII code point (index 128 = any non-ASCII code point); one bincount over
+# (row, class) gives every count feature at once
+_LOWER, _UPPER, _DIGIT, _NON_ASCII, _OTHER = range(5)
+_CLASS = np.full(129, _OTHER, dtype=np.int64)
+_CLASS[ord('a'):ord('z') + 1] = _LOWER
+_CLASS[ord('A'):ord('Z') + 1] = _UPPER
+_CLASS[ord('0'):ord('9') + 1] = _DIGIT
+_CLASS[128] = _NON_ASCII
+_CLASS[[ord(c) for c in SPECIAL_CHARS]] = 5 + np.arange(len(SPECIAL_CHARS))
+_N_CLASSES = 5 + len(SPECIAL_CHARS)
+
+def _encoded_features(codes, offsets):
+    """ lexical_features of one encoded block """
+    n_rows = len(offsets) - 1
+    classes = _CLASS[np.minimum(codes, 128)]
+    counts = np.bincount(_row_ids(offsets) * _N_CLASSES + classes, minlength=n_rows * _N_CLASSES).reshape(n_rows, _N_CLASSES)
+    length = np.diff(offsets)
+    features = {
+        'length': length, 'digits': counts[:, _DIGIT], 'letters': counts[:, _LOWER] + counts[:, _UPPER],
+        'uppercase': counts[:, _UPPER], 'non_ascii': counts[:, _NON_ASCII],
+        'special': counts[:, _OTHER] + counts[:, 5:].sum(axis=1)
+    }
+    for i, c in enumerate(SPECIAL_CHARS): features[f'count[{c}]'] = counts[:, 5 + i]
+    features['digit_ratio'] = counts[:, _DIGIT] / np.maximum(length, 1)
+    features['entropy'] = _encoded_entropy(codes, offsets)
+    return features
+
+def _blocks(urls_clean):
+    """ encode_batch of consecutive BLOCK_ROWS-sized slices """
+    for start in range(0, len(urls_clean), BLOCK_ROWS):
+        yield encode_batch(urls_clean[start:start + BLOCK_ROWS])
+
+def batch_entropy(urls_clean):
+    """ Shannon entropy per URL, identical to [utils.entropy(u) for u in urls_clean] """
+    parts = [_encoded_entropy(*block) for block in _blocks(urls_clean)]
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float64)
+
+def lexical_features(urls_clean):
+    """ {feature name: array per URL} for FEATURE_NAMES; counts are int64, ratios and entropy float64 """
+    parts = [_encoded_features(*block) for block in _blocks(urls_clean)]
+    if not parts: parts = [_encoded_features(*encode_batch([]))]
+    return {name: np.concatenate([part[name] for part in parts]) for name in FEATURE_NAMES}
+
+def feature_matrix(urls_clean):
+    """ float64 matrix (len(urls_clean) x len(FEATURE_NAMES)), columns in FEATURE_NAMES order """
+    features = lexical_features(urls_clean)
+    return np.column_stack([features[name].astype(np.float64) for name in FEATURE_NAMES])
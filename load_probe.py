@@ -0,0 +1,44 @@
+"""
+Cold-load profile of a trained model, measured in a fresh interpreter.
+
+    load_profile('pickle', [vectorizer_path, model_path])
+    load_profile('compact', [compact_dir])
+
+Used by benchmark.py load and by train.py when it reports the effect of vocabulary pruning.
+"""
+import json
+import os
+import subprocess
+import sys
+
+# Run in a fresh interpreter so import/load time and peak RSS are not polluted by this process
+LOAD_PROBE = """
+import json, resource, sys, time
+kind, paths = sys.argv[1], sys.argv[2:]
+rss_mb = lambda: int(open('/proc/self/statm').read().split()[1]) * resource.getpagesize() / 2**20 # current, not peak
+start = time.perf_counter()
+if kind == 'pickle':
+    import joblib
+    import sklearn.feature_extraction.text, sklearn.linear_model # timed separately from the unpickling
+    import_s, import_rss_mb = time.perf_counter() - start, rss_mb()
+    vectorizer, lgs = joblib.load(paths[0]), joblib.load(paths[1])
+    score = lambda urls: lgs.predict(vectorizer.transform(urls))
+else:
+    from compact import CompactModel
+    import_s, import_rss_mb = time.perf_counter() - start, rss_mb()
+    model = CompactModel(paths[0])
+    score = model.predict
+load_s = time.perf_counter() - start
+start = time.perf_counter()
+score(['login-secure-update.example.ru/verify/account.php'])
+first_s = time.perf_counter() - start
+print(json.dumps({'load_s': load_s, 'first_score_s': first_s, 'import_s': import_s, 'import_rss_mb': import_rss_mb,
+                  'rss_mb': rss_mb(), 'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+def load_profile(kind, paths):
+    """ {'load_s', 'first_score_s', 'max_rss_mb', 'import_s', 'import_rss_mb', 'rss_mb'} of loading a model in a
+    fresh interpreter ('pickle' or 'compact'); load_s and the RSS figures include the library imports """
+    out = subprocess.run([sys.executable, '-c', LOAD_PROBE, kind] + list(paths), capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(out.stdout.strip().splitlines()[-1])
@@ -0,0 +1,139 @@
+"""
+Low-overhead in-process metrics with Prometheus text exposition.
+
+    timer = metrics.stage_timer('analyze')
+    data = request.get_json(); timer.mark('parse_json')
+    url_clean = clean_url(url); timer.mark('clean_url')
+    ...
+    timer.finish()
+
+Each mark() records the time since the previous mark as one observation of the
+stage-duration histogram; finish() records the whole request duration.
+"""
+import bisect
+import threading
+import time
+
+# Seconds; tuned for a sub-millisecond to multi-second request path
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """ Cumulative-bucket histogram (Prometheus semantics) """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class StageTimer:
+    """ Records per-stage durations of one request into a MetricsRegistry """
+
+    __slots__ = ('_registry', '_route', '_start', '_last')
+
+    def __init__(self, registry, route):
+        self._registry = registry
+        self._route = route
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self._registry.observe('stage_duration_seconds', (('route', self._route), ('stage', stage)), now - self._last)
+        self._last = now
+
+    def finish(self):
+        self._registry.observe('request_duration_seconds', (('route', self._route),), time.perf_counter() - self._start)
+
+
+class MetricsRegistry:
+    """ Counters, histograms and callback gauges, rendered as Prometheus text """
+
+    def __init__(self, namespace='safelink'):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters = {}   # name -> {labels: value}
+        self._histograms = {} # name -> {labels: Histogram}
+        self._gauges = {}     # name -> callable returning {labels: value}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, labels=(), amount=1):
+        """ labels is a tuple of (key, value) pairs, e.g. (('route', 'analyze'),) """
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(labels)
+            if histogram is None: histogram = series[labels] = Histogram()
+            histogram.observe(value)
+
+    def gauge(self, name, callback):
+        """ Registers a gauge whose {labels: value} samples are read at scrape time """
+        self._gauges[name] = callback
+
+    def stage_timer(self, route):
+        return StageTimer(self, route)
+
+    def counter_value(self, name, labels=()):
+        with self._lock:
+            return self._counters.get(name, {}).get(labels, 0)
+
+    def render(self):
+        """ Prometheus text exposition format (version 0.0.4) """
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {labels: (h.buckets, list(h.counts), h.sum, h.count) for labels, h in series.items()}
+                          for name, series in self._histograms.items()}
+        for name, series in sorted(counters.items()):
+            full = f"{self.namespace}_{name}"
+            self._header(lines, name, full, 'counter')
+            for labels, value in sorted(series.items()):
+                lines.append(f"{full}{_labels(labels)} {_number(value)}")
+        for name, series in sorted(histograms.items()):
+            full = f"{self.namespace}_{name}"
+            self._header(lines, name, full, 'histogram')
+            for labels, (buckets, counts, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{full}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+                lines.append(f"{full}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{full}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{full}_count{_labels(labels)} {count}")
+        for name, callback in sorted(self._gauges.items()):
+            full = f"{self.namespace}_{name}"
+            self._header(lines, name, full, 'gauge')
+            for labels, value in sorted(callback().items()):
+                lines.append(f"{full}{_labels(labels)} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines, name, full, kind):
+        if name in self._help: lines.append(f"# HELP {full} {self._help[name]}")
+        lines.append(f"# TYPE {full} {kind}")
+
+
+def _labels(labels):
+    if not labels: return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+def _number(value):
+    if isinstance(value, bool): return '1' if value else '0'
+    if isinstance(value, int): return str(value)
+    return repr(float(value))
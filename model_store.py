@@ -0,0 +1,69 @@
+"""
+Versioned model artifacts for incremental updates and hot swaps.
+
+Layout of a model store directory:
+    CURRENT                  name of the live version (one line, replaced atomically)
+    <version>/manifest.json  version, parent, created_at, reports_used, reports_until, ...
+    <version>/vectorizer.pkl
+    <version>/model.pkl
+
+publish() writes a version into a temporary directory, renames it into place and only then repoints
+CURRENT, so a reader never sees a half-written version. Servers poll current_version() and swap.
+"""
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+import joblib
+
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+
+
+def new_version(parent):
+    """ Child version name: '<parent base>+r<UTC timestamp>' (e.g. v1.0.0+r20250101T120000Z) """
+    base = (parent or 'v0').split('+', 1)[0]
+    return f"{base}+r{datetime.now(timezone.utc):%Y%m%dT%H%M%S%fZ}"
+
+def current_version(store_dir):
+    """ Name of the live version, or None for an empty store """
+    try:
+        with open(os.path.join(store_dir, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def load_version(store_dir, version, mmap_mode=None):
+    """ (vectorizer, model, manifest) of one published version; mmap_mode='r' maps their arrays read-only
+    (versions are never rewritten in place, so the maps stay valid) """
+    path = os.path.join(store_dir, version)
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    load = lambda name: joblib.load(os.path.join(path, name), mmap_mode=mmap_mode)
+    return load('vectorizer.pkl'), load('model.pkl'), manifest
+
+def publish(store_dir, version, vectorizer, lgs, manifest):
+    """ Writes a new version and makes it current; returns its directory """
+    final_path = os.path.join(store_dir, version)
+    if os.path.exists(final_path): raise FileExistsError(f"Model version {version} already exists in {store_dir}")
+    tmp_path = os.path.join(store_dir, f".{version}.tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    try:
+        joblib.dump(vectorizer, os.path.join(tmp_path, 'vectorizer.pkl'))
+        joblib.dump(lgs, os.path.join(tmp_path, 'model.pkl'))
+        with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as f:
+            json.dump(dict(manifest, version=version), f, indent=2, default=str)
+        os.rename(tmp_path, final_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    pointer_tmp = os.path.join(store_dir, f".{CURRENT_FILE}.tmp")
+    with open(pointer_tmp, 'w') as f:
+        f.write(version + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(store_dir, CURRENT_FILE))
+    return final_path
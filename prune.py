@@ -0,0 +1,57 @@
+"""
+Post-training vocabulary pruning for the TF-IDF + LogisticRegression model.
+
+Most of the vocabulary is one-off tokens whose coefficients are close to zero. prune_model keeps the
+features with the largest |coef| (top_k) and/or |coef| >= min_abs_coef and rebuilds a matching
+TfidfVectorizer (same parameters, pruned vocabulary and idf) and LogisticRegression.
+
+Dropped tokens also drop out of the l2 normalisation of each URL's vector, which rescales the kept
+features, so slicing the coefficients alone shifts the decision function a lot. When the training
+matrix is passed, the LogisticRegression is refitted on the pruned (re-normalised) features instead.
+"""
+import copy
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+
+def feature_ranking(lgs):
+    """ Column indices ordered by decreasing |coef| (binary models have one coefficient row) """
+    return np.argsort(-np.abs(lgs.coef_).max(axis=0), kind='stable')
+
+def prune_matrix(X, columns, norm='l2'):
+    """ vectorizer.transform output restricted to columns, as the pruned vectorizer would produce it """
+    X = X[:, columns]
+    return normalize(X, norm=norm, copy=False) if norm else X
+
+def prune_model(vectorizer, lgs, top_k=None, min_abs_coef=None, X_train=None, y_train=None):
+    """ Returns (vectorizer, lgs, columns) restricted to the selected features; the inputs are not modified.
+
+    With X_train (the full-vocabulary training matrix) and y_train the model is refitted on the pruned
+    features; without them its coefficients are sliced.
+    """
+    if top_k is None and min_abs_coef is None: raise ValueError("Pass top_k and/or min_abs_coef.")
+    weight = np.abs(lgs.coef_).max(axis=0)
+    keep = np.ones(len(weight), dtype=bool)
+    if min_abs_coef is not None: keep &= weight >= min_abs_coef
+    if top_k is not None and top_k < keep.sum():
+        ranked = [i for i in feature_ranking(lgs) if keep[i]][:top_k]
+        keep[:] = False
+        keep[ranked] = True
+    columns = np.flatnonzero(keep) # ascending, so the kept tokens stay in the same relative order
+    if not len(columns): raise ValueError("Pruning would remove every feature.")
+
+    tokens = vectorizer.get_feature_names_out()[columns]
+    pruned_vectorizer = TfidfVectorizer(**dict(vectorizer.get_params(), vocabulary={str(t): i for i, t in enumerate(tokens)}))
+    pruned_vectorizer.idf_ = np.asarray(vectorizer.idf_)[columns] # also builds vocabulary_ from the parameter
+    pruned_vectorizer.vocabulary = None # fitted vocabulary_ is enough; don't pickle the dict twice
+
+    if X_train is not None:
+        pruned_lgs = clone(lgs).fit(prune_matrix(X_train, columns, vectorizer.norm), y_train)
+    else:
+        pruned_lgs = copy.deepcopy(lgs)
+        pruned_lgs.coef_ = np.ascontiguousarray(lgs.coef_[:, columns])
+        pruned_lgs.n_features_in_ = len(columns)
+    return pruned_vectorizer, pruned_lgs, columns
@@ -0,0 +1,172 @@
+"""
+Feedback-report storage and a buffered background writer.
+
+ReportStore implementations share one small interface (write_batch / fetch_since):
+    FirestoreReportStore - production, Firestore batch writes into 'feedback_reports'
+    SQLiteReportStore    - local stand-in when serviceAccountKey.json is missing
+    MemoryReportStore    - in-process list, for scripts and tests
+
+BufferedReportWriter queues reports in memory (bounded) and flushes them from a background thread
+when batch_size reports are waiting or flush_interval seconds have passed, retrying failed batches
+with exponential backoff and draining the queue on shutdown.
+"""
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+
+class ReportStore(ABC):
+    """ Storage interface for feedback reports (dicts with url, feedback, comments, timestamp) """
+
+    @abstractmethod
+    def write_batch(self, reports):
+        """ Stores reports (a list) together; raises on failure so the writer can retry the batch """
+
+    @abstractmethod
+    def fetch_since(self, since=None, limit=None):
+        """ Reports with timestamp > since (all when since is None), oldest first """
+
+
+class FirestoreReportStore(ReportStore):
+    MAX_BATCH = 500 # Firestore limit on writes per batch
+
+    def __init__(self, db, collection='feedback_reports'):
+        self.db = db
+        self.collection = collection
+
+    def write_batch(self, reports):
+        reports_ref = self.db.collection(self.collection)
+        for start in range(0, len(reports), self.MAX_BATCH):
+            batch = self.db.batch()
+            for report in reports[start:start + self.MAX_BATCH]: batch.set(reports_ref.document(), report)
+            batch.commit()
+
+    def fetch_since(self, since=None, limit=None):
+        query = self.db.collection(self.collection)
+        if since is not None: query = query.where('timestamp', '>', since)
+        query = query.order_by('timestamp')
+        if limit: query = query.limit(limit)
+        return [doc.to_dict() for doc in query.stream()]
+
+
+class SQLiteReportStore(ReportStore):
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS feedback_reports ("
+                           "id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL, feedback TEXT NOT NULL, "
+                           "comments TEXT, timestamp TEXT NOT NULL)")
+        self._conn.commit()
+
+    def write_batch(self, reports):
+        rows = [(r['url'], r['feedback'], r.get('comments', ''), _iso(r.get('timestamp'))) for r in reports]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT INTO feedback_reports (url, feedback, comments, timestamp) VALUES (?, ?, ?, ?)", rows)
+
+    def fetch_since(self, since=None, limit=None):
+        sql = "SELECT url, feedback, comments, timestamp FROM feedback_reports"
+        params = []
+        if since is not None: sql += " WHERE timestamp > ?"; params.append(_iso(since))
+        sql += " ORDER BY timestamp"
+        if limit: sql += " LIMIT ?"; params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{'url': u, 'feedback': f, 'comments': c, 'timestamp': datetime.fromisoformat(t)} for u, f, c, t in rows]
+
+
+class MemoryReportStore(ReportStore):
+    def __init__(self):
+        self.reports = []
+        self._lock = threading.Lock()
+
+    def write_batch(self, reports):
+        with self._lock:
+            self.reports.extend(dict(r) for r in reports)
+
+    def fetch_since(self, since=None, limit=None):
+        with self._lock:
+            found = sorted((r for r in self.reports if since is None or r['timestamp'] > since), key=lambda r: r['timestamp'])
+        return found[:limit] if limit else found
+
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value or datetime.now().isoformat())
+
+
+class BufferedReportWriter:
+    """ Bounded in-memory queue flushed to a ReportStore in batches by one background thread """
+
+    def __init__(self, store, max_queue=10000, batch_size=100, flush_interval=2.0, max_retries=5, backoff=0.5):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name='report-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, report):
+        """ Queues one report without blocking; False when the queue is full or the writer is closed """
+        if self._stop.is_set():
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait(report)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        batch, deadline = [], None
+        while not (self._stop.is_set() and self._queue.empty() and not batch):
+            # Idle waits are capped so close() is noticed promptly
+            timeout = min(self.flush_interval, 0.5) if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+                if deadline is None: deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+            due = deadline is not None and time.monotonic() >= deadline
+            draining = self._stop.is_set() and self._queue.empty()
+            if batch and (len(batch) >= self.batch_size or due or draining):
+                self._flush(batch)
+                batch, deadline = [], None
+
+    def _flush(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.store.write_batch(batch)
+                self.written += len(batch)
+                return
+            except Exception as e:
+                if attempt == self.max_retries: break
+                delay = self.backoff * (2 ** attempt)
+                print(f"[Report Writer] Batch of {len(batch)} failed ({e}); retrying in {delay:.1f}s")
+                if self._stop.is_set(): time.sleep(min(delay, 0.1)) # draining on shutdown: retry, but quickly
+                else: self._stop.wait(delay)
+        self.failed += len(batch)
+        print(f"[Report Writer] Giving up on a batch of {len(batch)} reports after {self.max_retries} retries.")
+
+    def close(self, timeout=10.0):
+        """ Stops accepting reports and drains the queue to the store """
+        if self._stop.is_set() and not self._thread.is_alive(): return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {'queued': self.depth(), 'written': self.written, 'failed': self.failed, 'dropped': self.dropped}
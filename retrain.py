@@ -0,0 +1,146 @@
+"""
+Incremental model update from user feedback reports.
+
+    python retrain.py --store-dir /srv/safelink/models [--sqlite /tmp/feedback_reports.sqlite3]
+
+Pulls the reports submitted since the live version was built, turns them into labels
+(should_be_good -> good, should_be_bad -> bad) and continues training the live model with a few
+SGD epochs over the reports plus a replay sample of the original corpus, starting from the current
+weights. The reports are weighted to carry report_share of the total sample weight, so a handful of
+corrections is not drowned out by thousands of replay rows; how many reported URLs the new version
+gets right is printed and recorded in the manifest. The vocabulary and idf weights are kept, so nothing
+is refitted from scratch. The result is published as a new version in the model store; servers with
+MODEL_STORE_DIR pick it up and swap.
+"""
+import argparse
+import copy
+import os
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import SGDClassifier
+
+import model_store
+from report_store import FirestoreReportStore, SQLiteReportStore
+from utils import clean_url
+
+DATA_PATH = './data/data.csv'
+FEEDBACK_LABELS = {'should_be_good': 'good', 'should_be_bad': 'bad'}
+
+
+def open_report_store(sqlite_path=None, cred_path='serviceAccountKey.json'):
+    """Local SQLite report store when sqlite_path is given, otherwise Firestore via the service account key."""
+    if sqlite_path: return SQLiteReportStore(sqlite_path)
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    if not firebase_admin._apps: firebase_admin.initialize_app(credentials.Certificate(cred_path))
+    return FirestoreReportStore(firestore.client())
+
+def reports_to_examples(reports):
+    """Cleaned URLs and labels from feedback reports; the latest report wins for a repeated URL."""
+    latest = {}
+    for report in reports:
+        label = FEEDBACK_LABELS.get(report.get('feedback'))
+        url_clean = clean_url(report.get('url', ''))
+        if label and url_clean: latest[url_clean] = label
+    return list(latest), list(latest.values())
+
+def replay_sample(n_rows, seed=0):
+    """Random rows of the original corpus, mixed into the update so the model does not drift toward the reports."""
+    if not n_rows or not os.path.exists(DATA_PATH): return [], []
+    data = pd.read_csv(DATA_PATH, delimiter=',', on_bad_lines='skip', usecols=[0, 1]).dropna()
+    data = data.sample(n=min(n_rows, len(data)), random_state=seed)
+    return [clean_url(url) for url in data.iloc[:, 0]], list(data.iloc[:, 1])
+
+def warm_start_sgd(lgs, eta0=0.05, alpha=1e-5):
+    """SGDClassifier(log_loss) starting from a fitted linear model's weights, ready for partial_fit."""
+    if isinstance(lgs, SGDClassifier): return copy.deepcopy(lgs)
+    sgd = SGDClassifier(loss='log_loss', alpha=alpha, learning_rate='constant', eta0=eta0, random_state=0)
+    # Seeding the fitted attributes makes the first partial_fit continue from these weights
+    sgd.classes_ = lgs.classes_.copy()
+    sgd.coef_ = np.array(lgs.coef_, dtype=np.float64, copy=True)
+    sgd.intercept_ = np.array(lgs.intercept_, dtype=np.float64, copy=True)
+    sgd.n_features_in_ = sgd.coef_.shape[1]
+    return sgd
+
+def report_weight(n_reports, n_replay, report_share=0.2):
+    """Per-row weight giving n_reports rows report_share of the total weight next to n_replay unit-weight rows (>= 1)."""
+    if not n_reports or not n_replay or report_share >= 1: return 1.0
+    return max(1.0, report_share / (1 - report_share) * n_replay / n_reports)
+
+def update_model(vectorizer, lgs, urls_clean, labels, epochs=5, eta0=0.05, alpha=1e-5, seed=0, sample_weight=None):
+    """Continues training lgs on (urls_clean, labels) for a few shuffled epochs; lgs itself is not modified."""
+    sgd = warm_start_sgd(lgs, eta0, alpha)
+    X, y = vectorizer.transform(urls_clean), np.asarray(labels)
+    weights = np.ones(len(y)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    for _ in range(epochs):
+        order = rng.permutation(len(y))
+        sgd.partial_fit(X[order], y[order], classes=sgd.classes_, sample_weight=weights[order])
+    return sgd
+
+def run(store_dir, reports, base_vectorizer=None, base_model=None, epochs=5, eta0=0.05, alpha=1e-5, replay_rows=5000, min_reports=1,
+        report_share=0.2):
+    """Updates the live model (or the base pickles for an empty store) with new reports and publishes it."""
+    parent = model_store.current_version(store_dir)
+    if parent:
+        vectorizer, lgs, manifest = model_store.load_version(store_dir, parent)
+        since = manifest.get('reports_until')
+        since = datetime.fromisoformat(since) if since else None
+    else:
+        print(f"Model store {store_dir} is empty; starting from {base_vectorizer} + {base_model}")
+        vectorizer, lgs, since = joblib.load(base_vectorizer), joblib.load(base_model), None
+        parent = os.environ.get('MODEL_VERSION', 'v1.0.0')
+
+    new_reports = reports.fetch_since(since)
+    urls_clean, labels = reports_to_examples(new_reports)
+    print(f"{len(new_reports)} new reports since {since or 'the beginning'} -> {len(urls_clean)} labelled URLs")
+    if len(urls_clean) < min_reports:
+        print("Not enough new feedback; keeping the current model.")
+        return None
+
+    replay_urls, replay_labels = replay_sample(replay_rows)
+    weight = report_weight(len(urls_clean), len(replay_urls), report_share)
+    sample_weight = [weight] * len(urls_clean) + [1.0] * len(replay_urls)
+    updated = update_model(vectorizer, lgs, urls_clean + replay_urls, labels + replay_labels, epochs, eta0, alpha,
+                           sample_weight=sample_weight)
+    fixed = int((updated.predict(vectorizer.transform(urls_clean)) == np.asarray(labels)).sum())
+    before = int((lgs.predict(vectorizer.transform(urls_clean)) == np.asarray(labels)).sum())
+    print(f"Reported URLs classified as reported (report weight {weight:.1f}): {before}/{len(labels)} before, "
+          f"{fixed}/{len(labels)} with the new version")
+    if fixed <= before < len(labels):
+        print("WARNING: the update does not classify any more reported URLs as reported; "
+              "consider a higher --report-share, --epochs or --eta0.")
+    if replay_urls:
+        replay_acc = (updated.predict(vectorizer.transform(replay_urls)) == np.asarray(replay_labels)).mean()
+        print(f"Accuracy on the {len(replay_urls)} replayed corpus rows: {replay_acc * 100:.2f}%")
+
+    version = model_store.new_version(parent)
+    model_store.publish(store_dir, version, vectorizer, updated, {
+        'parent': parent, 'created_at': datetime.now().isoformat(), 'reports_used': len(urls_clean),
+        'replay_rows': len(replay_urls), 'epochs': epochs, 'report_weight': weight,
+        'reports_correct_before': before, 'reports_correct_after': fixed,
+        'reports_until': max(r['timestamp'] for r in new_reports).isoformat()
+    })
+    print(f"Published model version {version}")
+    return version
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update the SafeLink AI model from feedback reports.")
+    parser.add_argument('--store-dir', required=True, help="versioned model store (servers read MODEL_STORE_DIR)")
+    parser.add_argument('--sqlite', default=None, help="read reports from this SQLite file instead of Firestore")
+    parser.add_argument('--vectorizer', default='vectorizer.pkl', help="base vectorizer when the store is empty")
+    parser.add_argument('--model', default='model.pkl', help="base model when the store is empty")
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--eta0', type=float, default=0.05, help="SGD learning rate for the update")
+    parser.add_argument('--alpha', type=float, default=1e-5, help="L2 regularisation strength")
+    parser.add_argument('--replay-rows', type=int, default=5000, help="corpus rows mixed into the update (0 = reports only)")
+    parser.add_argument('--min-reports', type=int, default=1, help="skip the update below this many labelled URLs")
+    parser.add_argument('--report-share', type=float, default=0.2,
+                        help="share of the total sample weight carried by the reports (vs the replay rows)")
+    args = parser.parse_args()
+    os.makedirs(args.store_dir, exist_ok=True)
+    run(args.store_dir, open_report_store(args.sqlite), args.vectorizer, args.model,
+        args.epochs, args.eta0, args.alpha, args.replay_rows, args.min_reports, args.report_share)
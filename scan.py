@@ -0,0 +1,210 @@
+"""
+Offline bulk scanner: streams a URL file through the model without the HTTP server.
+
+    python scan.py proxy.log.gz -o verdicts.jsonl
+    python scan.py urls.csv --column url -o verdicts.csv --workers 8
+    zcat day.log.gz | python scan.py - --format csv > verdicts.csv
+
+Input is newline-separated URLs, or CSV with a header row and --column (name or 0-based index;
+column 0 is implied for *.csv).
+Gzip is detected from the magic bytes, so '.gz' names and compressed stdin both work. The input is
+read in --chunk-size chunks and at most 2 x --workers chunks are in flight, so memory stays flat
+however large the file is. Chunks are scored in a process pool (vectorizer.transform + predict per
+chunk, as /api/analyze_batch does) and written back in input order as JSONL or CSV:
+
+    line (1-based record number), url, ai_prediction, score (probability of 'bad'), entropy, is_malicious
+    (+ error for records that fail cleaning, e.g. blank lines)
+
+Progress (URLs/sec) goes to stderr.
+"""
+import argparse
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+
+from lexical import batch_entropy
+from utils import clean_url
+
+FIELDS = ['line', 'url', 'ai_prediction', 'score', 'entropy', 'is_malicious', 'error']
+GZIP_MAGIC = b'\x1f\x8b'
+
+_model = None # (kind, model objects) loaded once per worker process
+
+
+# --- Input ---
+
+def open_input(path):
+    """ Text stream for path ('-' = stdin), transparently decompressing gzip """
+    raw = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    buffered = raw if hasattr(raw, 'peek') else io.BufferedReader(raw)
+    if buffered.peek(2)[:2] == GZIP_MAGIC: buffered = gzip.GzipFile(fileobj=buffered)
+    return io.TextIOWrapper(buffered, encoding='utf-8', errors='replace', newline='')
+
+def read_urls(stream, column=None):
+    """ Yields raw URLs: one per line, or one per CSV row after the header from column (name or 0-based index) """
+    if column is None:
+        for line in stream:
+            yield line.strip()
+        return
+    reader = csv.reader(stream)
+    header = next(reader, [])
+    if str(column).isdigit(): index = int(column)
+    elif column in header: index = header.index(column)
+    else: raise ValueError(f"Column {column!r} not in the CSV header {header}")
+    for row in reader:
+        yield row[index].strip() if index < len(row) else ''
+
+def chunked(urls, size):
+    """ Consecutive lists of at most size URLs """
+    iterator = iter(urls)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk: return
+        yield chunk
+
+
+# --- Scoring (runs in the worker processes) ---
+
+def load_model(vectorizer_path=None, model_path=None, compact_dir=None):
+    """ Loads the compact model or the pickles into this process """
+    global _model
+    if compact_dir:
+        from compact import CompactModel
+        _model = ('compact', CompactModel(compact_dir))
+    else:
+        _model = ('sklearn', (joblib.load(vectorizer_path), joblib.load(model_path)))
+
+def _bad_probability(urls_clean):
+    """ Predicted labels and P('bad') per URL (None when the model has no probabilities) """
+    kind, model = _model
+    if kind == 'compact':
+        proba = np.asarray(model.predict_proba(urls_clean)) # positive class = classes[1]
+        labels = np.asarray(model.classes)[(proba > 0.5).astype(int)]
+        bad_index = model.classes.index('bad') if 'bad' in model.classes else None
+        return labels, (None if bad_index is None else (proba if bad_index == 1 else 1.0 - proba))
+    vectorizer, lgs = model
+    X = vectorizer.transform(urls_clean)
+    labels = lgs.predict(X)
+    if not hasattr(lgs, 'predict_proba') or 'bad' not in list(lgs.classes_): return labels, None
+    return labels, lgs.predict_proba(X)[:, list(lgs.classes_).index('bad')]
+
+def score_chunk(first_line, urls_raw):
+    """ Result rows for one chunk, in input order """
+    urls_clean = [clean_url(u) if u else '' for u in urls_raw]
+    valid = [i for i, u in enumerate(urls_clean) if u]
+    rows = [{'line': first_line + i, 'url': u} for i, u in enumerate(urls_raw)]
+    for i, u in enumerate(urls_clean):
+        if not u: rows[i]['error'] = 'Invalid URL provided (failed cleaning).'
+    if not valid: return rows
+    batch = [urls_clean[i] for i in valid]
+    labels, scores = _bad_probability(batch)
+    entropies = batch_entropy(batch)
+    for n, i in enumerate(valid):
+        label = str(labels[n])
+        rows[i].update(ai_prediction=label, score=None if scores is None else round(float(scores[n]), 6),
+                       entropy=round(float(entropies[n]), 4), is_malicious=(label == 'bad'))
+    return rows
+
+
+# --- Output ---
+
+class ResultWriter:
+    """ Writes result rows as JSONL or CSV to path ('-' = stdout, '.gz' = gzip) """
+
+    def __init__(self, path, fmt):
+        self.fmt = fmt
+        if path == '-': self.stream = sys.stdout
+        elif path.endswith('.gz'): self.stream = gzip.open(path, 'wt', encoding='utf-8', newline='')
+        else: self.stream = open(path, 'w', encoding='utf-8', newline='')
+        if fmt == 'csv':
+            self.csv = csv.DictWriter(self.stream, fieldnames=FIELDS, extrasaction='ignore')
+            self.csv.writeheader()
+
+    def write(self, rows):
+        if self.fmt == 'csv': self.csv.writerows(rows)
+        else: self.stream.write(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows))
+
+    def close(self):
+        if self.stream is sys.stdout: self.stream.flush()
+        else: self.stream.close()
+
+
+# --- Driver ---
+
+def scan(urls, writer, chunk_size=10000, workers=None, model_paths=(), progress_every=5.0, log=sys.stderr):
+    """ Scores every URL in the iterable urls and writes the rows in order; returns (total, malicious, seconds).
+
+    workers=0 scores in this process (no pool).
+    """
+    started = last_report = time.perf_counter()
+    total = malicious = 0
+
+    def report(final=False):
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else 0.0
+        print(f"{'Done' if final else 'Scanned'}: {total:,} URLs, {malicious:,} malicious, {rate:,.0f} URLs/s", file=log, flush=True)
+
+    def consume(rows):
+        nonlocal total, malicious, last_report
+        writer.write(rows)
+        total += len(rows)
+        malicious += sum(1 for row in rows if row.get('is_malicious'))
+        if progress_every and time.perf_counter() - last_report >= progress_every:
+            last_report = time.perf_counter()
+            report()
+
+    chunks = ((n * chunk_size + 1, chunk) for n, chunk in enumerate(chunked(urls, chunk_size)))
+    if workers == 0:
+        load_model(*model_paths)
+        for first_line, chunk in chunks: consume(score_chunk(first_line, chunk))
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, initializer=load_model, initargs=tuple(model_paths)) as pool:
+            # Bounded window of in-flight chunks; the oldest is always written first, so output keeps input order
+            pending = deque()
+            for first_line, chunk in chunks:
+                pending.append(pool.submit(score_chunk, first_line, chunk))
+                if len(pending) >= 2 * workers: consume(pending.popleft().result())
+            while pending: consume(pending.popleft().result())
+    report(final=True)
+    return total, malicious, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan a file of URLs with the SafeLink AI model.")
+    parser.add_argument('input', help="newline or CSV file of URLs, optionally gzipped ('-' = stdin)")
+    parser.add_argument('-o', '--output', default='-', help="result file (.jsonl/.csv, optionally .gz; '-' = stdout)")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default=None, help="default: from the output name, else jsonl")
+    parser.add_argument('--column', default=None, help="CSV input: URL column name or 0-based index (default 0 for *.csv)")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="URLs per scoring batch")
+    parser.add_argument('--workers', type=int, default=None, help="scoring processes (default: CPU count, 0 = in-process)")
+    parser.add_argument('--vectorizer', default='vectorizer.pkl')
+    parser.add_argument('--model', default='model.pkl')
+    parser.add_argument('--compact-dir', default=None, help="score with a compact model directory instead of the pickles")
+    parser.add_argument('--progress-every', type=float, default=5.0, help="seconds between progress lines (0 = off)")
+    args = parser.parse_args()
+
+    fmt = args.format or ('csv' if args.output.removesuffix('.gz').endswith('.csv') else 'jsonl')
+    column = args.column
+    if column is None and args.input.removesuffix('.gz').endswith('.csv'): column = '0'
+    if not args.compact_dir:
+        for path in (args.vectorizer, args.model):
+            if not os.path.exists(path): parser.error(f"{path} not found (train.py writes it, or pass --compact-dir)")
+
+    writer = ResultWriter(args.output, fmt)
+    try:
+        with open_input(args.input) as stream:
+            scan(read_urls(stream, column), writer, args.chunk_size, args.workers,
+                 (args.vectorizer, args.model, args.compact_dir), args.progress_every)
+    finally:
+        writer.close()
@@ -0,0 +1,82 @@
+"""
+Single-pass scoring: tokenize a URL once and reuse the tokens for the model features and the threat report.
+
+TokenScorer reproduces TfidfVectorizer(norm='l2') + a binary linear model (LogisticRegression, or the
+SGDClassifier written by retrain.py) from a token list, so the vectorizer never re-tokenizes, and it
+returns every known token's share of the decision function:
+
+    contribution(t) = count(t) * idf(t) / ||x||_2 * coef(t)      decision = intercept + sum of contributions
+
+Contributions are signed toward risk_label ('bad'): positive values push the URL toward malicious.
+"""
+import math
+
+import numpy as np
+
+from utils import getTokens
+
+
+class TokenScorer:
+    """ Scores pre-tokenized URLs for one model version and explains the score per token """
+
+    __slots__ = ('_lookup', '_idf', '_coef', '_intercept', 'classes', 'lowercase', '_risk_sign')
+
+    def __init__(self, lookup, idf, coef, intercept, classes, lowercase=True, risk_label='bad'):
+        self._lookup = lookup # token -> feature index, -1 when unknown
+        self._idf = idf
+        self._coef = coef
+        self._intercept = intercept
+        self.classes = list(classes)
+        self.lowercase = lowercase
+        self._risk_sign = 1.0 if self.classes[1] == risk_label else -1.0 # decision > 0 means classes[1]
+
+    @classmethod
+    def for_model(cls, vectorizer=None, lgs=None, compact=None):
+        """ Scorer for a compact model or a fitted TfidfVectorizer + binary linear model, None when unsupported
+        (e.g. the HashingVectorizer of train.py --stream, which has no vocabulary to look tokens up in) """
+        if compact is not None:
+            return cls(compact.lookup, compact.idf, compact.coef, compact.intercept, compact.classes, compact.lowercase)
+        vocab = getattr(vectorizer, 'vocabulary_', None)
+        if vocab is None or lgs is None or len(getattr(lgs, 'classes_', ())) != 2: return None
+        if getattr(vectorizer, 'norm', 'l2') != 'l2' or getattr(vectorizer, 'sublinear_tf', False) or not getattr(vectorizer, 'use_idf', True): return None
+        return cls(lambda token: vocab.get(token, -1), vectorizer.idf_, lgs.coef_[0],
+                   float(lgs.intercept_[0]), [str(c) for c in lgs.classes_], getattr(vectorizer, 'lowercase', True))
+
+    def tokenize(self, url_clean):
+        """ The tokens the vectorizer would produce for url_clean """
+        return getTokens(url_clean.lower() if self.lowercase else url_clean)
+
+    def score(self, tokens):
+        """ (label, contributions) for one tokenized URL; contributions is [(token, value)] for tokens the
+        model knows, ordered by decreasing value (most malicious-looking first) """
+        counts = {}
+        for token in tokens:
+            idx = self._lookup(token)
+            if idx >= 0:
+                if idx in counts: counts[idx][1] += 1
+                else: counts[idx] = [token, 1]
+        weighted, sq_norm = [], 0.0
+        for idx, (token, count) in counts.items():
+            value = count * float(self._idf[idx])
+            weighted.append((token, value, float(self._coef[idx])))
+            sq_norm += value * value
+        norm = math.sqrt(sq_norm) if sq_norm else 1.0
+        decision, contributions = self._intercept, []
+        for token, value, coef in weighted:
+            share = value / norm * coef
+            decision += share
+            contributions.append((token, self._risk_sign * share))
+        contributions.sort(key=lambda item: -item[1])
+        negative, positive = self.classes
+        return (positive if decision > 0 else negative), contributions
+
+def check_parity(scorer, vectorizer, lgs, urls_clean, tolerance=1e-9):
+    """ Max |scorer - sklearn| decision-function difference over urls_clean; raises if above tolerance.
+    The scorer's decision is rebuilt from its contributions, so this also checks they add up. """
+    expected = lgs.decision_function(vectorizer.transform(urls_clean))
+    actual = np.array([scorer._intercept + scorer._risk_sign * sum(value for _, value in scorer.score(scorer.tokenize(url))[1])
+                       for url in urls_clean])
+    max_diff = float(np.max(np.abs(actual - expected))) if len(urls_clean) else 0.0
+    if max_diff > tolerance:
+        raise ValueError(f"TokenScorer diverges from sklearn: max |diff| = {max_diff:.3e} > {tolerance:.0e}")
+    return max_diff
@@ -1,19 +1,32 @@
+import os
 import pandas as pd
 import numpy as np
-from utils import clean_url, getTokens 
-import random
-import re
-import math
+from utils import clean_url, getTokens, url_host
 from collections import Counter
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
+from itertools import islice
+import time
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.model_selection import train_test_split
 import joblib
+import argparse
+from compact import export_compact, CompactModel, check_parity
+from featurize import parallel_fit_transform
+from bloom import BloomFilter, Blocklist, url_key, host_key
+from prune import prune_model, prune_matrix
+from load_probe import load_profile
+import tempfile
 
+DATA_PATH = './data/data.csv'
+CLASSES = ['bad', 'good'] # label values in data.csv (streaming mode must know them up front)
 
-def TL():
-    """Trains the model and saves it to disk."""
-    allurls = './data/data.csv' 
+
+def TL(n_jobs=1, prune_top_k=None, prune_min_coef=None):
+    """Trains the model and saves it to disk (n_jobs > 1 shards cleaning/tokenizing across processes).
+
+    With prune_top_k / prune_min_coef the vocabulary is pruned after training (see prune.py).
+    """
+    allurls = DATA_PATH
     try:
         allurlscsv = pd.read_csv(allurls, delimiter=',', on_bad_lines='skip')
     except FileNotFoundError:
@@ -23,21 +36,27 @@ def TL():
 
     allurlsdata = pd.DataFrame(allurlscsv)
     allurlsdata = np.array(allurlsdata)
-    random.shuffle(allurlsdata)
+    # random.shuffle on a 2-D array swaps row *views* and duplicates rows; permute the row index instead
+    allurlsdata = allurlsdata[np.random.permutation(len(allurlsdata))]
 
     y = [d[1] for d in allurlsdata]
     corpus_raw = [d[0] for d in allurlsdata]
     
     print(f"Loaded {len(corpus_raw)} URLs from {allurls}")
 
-    # --- THIS IS THE NEW STEP ---
-    # Clean every URL in the corpus before training
-    print("Cleaning and normalizing URLs...")
-    corpus_clean = [clean_url(url) for url in corpus_raw]
-    
-    print("Vectorizing data using TfidfVectorizer...")
-    vectorizer = TfidfVectorizer(tokenizer=getTokens)
-    X = vectorizer.fit_transform(corpus_clean) 
+    if n_jobs != 1:
+        # Same vocabulary, idf and matrix (up to last-bit rounding) as the serial path below, built across a process pool
+        print(f"Cleaning and vectorizing URLs in parallel ({n_jobs or 'all'} workers)...")
+        vectorizer, X = parallel_fit_transform(corpus_raw, n_jobs=n_jobs or None)
+    else:
+        # --- THIS IS THE NEW STEP ---
+        # Clean every URL in the corpus before training
+        print("Cleaning and normalizing URLs...")
+        corpus_clean = [clean_url(url) for url in corpus_raw]
+
+        print("Vectorizing data using TfidfVectorizer...")
+        vectorizer = TfidfVectorizer(tokenizer=getTokens)
+        X = vectorizer.fit_transform(corpus_clean)
 
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
@@ -47,12 +66,161 @@ def TL():
     
     accuracy = lgs.score(X_test, y_test)
     print(f"MODEL ACCURACY: {accuracy*100:.2f}%")
+
+    if prune_top_k is not None or prune_min_coef is not None:
+        vectorizer, lgs = prune_and_report(vectorizer, lgs, X_train, X_test, y_train, y_test, prune_top_k, prune_min_coef)
     
     return vectorizer, lgs
 
+def prune_and_report(vectorizer, lgs, X_train, X_test, y_train, y_test, top_k=None, min_abs_coef=None):
+    """Prunes the vocabulary, refits on the pruned features and prints size / load / RSS / accuracy before and after."""
+    print(f"Pruning vocabulary (top_k={top_k}, min |coef|={min_abs_coef})...")
+    pruned_vectorizer, pruned_lgs, columns = prune_model(vectorizer, lgs, top_k, min_abs_coef, X_train, y_train)
+    rows = [('full', vectorizer, lgs, lgs.score(X_test, y_test)),
+            ('pruned', pruned_vectorizer, pruned_lgs, pruned_lgs.score(prune_matrix(X_test, columns, vectorizer.norm), y_test))]
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, vec, model, accuracy in rows:
+            paths = [os.path.join(tmp, f'{label}_vectorizer.pkl'), os.path.join(tmp, f'{label}_model.pkl')]
+            joblib.dump(vec, paths[0])
+            joblib.dump(model, paths[1])
+            size_mb = sum(os.path.getsize(path) for path in paths) / 2**20
+            profile = load_profile('pickle', paths)
+            unpickle_ms = (profile['load_s'] - profile['import_s']) * 1000
+            model_rss_mb = profile['rss_mb'] - profile['import_rss_mb']
+            print(f"{label:>8}: {len(vec.vocabulary_):>9,} features | pickles {size_mb:8.2f} MB | unpickle {unpickle_ms:7.1f} ms | "
+                  f"RSS +{model_rss_mb:6.1f} MB over sklearn | held-out accuracy {accuracy * 100:.2f}%")
+    print(f"Accuracy change: {(rows[1][3] - rows[0][3]) * 100:+.2f} points")
+    return pruned_vectorizer, pruned_lgs
+
+def TL_stream(chunksize=100000, n_features=2**22, test_fraction=0.2, seed=42):
+    """Trains incrementally over the CSV in chunks; memory is bounded by chunksize, not corpus size.
+
+    HashingVectorizer keeps no vocabulary and SGDClassifier(loss='log_loss') is fitted with partial_fit.
+    A test_fraction of every chunk is held out and scored with the model trained on the previous chunks
+    (progressive validation), so no held-out rows need to be kept in memory.
+    """
+    vectorizer = HashingVectorizer(tokenizer=getTokens, n_features=n_features, alternate_sign=False, norm='l2')
+    lgs = SGDClassifier(loss='log_loss', random_state=seed)
+    rng = np.random.default_rng(seed)
+    classes = np.array(CLASSES)
+
+    try:
+        chunks = pd.read_csv(DATA_PATH, delimiter=',', on_bad_lines='skip', chunksize=chunksize, usecols=[0, 1])
+    except FileNotFoundError:
+        print(f"Error: Could not find the data file at {DATA_PATH}")
+        return None, None
+
+    rows_seen, test_rows, test_correct, fitted = 0, 0, 0, False
+    started = time.perf_counter()
+    for chunk_no, chunk in enumerate(chunks, 1):
+        chunk = chunk.dropna()
+        chunk = chunk[chunk.iloc[:, 1].isin(CLASSES)]
+        if chunk.empty: continue
+        # Shuffle within the chunk; the file itself is never shuffled in memory
+        order = rng.permutation(len(chunk))
+        corpus_clean = [clean_url(url) for url in chunk.iloc[order, 0]]
+        y = chunk.iloc[order, 1].to_numpy()
+        X = vectorizer.transform(corpus_clean)
+
+        is_test = rng.random(len(y)) < test_fraction
+        if fitted and is_test.any():
+            test_correct += int((lgs.predict(X[is_test]) == y[is_test]).sum())
+            test_rows += int(is_test.sum())
+        if (~is_test).any():
+            lgs.partial_fit(X[~is_test], y[~is_test], classes=classes)
+            fitted = True
+
+        rows_seen += len(y)
+        elapsed = time.perf_counter() - started
+        print(f"Chunk {chunk_no}: {rows_seen} rows, {rows_seen / elapsed:,.0f} rows/sec")
+
+    if not fitted:
+        print("Error: no labeled rows found for streaming training.")
+        return None, None
+    elapsed = time.perf_counter() - started
+    print(f"Streamed {rows_seen} rows in {elapsed:.1f}s ({rows_seen / elapsed:,.0f} rows/sec)")
+    if test_rows: print(f"PROGRESSIVE HOLD-OUT ACCURACY: {test_correct / test_rows * 100:.2f}% ({test_rows} rows)")
+    return vectorizer, lgs
+
+def export_compact_model(vectorizer, lgs, out_dir, check_rows=5000):
+    """Writes the compact (pickle-free) model and verifies it scores like sklearn."""
+    meta = export_compact(vectorizer, lgs, out_dir)
+    print(f"Compact model written to {out_dir} ({meta['n_features']} features)")
+    sample = pd.read_csv(DATA_PATH, delimiter=',', on_bad_lines='skip', nrows=check_rows)
+    sample_clean = [clean_url(url) for url in sample.iloc[:, 0]]
+    max_diff = check_parity(CompactModel(out_dir), vectorizer, lgs, sample_clean)
+    print(f"Compact model parity check on {len(sample_clean)} URLs: max |diff| = {max_diff:.2e}")
+
+def _labeled_chunks(chunksize):
+    """Cleaned URL / label arrays per CSV chunk, keeping only rows with a known label."""
+    for chunk in pd.read_csv(DATA_PATH, delimiter=',', on_bad_lines='skip', chunksize=chunksize, usecols=[0, 1]):
+        chunk = chunk.dropna()
+        chunk = chunk[chunk.iloc[:, 1].isin(CLASSES)]
+        yield [clean_url(url) for url in chunk.iloc[:, 0]], chunk.iloc[:, 1].to_numpy()
+
+def export_blocklist(out_dir, fp_rate=0.001, chunksize=100000, min_host_urls=2):
+    """Writes a Bloom filter of the corpus' bad URLs and all-bad hosts (two chunked passes over the CSV).
+
+    A host is listed only when it has at least min_host_urls bad URLs and no good ones, so one bad
+    page on a shared host does not block the whole host.
+    """
+    # Pass 1: count the bad URLs and find the hosts that never carry a good label
+    n_bad, n_rows, csv_bytes = 0, 0, os.path.getsize(DATA_PATH)
+    bad_hosts, good_hosts = Counter(), set()
+    for corpus_clean, y in _labeled_chunks(chunksize):
+        for url_clean, label in zip(corpus_clean, y):
+            host = url_host(url_clean)
+            if label == 'bad':
+                n_bad += 1
+                if host: bad_hosts[host] += 1
+            elif host: good_hosts.add(host)
+        n_rows += len(y)
+    blocked_hosts = [h for h, n in bad_hosts.items() if n >= min_host_urls and h not in good_hosts]
+
+    # Pass 2: add the bad URLs (duplicates only cost a re-set of the same bits)
+    # Every lookup probes two keys (URL, then host), so each probe gets half the false-positive budget
+    bloom = BloomFilter.create(n_bad + len(blocked_hosts), fp_rate / 2)
+    for corpus_clean, y in _labeled_chunks(chunksize):
+        bloom.add_many(url_key(url_clean) for url_clean, label in zip(corpus_clean, y) if label == 'bad')
+    bloom.add_many(host_key(h) for h in blocked_hosts)
+    bloom.meta['urls'], bloom.meta['hosts'] = n_bad, len(blocked_hosts)
+    bloom.save(out_dir)
+
+    print(f"Blocklist written to {out_dir}: {n_bad} bad URLs + {len(blocked_hosts)} hosts of {n_rows} rows, "
+          f"{bloom.size_bytes() / 1024:,.1f} KiB ({bloom.size_bytes() / csv_bytes:.1%} of the {csv_bytes / 1024:,.0f} KiB CSV), "
+          f"{bloom.n_hashes} hashes, target false-positive rate {fp_rate}")
+    blocklist = Blocklist(out_dir)
+    sample = list(islice((url for corpus_clean, y in _labeled_chunks(chunksize) for url, label in zip(corpus_clean, y) if label == 'bad'), 5000))
+    missed = sum(1 for url in sample if blocklist.match(url) is None)
+    if missed: raise ValueError(f"Blocklist is missing {missed} of {len(sample)} bad URLs.")
+    start = time.perf_counter()
+    for url in sample: blocklist.match(url)
+    if sample: print(f"Blocklist lookup: {(time.perf_counter() - start) / len(sample) * 1e6:.1f} us per URL")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the SafeLink AI model.")
+    parser.add_argument('--compact-dir', default=None,
+                        help="also export a pickle-free compact model to this directory")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="worker processes for cleaning/tokenizing (0 = all cores, 1 = serial)")
+    parser.add_argument('--stream', action='store_true',
+                        help="out-of-core training: chunked CSV + HashingVectorizer + SGDClassifier.partial_fit")
+    parser.add_argument('--chunksize', type=int, default=100000, help="rows per chunk in --stream mode")
+    parser.add_argument('--n-features', type=int, default=2**22, help="hashing space size in --stream mode")
+    parser.add_argument('--prune-top-k', type=int, default=None, help="keep only the K features with the largest |coef|")
+    parser.add_argument('--prune-min-coef', type=float, default=None, help="drop features with |coef| below this threshold")
+    parser.add_argument('--blocklist-dir', default=None,
+                        help="also write a Bloom filter of the corpus' bad URLs and hosts to this directory")
+    parser.add_argument('--blocklist-fp-rate', type=float, default=0.001, help="target false-positive rate of the blocklist")
+    args = parser.parse_args()
+    if args.stream and args.compact_dir:
+        parser.error("--compact-dir needs a TF-IDF vocabulary and is not available with --stream")
+    if args.stream and (args.prune_top_k is not None or args.prune_min_coef is not None):
+        parser.error("pruning needs a TF-IDF vocabulary and is not available with --stream")
+
     print("Starting model training...")
-    vectorizer, lgs = TL()
+    if args.stream: vectorizer, lgs = TL_stream(chunksize=args.chunksize, n_features=args.n_features)
+    else: vectorizer, lgs = TL(n_jobs=args.jobs, prune_top_k=args.prune_top_k, prune_min_coef=args.prune_min_coef)
     
     if vectorizer and lgs:
         # Save the vectorizer and model
@@ -60,5 +228,8 @@ if __name__ == "__main__":
         print("Vectorizer saved to vectorizer.pkl")
         joblib.dump(lgs, 'model.pkl')
         print("Model saved to model.pkl")
+        if args.compact_dir:
+            export_compact_model(vectorizer, lgs, args.compact_dir)
+        if args.blocklist_dir:
+            export_blocklist(args.blocklist_dir, args.blocklist_fp_rate, args.chunksize)
         print("\nTraining complete.")
-
@@ -3,11 +3,11 @@ import math
 from collections import Counter
 
 # --- Define High-Risk Tokens Globally ---
-HIGH_RISK_TOKENS = [
+HIGH_RISK_TOKENS = frozenset([
     'exe', 'php', 'install', 'toolbar', 'crack', 'spider', 'lucky',
     'admin', 'login', 'secure', 'account', 'password', 'key', 'download',
     'free', 'gift', 'prize', 'winner', 'click'
-]
+])
 
 def clean_url(url):
     """ Cleans URL: removes protocol, www., trailing slash """
@@ -21,22 +21,31 @@ def clean_url(url):
         print(f"Error cleaning URL {url}: {e}")
         return ""
 
+def url_host(url_clean):
+    """ Lowercased host of a cleaned URL, '' when there is none (userinfo and port stripped) """
+    # Browsers treat '\' like '/', so 'evil.com\@google.com' is hosted on evil.com
+    authority = re.split(r'[/?#\\]', url_clean, 1)[0]
+    host = authority.rpartition('@')[2] # 'google.com@evil.com' is hosted on evil.com
+    if host.startswith('['): return '' # IPv6 literal
+    return host.split(':', 1)[0].rstrip('.').lower()
+
+# Tokens dropped by getTokens (compared after lowercasing)
+COMMON_TOKENS = frozenset(['com', 'www', 'http', 'https', 'org', 'net', 'io', 'co', 'uk', 'html', 'htm'])
+
 def getTokens(input):
-    """ Custom tokenizer: splits by '/', '-', '.' """
+    """ Custom tokenizer: splits by '/', '-', '.' in a single pass over the segments """
     try:
-        tokensBySlash = str(input).split('/')
-        allTokens = []
-        for i in tokensBySlash:
-            tokens = str(i).split('-')
-            tokensByDot = []
-            for j in range(0, len(tokens)):
-                tempTokens = str(tokens[j]).split('.')
-                tokensByDot = tokensByDot + tempTokens
-            allTokens = allTokens + tokens + tokensByDot
-        allTokens = list(set(allTokens))
+        # Collect the distinct raw tokens: every '-' piece of every '/' segment, plus its '.' pieces
+        rawTokens = set()
+        for segment in str(input).split('/'):
+            for token in segment.split('-'):
+                rawTokens.add(token)
+                if '.' in token: rawTokens.update(token.split('.'))
         # Remove common/unhelpful tokens, ensure lowercase, ignore short tokens
-        common_tokens = ['com', 'www', 'http', 'https', 'org', 'net', 'io', 'co', 'uk', 'html', 'htm']
-        allTokens = [t.lower() for t in allTokens if t.lower() not in common_tokens and len(t) > 1]
+        allTokens = []
+        for t in rawTokens:
+            lowered = t.lower()
+            if len(t) > 1 and lowered not in COMMON_TOKENS: allTokens.append(lowered)
         return allTokens
     except Exception as e:
         print(f"Error tokenizing input {input}: {e}")